@@ -0,0 +1,10 @@
+"""Benchmarks for the exporter, run as `python -m benchmarks.<name>`."""
+
+import json
+
+
+def write_results(path, results):
+    """Write the results of a benchmark to a JSON file."""
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(results, output, indent=2)
+        output.write("\n")
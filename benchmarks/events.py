@@ -0,0 +1,144 @@
+import random
+import uuid as uuidlib
+from typing import Iterator
+
+BASE_TIME = 1_600_000_000.0
+
+
+def _task_event(event_type, uuid, hostname, timestamp, clock, **fields):
+    event = {
+        "type": event_type,
+        "uuid": uuid,
+        "hostname": hostname,
+        "timestamp": timestamp,
+        "local_received": timestamp,
+        "clock": clock,
+        "utcoffset": 0,
+        "pid": 1,
+    }
+    event.update(fields)
+    return event
+
+
+def _worker_event(event_type, hostname, timestamp, clock, **fields):
+    event = {
+        "type": event_type,
+        "hostname": hostname,
+        "timestamp": timestamp,
+        "local_received": timestamp,
+        "clock": clock,
+        "utcoffset": 0,
+        "pid": 1,
+        "freq": 2.0,
+        "sw_ident": "py-celery",
+        "sw_ver": "5.6.0",
+        "sw_sys": "Linux",
+    }
+    event.update(fields)
+    return event
+
+
+def synthetic_events(  # pylint: disable=too-many-arguments,too-many-locals
+    tasks=10_000,
+    *,
+    task_names=50,
+    queues=4,
+    workers=20,
+    clients=5,
+    failure_ratio=0.05,
+    heartbeat_every=50,
+    worker_status=False,
+    seed=0,
+) -> Iterator[dict]:
+    """Yield the events a cluster emits for `tasks` task lifecycles.
+
+    The events look like what celery's Receiver hands to the handlers: every
+    task is sent by a client, then received, started and either succeeded or
+    failed on a worker, and each worker heartbeats every `heartbeat_every`
+    tasks. With `worker_status`, the workers also come online before the
+    first task and go offline after the last one.
+    """
+    rng = random.Random(seed)
+    names = [f"app.tasks.task_{i}" for i in range(task_names)]
+    queue_names = [f"queue_{i}" for i in range(queues)]
+    worker_names = [f"celery@worker-{i}" for i in range(workers)]
+    client_names = [f"gen{i}@web-{i}" for i in range(clients)]
+    now = BASE_TIME
+    clock = 0
+
+    if worker_status:
+        for hostname in worker_names:
+            yield _worker_event("worker-online", hostname, now, clock)
+
+    for i in range(tasks):
+        uuid = str(uuidlib.UUID(int=rng.getrandbits(128)))
+        name = rng.choice(names)
+        queue = rng.choice(queue_names)
+        worker = rng.choice(worker_names)
+        task_fields = {
+            "name": name,
+            "args": "(1, 2)",
+            "kwargs": "{}",
+            "retries": 0,
+            "eta": None,
+            "expires": None,
+            "root_id": uuid,
+            "parent_id": None,
+        }
+        now += 0.001
+        clock += 1
+        yield _task_event(
+            "task-sent",
+            uuid,
+            rng.choice(client_names),
+            now,
+            clock,
+            queue=queue,
+            exchange="",
+            routing_key=queue,
+            **task_fields,
+        )
+        clock += 1
+        yield _task_event(
+            "task-received", uuid, worker, now + 0.01, clock, **task_fields
+        )
+        clock += 1
+        yield _task_event("task-started", uuid, worker, now + 0.02, clock)
+        clock += 1
+        runtime = rng.expovariate(10)
+        if rng.random() < failure_ratio:
+            yield _task_event(
+                "task-failed",
+                uuid,
+                worker,
+                now + 0.02 + runtime,
+                clock,
+                exception="ValueError('synthetic failure')",
+                traceback="Traceback (most recent call last): ...",
+            )
+        else:
+            yield _task_event(
+                "task-succeeded",
+                uuid,
+                worker,
+                now + 0.02 + runtime,
+                clock,
+                result="3",
+                runtime=runtime,
+            )
+
+        if i % heartbeat_every == 0:
+            for hostname in worker_names:
+                yield _worker_event(
+                    "worker-heartbeat",
+                    hostname,
+                    now,
+                    clock,
+                    active=rng.randint(0, 4),
+                    processed=i,
+                    loadavg=[0.5, 0.5, 0.5],
+                )
+
+    if worker_status:
+        for hostname in worker_names:
+            yield _worker_event("worker-offline", hostname, now + 1, clock)
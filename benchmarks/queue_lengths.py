@@ -0,0 +1,167 @@
+"""Time collecting the redis queue lengths, one LLEN per queue against one
+pipeline for all the queues and their priority steps.
+
+The queues live in fakeredis' TCP server, or in the redis server given with
+--redis-url. Round trips to a local server are much faster than to a broker
+in another availability zone, which --rtt simulates by forwarding the
+connection through a proxy that delays every packet by half the given
+milliseconds each way.
+
+The pipeline asks for every priority step of every queue, four times the
+commands of one LLEN per queue. fakeredis takes about a tenth of a
+millisecond per command, where a redis server takes microseconds.
+
+python -m benchmarks.queue_lengths --queues 10 100 300 --rtt 1
+python -m benchmarks.queue_lengths --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import queue
+import socket
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit, urlunsplit
+
+import fakeredis
+import redis
+from kombu import Connection
+
+from src.exporter import redis_queue_lengths
+
+
+def forward(source, destination, delay):
+    """Send what arrives from source to destination delay seconds later.
+    Packets are delayed independently of each other, like on a link with
+    latency, rather than one after the other."""
+    packets: queue.Queue = queue.Queue()
+
+    def send():
+        while (packet := packets.get()) is not None:
+            arrived, data = packet
+            time.sleep(max(0.0, arrived + delay - time.perf_counter()))
+            try:
+                destination.sendall(data)
+            except OSError:
+                return
+        destination.close()
+
+    threading.Thread(target=send, daemon=True).start()
+    try:
+        while data := source.recv(65536):
+            packets.put((time.perf_counter(), data))
+    except OSError:
+        pass
+    finally:
+        packets.put(None)
+
+
+@contextmanager
+def delaying_proxy(host, port, rtt):
+    """A TCP proxy to host:port adding rtt seconds to every round trip."""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def accept():
+        while True:
+            try:
+                client, _ = listener.accept()
+            except OSError:
+                return
+            server = socket.create_connection((host, port))
+            for sock in (client, server):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for source, destination in ((client, server), (server, client)):
+                threading.Thread(
+                    target=forward, args=(source, destination, rtt / 2), daemon=True
+                ).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    try:
+        yield listener.getsockname()[1]
+    finally:
+        listener.close()
+
+
+@contextmanager
+def fake_redis_server():
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+    # fakeredis writes every reply of a pipeline on its own, which Nagle's
+    # algorithm holds back until the client's delayed ack unless disabled
+    server.RequestHandlerClass.disable_nagle_algorithm = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    try:
+        yield f"redis://{host}:{port}/0"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@contextmanager
+def with_rtt(redis_url, rtt):
+    """The url of the redis server, through a delaying proxy if rtt > 0."""
+    if rtt <= 0:
+        yield redis_url
+        return
+    url = urlsplit(redis_url)
+    with delaying_proxy(url.hostname, url.port or 6379, rtt) as port:
+        yield urlunsplit(url._replace(netloc=f"127.0.0.1:{port}"))
+
+
+def sequential_lengths(connection, queues):
+    """One LLEN per queue, ignoring the priority steps."""
+    client = connection.default_channel.client
+    return {queue: client.llen(queue) for queue in queues}
+
+
+def measure(function, connection, queues, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(connection, queues)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def run(redis_url, queue_counts, rtt, repeat):
+    client = redis.Redis.from_url(redis_url)
+    client.flushdb()
+    queues = [f"queue-{i}" for i in range(max(queue_counts))]
+    for queue in queues:
+        client.rpush(queue, 1)
+        client.rpush(f"{queue}\x06\x163", 1)
+
+    print(f"{'queues':>8} {'LLEN per queue ms':>18} {'pipelined ms':>13}")
+    with with_rtt(redis_url, rtt) as url, Connection(url) as connection:
+        # connect before timing
+        connection.default_channel.client.ping()
+        for count in queue_counts:
+            sequential = measure(sequential_lengths, connection, queues[:count], repeat)
+            pipelined = measure(redis_queue_lengths, connection, queues[:count], repeat)
+            print(f"{count:8,} {sequential * 1000:18.2f} {pipelined * 1000:13.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--queues", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument(
+        "--rtt", type=float, default=0.0, help="Milliseconds added to every round trip"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--redis-url", help="A redis server to use rather than fakeredis, flushed first"
+    )
+    args = parser.parse_args()
+
+    if args.redis_url:
+        run(args.redis_url, args.queues, args.rtt / 1000, args.repeat)
+    else:
+        with fake_redis_server() as redis_url:
+            run(redis_url, args.queues, args.rtt / 1000, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
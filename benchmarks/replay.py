@@ -0,0 +1,73 @@
+"""Replay a capture recorded with --record-events through the exporter,
+without a broker, and report its throughput and memory.
+
+python -m benchmarks.replay events.jsonl.gz
+python -m benchmarks.replay events.jsonl.gz --speed 1
+python -m benchmarks.replay --synthetic 50000 --save synthetic.jsonl.gz
+"""
+
+import argparse
+import resource
+import time
+
+from loguru import logger
+
+from src.exporter import Exporter
+from src.recording import read_events, record_events, replay
+
+from .events import synthetic_events
+
+
+def series_count(registry):
+    return sum(len(metric.samples) for metric in registry.collect())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("capture", nargs="?")
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=0.0,
+        help="Replay at this multiple of the recorded pace, 0 for as fast as possible",
+    )
+    parser.add_argument(
+        "--synthetic", type=int, help="Replay this many synthetic tasks"
+    )
+    parser.add_argument("--save", help="Record the synthetic events to this capture")
+    parser.add_argument("--event-buffer-size", type=int, default=0)
+    parser.add_argument("--event-batch-size", type=int, default=500)
+    parser.add_argument("--batch-events", action="store_true")
+    parser.add_argument("--max-tasks-in-memory", type=int, default=10_000)
+    args = parser.parse_args()
+    if not args.capture and not args.synthetic:
+        parser.error("either a capture or --synthetic is required")
+
+    # the handlers log at debug level, which production doesn't enable
+    logger.remove()
+    if args.synthetic:
+        events = list(synthetic_events(args.synthetic))
+        if args.save:
+            record_events(args.save, events)
+    else:
+        events = list(read_events(args.capture))
+
+    exporter = Exporter(
+        event_buffer_size=args.event_buffer_size,
+        event_batch_size=args.event_batch_size,
+        batch_events=args.batch_events,
+        max_tasks_in_memory=args.max_tasks_in_memory,
+    )
+    started = time.perf_counter()
+    count = replay(exporter, events, speed=args.speed)
+    elapsed = time.perf_counter() - started
+
+    print(f"{count:,} events in {elapsed:.2f}s, {count / elapsed:,.0f} events/s")
+    print(f"{series_count(exporter.registry):,} samples exposed")
+    print(
+        f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB"
+    )
+
+
+if __name__ == "__main__":
+    main()
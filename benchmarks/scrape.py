@@ -0,0 +1,221 @@
+"""Scrape latency and response size of /metrics at high series counts, and how
+much scraping slows down the ingestion of events.
+
+The exporter's registry is filled with task series until it exposes about the
+given number of samples, and is then scraped through the Flask metrics()
+route in the text, OpenMetrics and gzip variants. The metrics puller is a
+no-op, so only the encoding is measured. If the route doesn't compress the
+gzip variant itself, the benchmark compresses the text response and adds the
+time it took, which is what a compressing proxy in front of it would cost.
+
+python -m benchmarks.scrape --series 10000 100000 1000000
+python -m benchmarks.scrape --series 200000 --output scrape.json
+"""
+
+import argparse
+import gzip
+import itertools
+import multiprocessing
+import statistics
+import time
+from threading import Event, Thread
+
+from loguru import logger
+from prometheus_client.openmetrics.exposition import (
+    CONTENT_TYPE_LATEST as OPENMETRICS_CONTENT_TYPE,
+)
+
+from src.exporter import Exporter
+from src.http_server import create_app
+
+from . import write_results
+from .events import synthetic_events
+from .suite import git_commit, peak_rss_bytes
+
+VARIANTS = {
+    "text": {},
+    "openmetrics": {"Accept": OPENMETRICS_CONTENT_TYPE},
+    "gzip": {"Accept-Encoding": "gzip"},
+}
+
+
+def sample_count(registry):
+    return sum(len(metric.samples) for metric in registry.collect())
+
+
+def label_sets():
+    """Unique (name, hostname, queue_name) label sets, 500 task names per worker."""
+    for i in itertools.count():
+        yield f"app.tasks.task_{i % 500}", f"worker-{i // 500}", "celery"
+
+
+def fill_series(exporter, label_set):
+    series = exporter.task_series(*label_set)
+    series.counter("task-succeeded").inc()
+    series.runtime().observe(0.1)
+    series.queue_wait_time().observe(0.01)
+
+
+def fill_registry(exporter, samples):
+    """Create task series until the registry exposes about `samples` samples."""
+    base = sample_count(exporter.registry)
+    label_set = label_sets()
+    fill_series(exporter, next(label_set))
+    per_series = sample_count(exporter.registry) - base
+    for _ in range(max(0, (samples - base) // per_series - 1)):
+        fill_series(exporter, next(label_set))
+    return sample_count(exporter.registry)
+
+
+def scrape(client, variant):
+    """Scrape once, returning the seconds it took and the response body."""
+    started = time.perf_counter()
+    response = client.get("/metrics", headers=VARIANTS[variant])
+    body = response.get_data()
+    if variant == "gzip" and response.headers.get("Content-Encoding") != "gzip":
+        body = gzip.compress(body)
+    return time.perf_counter() - started, body
+
+
+def measure_scrapes(client, scrapes):
+    results = {}
+    for variant in VARIANTS:
+        timings = []
+        for _ in range(scrapes):
+            elapsed, body = scrape(client, variant)
+            timings.append(elapsed)
+        results[variant] = {
+            "median_seconds": statistics.median(timings),
+            "max_seconds": max(timings),
+            "response_bytes": len(body),
+        }
+    return results
+
+
+class Ingest(Thread):
+    """Applies events to the exporter in a loop, like the apply thread of
+    Exporter.run() does, counting them."""
+
+    def __init__(self, exporter, events):
+        super().__init__(daemon=True)
+        self.exporter = exporter
+        self.events = events
+        self.count = 0
+        self.stopped = Event()
+
+    def run(self):
+        handlers = self.exporter.handlers
+        for event in itertools.cycle(self.events):
+            if self.stopped.is_set():
+                return
+            handlers[event["type"]](dict(event))
+            self.count += 1
+
+
+def measure_ingest(exporter, client, seconds):
+    """Events/s of an ingest thread on its own and while the main thread
+    scrapes /metrics back to back, and the scrape latency meanwhile."""
+    events = [
+        event
+        for event in synthetic_events(5_000, worker_status=True)
+        if event["type"] != "worker-offline"
+    ]
+    ingest = Ingest(exporter, events)
+    ingest.start()
+    time.sleep(0.5)
+
+    count, started = ingest.count, time.perf_counter()
+    time.sleep(seconds)
+    idle_rate = (ingest.count - count) / (time.perf_counter() - started)
+
+    count, started = ingest.count, time.perf_counter()
+    timings = []
+    while time.perf_counter() - started < seconds:
+        timings.append(scrape(client, "text")[0])
+    scraping_rate = (ingest.count - count) / (time.perf_counter() - started)
+
+    ingest.stopped.set()
+    ingest.join()
+    return {
+        "events_per_second": idle_rate,
+        "events_per_second_while_scraping": scraping_rate,
+        "slowdown": 1 - scraping_rate / idle_rate,
+        "scrapes": len(timings),
+        "scrape_median_seconds": statistics.median(timings),
+    }
+
+
+def run_size(samples, scrapes, ingest_seconds):
+    # the handlers log at debug level, which production doesn't enable
+    logger.remove()
+    exporter = Exporter()
+    started = time.perf_counter()
+    exposed = fill_registry(exporter, samples)
+    result = {
+        "samples": exposed,
+        "fill_seconds": time.perf_counter() - started,
+    }
+    app = create_app(exporter.registry, None, lambda: None)
+    client = app.test_client()
+    result["variants"] = measure_scrapes(client, scrapes)
+    if ingest_seconds > 0:
+        result["ingest"] = measure_ingest(exporter, client, ingest_seconds)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    return result
+
+
+def print_result(result):
+    print(
+        f"{result['samples']:,} samples, filled in {result['fill_seconds']:.1f}s, "
+        f"peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB"
+    )
+    for variant, timings in result["variants"].items():
+        print(
+            f"  {variant:12} median {timings['median_seconds'] * 1000:9.1f} ms  "
+            f"max {timings['max_seconds'] * 1000:9.1f} ms  "
+            f"{timings['response_bytes'] / 2**20:9.2f} MiB"
+        )
+    ingest = result.get("ingest")
+    if ingest:
+        print(
+            f"  ingest {ingest['events_per_second']:,.0f} events/s, "
+            f"{ingest['events_per_second_while_scraping']:,.0f} events/s while "
+            f"scraping ({ingest['slowdown']:.0%} slower), {ingest['scrapes']} scrapes "
+            f"with a median of {ingest['scrape_median_seconds'] * 1000:.1f} ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--series", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument(
+        "--scrapes", type=int, default=5, help="Scrapes per variant and size"
+    )
+    parser.add_argument(
+        "--ingest-seconds",
+        type=float,
+        default=3.0,
+        help="How long to measure the ingest thread for, 0 to skip it",
+    )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    results = {"commit": git_commit(), "sizes": {}}
+    # a fresh process per size, so that the peak RSS is that of the size
+    context = multiprocessing.get_context("spawn")
+    for samples in args.series:
+        with context.Pool(1) as pool:
+            result = pool.apply(run_size, (samples, args.scrapes, args.ingest_seconds))
+        results["sizes"][str(samples)] = result
+        print_result(result)
+
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Synthetic-load benchmark suite for the event handlers.
+
+Every scenario generates a synthetic event mix - task lifecycles, heartbeats
+and worker status changes - and drives track_task_event,
+track_worker_heartbeat and track_worker_status directly with it. It reports
+events/s, the handler latency percentiles, peak RSS and the allocations per
+event, each scenario in a fresh process so that they don't share a peak RSS
+or warmed up caches. The results can be written as JSON and compared with
+the results of another commit:
+
+python -m benchmarks.suite --output before.json
+python -m benchmarks.suite --output after.json --compare before.json
+python -m benchmarks.suite --scenario high-cardinality --tasks 100000
+"""
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+from loguru import logger
+
+from src.exporter import Exporter
+
+from . import write_results
+from .events import synthetic_events
+
+SCENARIOS = {
+    "default": {},
+    "high-cardinality": {
+        "task_names": 2000,
+        "queues": 50,
+        "workers": 500,
+        "clients": 100,
+    },
+    "failures": {"failure_ratio": 0.5},
+    "heartbeats": {"workers": 250, "heartbeat_every": 25},
+}
+
+DEFAULT_PARAMS = {
+    "task_names": 50,
+    "queues": 4,
+    "workers": 20,
+    "clients": 5,
+    "failure_ratio": 0.05,
+    "heartbeat_every": 50,
+}
+
+# The results compared by --compare, and whether an increase is an improvement
+COMPARED = {
+    "events_per_second": True,
+    "latency_p50_seconds": False,
+    "latency_p99_seconds": False,
+    "peak_rss_bytes": False,
+    "retained_blocks_per_event": False,
+    "retained_bytes_per_event": False,
+    "traced_peak_bytes": False,
+}
+
+
+def percentile(ordered, q):
+    """The q-th percentile of sorted values, by the nearest rank."""
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_bytes():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def dispatch(exporter, events):
+    handlers = exporter.handlers
+    for event in events:
+        handlers[event["type"]](event)
+
+
+def measure_throughput(events, repeat):
+    """The best events/s of `repeat` runs, each with a fresh exporter."""
+    rss_before = peak_rss_bytes()
+    best = 0.0
+    for _ in range(repeat):
+        exporter = Exporter()
+        batch = [dict(event) for event in events]
+        started = time.perf_counter()
+        dispatch(exporter, batch)
+        best = max(best, len(batch) / (time.perf_counter() - started))
+        del exporter, batch
+    rss_after = peak_rss_bytes()
+    return {
+        "events_per_second": best,
+        "peak_rss_bytes": rss_after,
+        "rss_growth_bytes": rss_after - rss_before,
+    }
+
+
+def measure_latency(events):
+    exporter = Exporter()
+    handlers = exporter.handlers
+    clock = time.perf_counter_ns
+    latencies = defaultdict(list)
+    for event in events:
+        handler = handlers[event["type"]]
+        started = clock()
+        handler(event)
+        latencies[event["type"]].append(clock() - started)
+
+    every = sorted(latency for values in latencies.values() for latency in values)
+    by_type = {}
+    for event_type, values in sorted(latencies.items()):
+        values.sort()
+        by_type[event_type] = percentile(values, 99) / 1e9
+    return {
+        "latency_p50_seconds": percentile(every, 50) / 1e9,
+        "latency_p99_seconds": percentile(every, 99) / 1e9,
+        "latency_max_seconds": every[-1] / 1e9,
+        "latency_p99_seconds_by_type": by_type,
+    }
+
+
+def measure_allocations(events):
+    """The memory blocks and bytes allocated while handling the events that
+    are still allocated afterwards, per event, and the peak of the memory
+    allocated in between.
+
+    CPython doesn't count allocations as such, so this is what the handlers
+    retain - the series, the tracked tasks and the worker state - as traced
+    by tracemalloc.
+    """
+    exporter = Exporter()
+    tracemalloc.start()
+    dispatch(exporter, events)
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    statistics = snapshot.statistics("filename")
+    return {
+        "retained_blocks_per_event": sum(stat.count for stat in statistics)
+        / len(events),
+        "retained_bytes_per_event": sum(stat.size for stat in statistics) / len(events),
+        "traced_peak_bytes": peak,
+    }
+
+
+def run_scenario(params, tasks, seed, repeat):
+    # the handlers log at debug level, which production doesn't enable
+    logger.remove()
+    events = list(synthetic_events(tasks, worker_status=True, seed=seed, **params))
+    result = {"params": dict(params, tasks=tasks, seed=seed), "events": len(events)}
+    # every pass gets its own copy, the handlers may hold on to the events
+    result.update(measure_throughput(events, repeat))
+    result.update(measure_latency([dict(event) for event in events]))
+    result.update(measure_allocations([dict(event) for event in events]))
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(
+        f"{'scenario':18} {'events':>9} {'events/s':>10} {'p50 µs':>8} "
+        f"{'p99 µs':>8} {'peak RSS MiB':>13} {'blocks/event':>13} {'bytes/event':>12}"
+    )
+    for name, result in results["scenarios"].items():
+        print(
+            f"{name:18} {result['events']:9,} {result['events_per_second']:10,.0f} "
+            f"{result['latency_p50_seconds'] * 1e6:8.1f} "
+            f"{result['latency_p99_seconds'] * 1e6:8.1f} "
+            f"{result['peak_rss_bytes'] / 2**20:13.0f} "
+            f"{result['retained_blocks_per_event']:13.2f} "
+            f"{result['retained_bytes_per_event']:12.1f}"
+        )
+
+
+def print_comparison(results, baseline):
+    print(f"\ncompared to {baseline.get('commit') or 'the baseline'}:")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        if before["params"] != result["params"]:
+            print(f"{name:18} skipped, the scenario parameters differ")
+            continue
+        for key, higher_is_better in COMPARED.items():
+            if not before.get(key):
+                continue
+            change = (result[key] - before[key]) / before[key] * 100
+            verdict = ""
+            if change:
+                verdict = "better" if (change > 0) == higher_is_better else "worse"
+            print(
+                f"{name:18} {key:26} {before[key]:12.6g} -> {result[key]:12.6g} "
+                f"{change:+7.1f}% {verdict}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="Run only this scenario, can be repeated",
+    )
+    parser.add_argument("--tasks", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Report the best events/s of this many runs",
+    )
+    for name, default in DEFAULT_PARAMS.items():
+        parser.add_argument(
+            f"--{name.replace('_', '-')}",
+            type=type(default),
+            help=f"Override the scenarios' {name} (default {default})",
+        )
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="Compare with the results in this JSON file")
+    args = parser.parse_args()
+
+    overrides = {
+        name: getattr(args, name)
+        for name in DEFAULT_PARAMS
+        if getattr(args, name) is not None
+    }
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "scenarios": {},
+    }
+    context = multiprocessing.get_context("spawn")
+    for name in args.scenario or SCENARIOS:
+        params = {**DEFAULT_PARAMS, **SCENARIOS[name], **overrides}
+        with context.Pool(1) as pool:
+            results["scenarios"][name] = pool.apply(
+                run_scenario, (params, args.tasks, args.seed, args.repeat)
+            )
+
+    print_results(results)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline:
+            print_comparison(results, json.load(baseline))
+    if args.output:
+        write_results(args.output, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Events/s of the task event handler: with and without cached metric children,
+and applied one by one or in batches.
+
+python -m benchmarks.task_metrics --tasks 50000
+"""
+
+import argparse
+import time
+
+from loguru import logger
+
+from src.exporter import Exporter, get_exception_class_name, get_hostname
+
+from .events import synthetic_events
+
+
+class LabelsExporter(Exporter):
+    """Resolves every counter through labels() on every event, like the
+    exporter did before TaskSeries. Only the counters are updated, which is
+    where the two differ."""
+
+    def track_task_event(self, event):
+        task = self.state.task_event(event)
+        labels = {
+            "name": task.name,
+            "hostname": get_hostname(task.hostname),
+            "queue_name": task.queue or self.default_queue_name,
+            **self.static_label,
+        }
+        for counter_name, counter in self.state_counters.items():
+            _labels = labels.copy()
+            if counter_name == "task-failed":
+                if counter_name == event["type"]:
+                    _labels["exception"] = get_exception_class_name(task.exception)
+                else:
+                    _labels["exception"] = ""
+            if counter_name == event["type"]:
+                counter.labels(**_labels).inc()
+            elif counter_name != "task-sent":
+                counter.labels(**_labels).inc(0)
+
+
+class CachedExporter(Exporter):
+    """track_task_event without the histogram observations."""
+
+    def track_task_event(self, event):
+        task = self.state.task_event(event)
+        series = self.task_series(
+            task.name,
+            get_hostname(task.hostname),
+            task.queue or self.default_queue_name,
+        )
+        if event["type"] == "task-failed":
+            series.failed(get_exception_class_name(task.exception)).inc()
+        else:
+            series.counter(event["type"]).inc()
+
+
+def events_per_second(exporter, events):
+    # create the series first, the steady state is what's measured
+    for event in events:
+        exporter.track_task_event(event)
+    started = time.perf_counter()
+    for event in events:
+        exporter.track_task_event(event)
+    return len(events) / (time.perf_counter() - started)
+
+
+def applied_events_per_second(exporter, events, batch_size=0):
+    """Events/s through the exporter's handlers, one event at a time like
+    without an event buffer, or in batches of batch_size like the apply
+    thread."""
+    for event in events:
+        exporter.apply_event(event)
+    started = time.perf_counter()
+    if batch_size > 0:
+        for i in range(0, len(events), batch_size):
+            exporter.apply_batch(events[i : i + batch_size])
+    else:
+        for event in events:
+            exporter.apply_event(event)
+    return len(events) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=50_000)
+    parser.add_argument("--task-names", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=20)
+    args = parser.parse_args()
+
+    # the handlers log at debug level, which production doesn't enable
+    logger.remove()
+    events = [
+        event
+        for event in synthetic_events(
+            args.tasks, task_names=args.task_names, workers=args.workers
+        )
+        if event["type"].startswith("task-")
+    ]
+    print(f"{len(events)} task events")
+    for name, exporter in [
+        ("labels() per event", LabelsExporter()),
+        ("cached children", CachedExporter()),
+        ("track_task_event", Exporter()),
+    ]:
+        print(f"{name:36} {events_per_second(exporter, events):12,.0f} events/s")
+    # both through the same, possibly instrumented, handlers
+    for self_metrics in (True, False):
+        suffix = "" if self_metrics else ", no self-metrics"
+        for name, batch_size in [("apply_event", 0), ("apply_batch(500)", 500)]:
+            exporter = Exporter(self_metrics=self_metrics)
+            rate = applied_events_per_second(exporter, events, batch_size)
+            print(f"{name + suffix:36} {rate:12,.0f} events/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compare celery's event State with the exporter's TaskTracker.
+
+python -m benchmarks.task_tracker --tasks 50000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+
+from celery.events.state import State  # type: ignore
+
+from src.tracker import TaskTracker
+
+from .events import synthetic_events
+
+
+def feed_state(events, max_tasks):
+    state = State(max_tasks_in_memory=max_tasks)
+    for event in events:
+        state.event(event)
+        if event["type"].startswith("task-"):
+            state.tasks.get(event["uuid"])
+    return state
+
+
+def feed_tracker(events, max_tasks):
+    tracker = TaskTracker(max_tasks=max_tasks)
+    for event in events:
+        if event["type"].startswith("task-"):
+            tracker.task_event(event)
+        else:
+            tracker.worker_event(event)
+    return tracker
+
+
+def measure(feed, events, max_tasks):
+    # State mutates the events it is given, so every run gets its own copies
+    gc.collect()
+    copies = [dict(event) for event in events]
+    started = time.perf_counter()
+    feed(copies, max_tasks)
+    elapsed = time.perf_counter() - started
+
+    copies = [dict(event) for event in events]
+    gc.collect()
+    tracemalloc.start()
+    retained = feed(copies, max_tasks)
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del retained
+
+    return {
+        "events_per_second": len(events) / elapsed,
+        "retained_bytes": current,
+        "peak_bytes": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tasks", type=int, default=50_000)
+    parser.add_argument("--max-tasks", type=int, default=10_000)
+    args = parser.parse_args()
+
+    events = list(synthetic_events(args.tasks))
+    print(f"{len(events)} events, {args.tasks} tasks, max {args.max_tasks} in memory")
+    print(f"{'':12} {'events/s':>12} {'retained MiB':>14} {'peak MiB':>10}")
+    for name, feed in [("State", feed_state), ("TaskTracker", feed_tracker)]:
+        result = measure(feed, events, args.max_tasks)
+        print(
+            f"{name:12} {result['events_per_second']:12,.0f} "
+            f"{result['retained_bytes'] / 2**20:14.1f} "
+            f"{result['peak_bytes'] / 2**20:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Time the worker timeout and purge pass of a scrape as the fleet grows.
+
+python -m benchmarks.worker_expiry --workers 1000 10000 50000
+"""
+
+import argparse
+import time
+
+from loguru import logger
+
+from src.exporter import Exporter
+
+
+def scrape_seconds(workers, scrapes):
+    exporter = Exporter(event_buffer_size=0)
+    now = time.time()
+    for i in range(workers):
+        exporter.track_worker_heartbeat(
+            {
+                "type": "worker-heartbeat",
+                "hostname": f"celery@worker-{i}",
+                "timestamp": now,
+                "local_received": now,
+                "freq": 2.0,
+                "active": 1,
+            }
+        )
+    started = time.perf_counter()
+    for _ in range(scrapes):
+        exporter.track_timed_out_workers()
+    return (time.perf_counter() - started) / scrapes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1000, 10_000])
+    parser.add_argument("--scrapes", type=int, default=100)
+    args = parser.parse_args()
+    logger.remove()
+
+    print(f"{'workers':>10} {'us/scrape':>12}")
+    for workers in args.workers:
+        seconds = scrape_seconds(workers, args.scrapes)
+        print(f"{workers:10,} {seconds * 1e6:12.1f}")
+
+
+if __name__ == "__main__":
+    main()
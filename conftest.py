@@ -1,10 +1,10 @@
+import copy
 import socket
 import threading
 import time
-import copy
 
+import kombu.exceptions
 import pytest
-from celery.events.state import State  # type: ignore
 
 from src.exporter import Exporter
 
@@ -180,7 +180,94 @@ def hostname():
 
 @pytest.fixture()
 def event_exporter():
-    """An exporter with task state tracking, fed events directly (no worker)."""
-    exporter = Exporter()
-    exporter.state = State()
-    return exporter
+    """An exporter fed events directly (no worker)."""
+    return Exporter()
+
+
+class FakeClock:  # pylint: disable=too-few-public-methods
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock():
+    """A clock that only moves when a test sets its now."""
+    return FakeClock()
+
+
+class FakeConnection:
+    """Mimics a kombu connection that still holds on to a socket.
+
+    ensure_connection() is a no-op for such a connection even when the
+    broker is gone - only connecting anew tells us anything. Given a broker,
+    it fails once the broker is down, and the broker is its client.
+    """
+
+    virtual_host = "/"
+    userid = "guest"
+    password = "guest"
+
+    def __init__(self, transport="redis", broker=None, clone_error=None):
+        self.transport = transport
+        self.broker = broker
+        self.client = broker
+        self.default_channel = self
+        self.clone_error = clone_error
+        self.released = False
+
+    def as_uri(self):
+        return f"{self.transport}://localhost:6379//"
+
+    def info(self):
+        return {"transport": self.transport}
+
+    def ensure_connection(self, **kwargs):  # pylint: disable=unused-argument
+        if self.broker is not None and not self.broker.up:
+            raise kombu.exceptions.OperationalError("Connection refused")
+
+    def clone(self):
+        if self.clone_error:
+            raise self.clone_error
+        return self
+
+    def release(self):
+        self.released = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+@pytest.fixture()
+def fake_connection():
+    """Makes connections that don't reach a broker."""
+    return FakeConnection
+
+
+class FakeInspect:
+    def __init__(self, stats, active_queues):
+        self._stats = stats
+        self._active_queues = active_queues
+
+    def stats(self):
+        return self._stats
+
+    def active_queues(self):
+        return self._active_queues
+
+
+@pytest.fixture()
+def fake_inspect(monkeypatch):
+    """Has the workers of an app answer inspect() with the given stats and
+    queues, none by default."""
+
+    def _fake_inspect(app, stats=None, active_queues=None):
+        inspect = FakeInspect(stats or {}, active_queues or {})
+        monkeypatch.setattr(app.control, "inspect", lambda **_: inspect)
+
+    return _fake_inspect
@@ -0,0 +1,53 @@
+# pylint: disable=protected-access
+from bisect import bisect_right
+from collections import defaultdict
+from typing import DefaultDict, List
+
+
+def observe_many(histogram, amounts):
+    """Observe all amounts on a histogram child, taking its locks once.
+
+    Histogram.observe() scans the buckets and increments the sum and a bucket
+    for every single amount. Here the amounts are sorted once and every
+    bucket bound is looked up in them, so each bucket is incremented by the
+    number of amounts that fall into it.
+    """
+    if len(amounts) == 1:
+        histogram.observe(amounts[0])
+        return
+    amounts = sorted(amounts)
+    below = 0
+    for bucket, bound in zip(histogram._buckets, histogram._upper_bounds):
+        upto = bisect_right(amounts, bound, lo=below)
+        if upto > below:
+            bucket.inc(upto - below)
+            below = upto
+        if below == len(amounts):
+            break
+    histogram._sum.inc(sum(amounts))
+    native = getattr(histogram, "_native", None)
+    if native is not None:
+        native.observe_many(amounts)
+
+
+class MetricBatch:
+    """Collects the counter increments and histogram observations of a batch
+    of events per metric child, and commits them in one go."""
+
+    def __init__(self):
+        self.increments: DefaultDict[object, int] = defaultdict(int)
+        self.observations: DefaultDict[object, List[float]] = defaultdict(list)
+
+    def inc(self, child):
+        self.increments[child] += 1
+
+    def observe(self, child, amount):
+        self.observations[child].append(amount)
+
+    def commit(self):
+        for child, amount in self.increments.items():
+            child.inc(amount)
+        for child, amounts in self.observations.items():
+            observe_many(child, amounts)
+        self.increments.clear()
+        self.observations.clear()
@@ -0,0 +1,186 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Deque, Optional
+
+from kombu import Exchange  # type: ignore
+from kombu.exceptions import OperationalError  # type: ignore
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+# A connection idle for longer than this is checked before it is handed out
+CHECK_IDLE_SECONDS = 5.0
+MIN_BACKOFF_SECONDS = 0.5
+MAX_BACKOFF_SECONDS = 30.0
+
+
+class PooledConnection:  # pylint: disable=too-few-public-methods
+    __slots__ = ("connection", "created", "released")
+
+    def __init__(self, connection, now):
+        self.connection = connection
+        self.created = now
+        self.released = now
+
+
+def ping(connection):
+    """A round trip to the broker on the connection."""
+    transport = connection.info()["transport"]
+    if transport in ("redis", "rediss", "sentinel"):
+        connection.default_channel.client.ping()
+    elif transport in ("amqp", "amqps"):
+        # amq.direct exists on every vhost, so that the passive declaration
+        # doesn't close the channel
+        Exchange("amq.direct", "direct", passive=True).declare(
+            channel=connection.default_channel
+        )
+    else:
+        connection.ensure_connection(max_retries=1)
+
+
+class BrokerPool:  # pylint: disable=too-many-instance-attributes
+    """Long-lived broker connections for collecting metrics and /health.
+
+    Connecting to the broker takes TCP, TLS and the broker's own handshakes,
+    which can take longer than the queries of a scrape. The pool keeps up to
+    size connections open between scrapes. A connection that was idle for a
+    while is pinged before it is handed out, and connections idle for longer
+    than max_idle or older than max_age are closed and replaced, so that
+    load balancers and broker failovers don't leave dead sockets behind. A
+    connection that fails while in use is dropped.
+
+    When connecting fails, the pool backs off exponentially: until the next
+    attempt acquire() raises right away instead of piling up connection
+    attempts on a broker that is down.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        connect: Callable,
+        metric_prefix,
+        static_label,
+        registry,
+        size=2,
+        max_idle=300.0,
+        max_age=3600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.connect = connect
+        self.size = size
+        self.max_idle = max_idle
+        self.max_age = max_age
+        self.clock = clock
+        self._idle: Deque[PooledConnection] = deque()
+        self._lock = Lock()
+        self._in_use = 0
+        self._backoff = 0.0
+        self._retry_at: Optional[float] = None
+        static_label_keys = static_label.keys()
+
+        connections = Gauge(
+            f"{metric_prefix}exporter_broker_connections",
+            "The number of broker connections of the metrics collection pool, per "
+            "state: idle or in_use.",
+            ["state", *static_label_keys],
+            registry=registry,
+        )
+        connections.labels(state="idle", **static_label).set_function(
+            lambda: len(self._idle)
+        )
+        connections.labels(state="in_use", **static_label).set_function(
+            lambda: self._in_use
+        )
+        self.connects = Counter(
+            f"{metric_prefix}exporter_broker_connects",
+            "The number of broker connections opened by the metrics collection pool, "
+            "per result: success or failure.",
+            ["result", *static_label_keys],
+            registry=registry,
+        )
+        self.recycled = Counter(
+            f"{metric_prefix}exporter_broker_connections_recycled",
+            "The number of broker connections of the metrics collection pool closed, "
+            "per reason: idle, max_age, unhealthy, error or overflow.",
+            ["reason", *static_label_keys],
+            registry=registry,
+        )
+        self.static_label = static_label
+
+    def _close(self, pooled, reason):
+        self.recycled.labels(reason=reason, **self.static_label).inc()
+        try:
+            pooled.connection.release()
+        except Exception:  # pylint: disable=broad-except
+            logger.debug("Failed to close a broker connection")
+
+    def _open(self) -> PooledConnection:
+        now = self.clock()
+        if self._retry_at is not None and now < self._retry_at:
+            raise OperationalError(
+                f"Reconnecting to the broker in {self._retry_at - now:.1f} seconds"
+            )
+        connection = self.connect()
+        try:
+            connection.ensure_connection(max_retries=1)
+        except Exception:
+            self.connects.labels(result="failure", **self.static_label).inc()
+            self._backoff = min(
+                max(self._backoff * 2, MIN_BACKOFF_SECONDS), MAX_BACKOFF_SECONDS
+            )
+            self._retry_at = self.clock() + self._backoff
+            connection.release()
+            raise
+        self.connects.labels(result="success", **self.static_label).inc()
+        self._backoff, self._retry_at = 0.0, None
+        return PooledConnection(connection, self.clock())
+
+    def _take(self, check) -> Optional[PooledConnection]:
+        """An idle connection that is still fit for use, if there is one."""
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                pooled = self._idle.pop()
+            now = self.clock()
+            if now - pooled.created >= self.max_age:
+                self._close(pooled, "max_age")
+            elif now - pooled.released >= self.max_idle:
+                self._close(pooled, "idle")
+            elif not check and now - pooled.released < CHECK_IDLE_SECONDS:
+                return pooled
+            else:
+                try:
+                    ping(pooled.connection)
+                    return pooled
+                except Exception:  # pylint: disable=broad-except
+                    logger.info("Dropping a broker connection that failed a ping")
+                    self._close(pooled, "unhealthy")
+
+    @contextmanager
+    def acquire(self, check=False):
+        """A connection to the broker, pinged first if check is set or it was
+        idle for a while."""
+        pooled = self._take(check) or self._open()
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield pooled.connection
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            self._close(pooled, "error")
+            raise
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.size:
+                pooled.released = self.clock()
+                self._idle.append(pooled)
+                return
+        self._close(pooled, "overflow")
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for pooled in idle:
+            self._close(pooled, "idle")
@@ -0,0 +1,99 @@
+# pylint: disable=protected-access
+import heapq
+import time
+from threading import Lock
+from typing import Callable, Dict, Optional, Set
+
+# The label value that series over their metric's budget are folded into
+OVERFLOW_LABEL = "__overflow__"
+# How long it takes the event counts of the task names to halve
+HEAVY_HITTERS_HALF_LIFE = 60.0
+
+
+class SeriesLimiter:
+    """Per-metric budgets for the number of series.
+
+    A metric's series count is the number of its children, so removing
+    series - for example when purging an offline worker's metrics - frees
+    up its budget again. The last series of the budget is kept for the
+    overflow series.
+    """
+
+    def __init__(self, default_limit: int = 0, limits: Optional[Dict[str, int]] = None):
+        self.default_limit = default_limit
+        self.limits = limits or {}
+
+    def limit(self, metric) -> int:
+        return self.limits.get(metric._name, self.default_limit)
+
+    def full(self, metric) -> bool:
+        """Whether only the overflow series fits the metric's budget."""
+        limit = self.limit(metric)
+        return limit > 0 and len(metric._metrics) >= limit - 1
+
+    def admits(self, metric, labels) -> bool:
+        """Whether the series of the labels exists or fits the metric's budget."""
+        if not self.full(metric):
+            return True
+        key = tuple(str(labels[name]) for name in metric._labelnames)
+        return key in metric._metrics
+
+
+class HeavyHitters:  # pylint: disable=too-many-instance-attributes
+    """Keeps track of the K task names with the most events.
+
+    Events are counted with the Space-Saving algorithm: at most `capacity`
+    names are counted, and a new name takes over the count of the least
+    counted one. The hot names are picked anew from the counts on every
+    rotate(). The counts decay by the time since the last rotate(), halving
+    every half_life seconds, so that the ranking follows the recent event
+    rate however often the metrics are scraped. Until then, a new name is
+    only hot if there is room left among the K.
+
+    Events are counted on the thread applying them while scrapes rotate, so
+    both hold a lock.
+    """
+
+    def __init__(
+        self,
+        k: int,
+        capacity: int = 0,
+        half_life: float = HEAVY_HITTERS_HALF_LIFE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.k = k
+        self.capacity = capacity or 4 * k
+        self.half_life = half_life
+        self.clock = clock
+        self.counts: Dict[str, float] = {}
+        self.hot: Set[str] = set()
+        self._decayed_at = clock()
+        self._lock = Lock()
+
+    def hit(self, name, hits=1) -> bool:
+        """Count events of a task name, returning whether the name is hot."""
+        with self._lock:
+            if hits:
+                count = self.counts.get(name)
+                if count is None:
+                    count = 0.0
+                    if len(self.counts) >= self.capacity:
+                        coldest = min(self.counts, key=self.counts.__getitem__)
+                        count = self.counts.pop(coldest)
+                self.counts[name] = count + hits
+                if len(self.hot) < self.k:
+                    self.hot.add(name)
+            return name in self.hot
+
+    def rotate(self) -> Set[str]:
+        """Pick the hot names from the counts, returning the demoted ones."""
+        with self._lock:
+            counts = self.counts
+            hot = set(heapq.nlargest(self.k, counts, key=counts.__getitem__))
+            demoted = self.hot - hot
+            self.hot = hot
+            now = self.clock()
+            decay = 0.5 ** ((now - self._decayed_at) / self.half_life)
+            self._decayed_at = now
+            self.counts = {name: count * decay for name, count in counts.items()}
+        return demoted
@@ -6,6 +6,8 @@ from prometheus_client import Histogram
 
 from .exporter import DEFAULT_QUEUE_WAIT_BUCKETS, Exporter
 from .help import cmd_help
+from .native_histogram import DEFAULT_ZERO_THRESHOLD, MAX_SCHEMA, MIN_SCHEMA
+from .pipeline import OVERFLOW_BLOCK, OVERFLOW_POLICIES
 
 # https://github.com/pallets/click/issues/448#issuecomment-246029304
 # pylint: disable=protected-access
@@ -161,6 +163,238 @@ def _eq_sign_separated_argument_to_dict(_ctx, _param, value):
     callback=_eq_sign_separated_argument_to_dict,
     help="Add label with static value to all metrics",
 )
+@click.option(
+    "--max-tasks-in-memory",
+    default=10000,
+    show_default=True,
+    help="The number of in-flight tasks to keep track of. When exceeded, the task "
+    "that has gone the longest without an event is forgotten, and its remaining "
+    "events are labeled without the task's name and queue.",
+)
+@click.option(
+    "--task-ttl",
+    default=0,
+    show_default=True,
+    help="Forget a task if no event has been received for it in this many seconds. "
+    "Should be longer than the longest ETA/countdown plus runtime of your tasks. "
+    "If set to 0, tasks are only forgotten once --max-tasks-in-memory is exceeded.",
+)
+@click.option(
+    "--event-buffer-size",
+    default=0,
+    show_default=True,
+    help="The number of received events to buffer while the metrics are being updated. "
+    "Buffering lets the exporter acknowledge events as fast as the broker delivers them "
+    "and absorb bursts, at the cost of a thread handing the events over. If set to 0, "
+    "the metrics are updated before the next event is received.",
+)
+@click.option(
+    "--event-buffer-overflow",
+    type=click.Choice(OVERFLOW_POLICIES),
+    default=OVERFLOW_BLOCK,
+    show_default=True,
+    help="What to do with a received event when the event buffer is full: wait for "
+    "room, discard the oldest buffered event or discard the received event. Discarded "
+    "events are counted by celery_exporter_events_dropped_total.",
+)
+@click.option(
+    "--event-batch-size",
+    default=500,
+    show_default=True,
+    help="The maximum number of buffered events to apply at once.",
+)
+@click.option(
+    "--batch-events",
+    default=False,
+    is_flag=True,
+    help="Commit the counter increments and histogram observations of the buffered "
+    "events applied at once per series rather than per event. Requires an event "
+    "buffer. Only faster when many events update the same series, measure with "
+    "benchmarks/task_metrics.py first.",
+)
+@click.option(
+    "--shards",
+    default=1,
+    show_default=True,
+    help="The number of processes consuming events. Only the handling of the task "
+    "state is split: each process binds its own event queue, receiving and decoding "
+    "every event, and tracks the tasks whose uuid hashes to it. The metric updates "
+    "are still all applied, serially, by the main process, which serves /metrics. Use "
+    "more than one when tracking the tasks, rather than decoding the events, is what "
+    "a single core can't keep up with. Requires --event-buffer-size.",
+)
+@click.option(
+    "--native-histograms",
+    default=False,
+    is_flag=True,
+    help="Additionally track celery_task_runtime and celery_task_queue_wait_time as "
+    "native (sparse exponential) histograms. They are exposed to scrapers negotiating "
+    "the protobuf format, such as Prometheus with native histograms enabled, while "
+    "other scrapers keep getting the classic --buckets and --queue-wait-buckets.",
+)
+@click.option(
+    "--native-histogram-schema",
+    type=click.IntRange(MIN_SCHEMA, MAX_SCHEMA),
+    default=3,
+    show_default=True,
+    help="The resolution of the native histograms: every power of two is split into "
+    "2^schema buckets.",
+)
+@click.option(
+    "--native-histogram-zero-threshold",
+    type=float,
+    default=DEFAULT_ZERO_THRESHOLD,
+    show_default=True,
+    help="Observations up to this value are counted in the zero bucket of the native "
+    "histograms.",
+)
+@click.option(
+    "--max-series-per-metric",
+    default=0,
+    show_default=True,
+    help="The series budget of each celery_task_* metric. Once a metric has this many "
+    "series, new label sets are folded into a series labeled '__overflow__', protecting "
+    "the exporter and Prometheus from label values such as dynamic task names or random "
+    "client hostnames. If set to 0, the metrics aren't limited.",
+)
+@click.option(
+    "--series-limit",
+    required=False,
+    default=None,
+    multiple=True,
+    callback=_eq_sign_separated_argument_to_dict,
+    help="The series budget of a single metric, named without the metric prefix, e.g "
+    "task_sent=1000. Overrides --max-series-per-metric.",
+)
+@click.option(
+    "--top-task-names",
+    default=0,
+    show_default=True,
+    help="Only keep series for this many task names, those with the most recent events, "
+    "counted with a half-life of a minute. The ranking is updated on every scrape: the "
+    "series of task names that drop out of "
+    "it are removed, and their events are counted under the task name '__overflow__'. "
+    "If set to 0, all task names are kept.",
+)
+@click.option(
+    "--record-events",
+    default=None,
+    help="Append every event received from the broker to this file, one JSON object "
+    "per line, gzip compressed if the path ends in .gz. The capture can be replayed "
+    "without a broker with `python -m benchmarks.replay`.",
+)
+@click.option(
+    "--self-metrics/--no-self-metrics",
+    default=True,
+    show_default=True,
+    help="Export the exporter's own metrics: the events received and the handler "
+    "duration per event type, the event lag, the number of tasks and workers kept in "
+    "memory and the time spent collecting metrics on a scrape.",
+)
+@click.option(
+    "--queue-poll-interval",
+    type=float,
+    default=0,
+    show_default=True,
+    help="Collect the queue metrics (queue lengths, active workers, processes and "
+    "consumers) in the background every this many seconds, and serve the last values "
+    "on /metrics, rather than asking the broker and the workers on every scrape. 0 "
+    "collects them on every scrape.",
+)
+@click.option(
+    "--queue-length-by-priority",
+    default=False,
+    is_flag=True,
+    help="Also export the length of every priority step of the redis queues, as "
+    "celery_queue_length_by_priority. celery_queue_length is their sum.",
+)
+@click.option(
+    "--worker-topology-interval",
+    type=float,
+    default=0,
+    show_default=True,
+    help="Ask the workers for their concurrency and queues at most every this many "
+    "seconds, and whenever a worker comes online or goes offline, rather than on "
+    "every collection of the queue metrics.",
+)
+@click.option(
+    "--inspect-timeout",
+    type=float,
+    default=1.0,
+    show_default=True,
+    help="How long to wait for the workers to reply to the stats and active_queues "
+    "broadcasts. Once the workers are known, the wait ends when all of them replied, "
+    "or after three times the slowest reply time seen.",
+)
+@click.option(
+    "--worker-topology-from-events",
+    default=False,
+    is_flag=True,
+    help="Keep the workers' concurrency and queues up to date from worker events: "
+    "workers going offline or timing out are dropped, and only workers coming online "
+    "are inspected. --worker-topology-interval (10 minutes if not set) is then the "
+    "interval of a full inspect() reconciliation.",
+)
+@click.option(
+    "--rabbitmq-management-url",
+    default=None,
+    help="Collect the rabbitmq queue lengths and consumer counts from the management "
+    "HTTP API, e.g. http://rabbitmq:15672, with a call per 500 queues rather than "
+    "passive queue declarations. Also exports the ready and unacknowledged messages "
+    "and the message bytes of every queue. The broker's credentials are used unless "
+    "the url has its own.",
+)
+@click.option(
+    "--broker-pool-size",
+    type=int,
+    default=2,
+    show_default=True,
+    help="How many broker connections to keep open between collections of the queue "
+    "metrics and /health probes.",
+)
+@click.option(
+    "--broker-pool-max-idle",
+    type=float,
+    default=300.0,
+    show_default=True,
+    help="Close pooled broker connections unused for this many seconds. Connections "
+    "unused for more than 5 seconds are pinged before they are used.",
+)
+@click.option(
+    "--broker-pool-max-age",
+    type=float,
+    default=3600.0,
+    show_default=True,
+    help="Replace pooled broker connections once they are this many seconds old, so "
+    "that the exporter follows broker failovers and load balancer changes.",
+)
+@click.option(
+    "--metrics-cache-max-age",
+    type=float,
+    default=0,
+    show_default=True,
+    help="Serve the same rendered /metrics response, and its gzip or zstd compressed "
+    "body, for up to this many seconds while the metrics don't change, e.g. to "
+    "several Prometheus replicas. The cached response is held in memory whole. 0 "
+    "renders the metrics on every scrape, streaming them a metric family at a time, "
+    "which bounds the memory of a scrape by the largest metric family. Streaming "
+    "only applies with 0.",
+)
+@click.option(
+    "--debug-endpoints",
+    default=False,
+    is_flag=True,
+    help="Serve the profiling routes under /debug: /debug/profile samples the stacks "
+    "of all threads for ?seconds=, /debug/tracemalloc reports the top allocations once "
+    "tracing was started with a POST to /debug/tracemalloc/start, and /debug/threads "
+    "dumps the thread stacks.",
+)
+@click.option(
+    "--debug-token",
+    default=None,
+    help="Require the /debug routes to be requested with this bearer token in the "
+    "Authorization header.",
+)
 def cli(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals
     broker_url,
     broker_transport_option,
@@ -180,6 +414,33 @@ def cli(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too
     metric_prefix,
     default_queue_name,
     static_label,
+    max_tasks_in_memory,
+    task_ttl,
+    event_buffer_size,
+    event_buffer_overflow,
+    event_batch_size,
+    batch_events,
+    shards,
+    native_histograms,
+    native_histogram_schema,
+    native_histogram_zero_threshold,
+    max_series_per_metric,
+    series_limit,
+    top_task_names,
+    record_events,
+    self_metrics,
+    queue_poll_interval,
+    queue_length_by_priority,
+    worker_topology_interval,
+    inspect_timeout,
+    worker_topology_from_events,
+    rabbitmq_management_url,
+    broker_pool_size,
+    broker_pool_max_idle,
+    broker_pool_max_age,
+    metrics_cache_max_age,
+    debug_endpoints,
+    debug_token,
 ):  # pylint: disable=unused-argument
     formatted_buckets = list(map(float, buckets.split(",")))
     formatted_queue_wait_buckets = list(map(float, queue_wait_buckets.split(",")))
@@ -195,4 +456,27 @@ def cli(  # pylint: disable=too-many-arguments,too-many-positional-arguments,too
         default_queue_name,
         static_label,
         formatted_queue_wait_buckets,
+        max_tasks_in_memory=max_tasks_in_memory,
+        task_ttl_seconds=task_ttl,
+        event_buffer_size=event_buffer_size,
+        event_buffer_overflow=event_buffer_overflow,
+        event_batch_size=event_batch_size,
+        batch_events=batch_events,
+        shards=shards,
+        native_histograms=native_histograms,
+        native_histogram_schema=native_histogram_schema,
+        native_histogram_zero_threshold=native_histogram_zero_threshold,
+        max_series_per_metric=max_series_per_metric,
+        series_limits={name: int(limit) for name, limit in series_limit.items()},
+        top_task_names=top_task_names,
+        self_metrics=self_metrics,
+        queue_poll_interval=queue_poll_interval,
+        queue_length_by_priority=queue_length_by_priority,
+        worker_topology_interval=worker_topology_interval,
+        inspect_timeout=inspect_timeout,
+        worker_topology_from_events=worker_topology_from_events,
+        rabbitmq_management_url=rabbitmq_management_url,
+        broker_pool_size=broker_pool_size,
+        broker_pool_max_idle=broker_pool_max_idle,
+        broker_pool_max_age=broker_pool_max_age,
     ).run(ctx.params)
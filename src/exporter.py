@@ -1,13 +1,16 @@
-# pylint: disable=protected-access,,attribute-defined-outside-init
+# pylint: disable=protected-access,,attribute-defined-outside-init,too-many-lines
 import json
+import multiprocessing
+import queue
 import re
 import sys
 import time
-from collections import defaultdict
-from typing import Callable, Optional
+from collections import OrderedDict, defaultdict
+from contextlib import nullcontext
+from threading import Thread
+from typing import Any, Callable, DefaultDict, Dict, Optional, Set
 
 from celery import Celery
-from celery.events.state import State  # type: ignore
 from celery.utils import nodesplit  # type: ignore
 from celery.utils.time import adjust_timestamp, maybe_iso8601, utcoffset  # type: ignore
 from kombu.exceptions import ChannelError  # type: ignore
@@ -15,7 +18,22 @@ from loguru import logger
 from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
 from prometheus_client.utils import INF
 
+from .batch import MetricBatch
+from .broker_pool import BrokerPool
+from .cardinality import OVERFLOW_LABEL, HeavyHitters, SeriesLimiter
 from .http_server import start_http_server
+from .instrumentation import PipelineMetrics, ShardPipelineMetrics
+from .introspection import registry_cardinality
+from .native_histogram import DEFAULT_ZERO_THRESHOLD, ExponentialHistogram
+from .pipeline import OVERFLOW_BLOCK, EventBuffer
+from .queue_poller import QueuePoller
+from .rabbitmq_management import ManagementClient, QueueStats
+from .recording import EventRecorder
+from .series_index import count_label_values, index_by_labels, label_keys
+from .shards import ShardBatch, ShardTaskSeries, resolve_token, shard_of
+from .topology import WorkerTopology
+from .tracker import TaskTracker
+from .worker_registry import PURGE, TIMEOUT, WorkerRegistry
 
 # Queue wait time is a saturation signal: healthy queues sit near zero, but a
 # backlog can grow to minutes. Unlike the runtime default buckets there is no
@@ -38,11 +56,118 @@ DEFAULT_QUEUE_WAIT_BUCKETS = (
     INF,
 )
 
+# The transports keeping queues in redis lists
+REDIS_TRANSPORTS = ("redis", "rediss", "sentinel")
+# The statistics of a queue missing from the management API
+MISSING_QUEUE = QueueStats(0, 0, 0, 0)
+# How many folded label sets are remembered, to count each of them once
+MAX_FOLDED_SERIES = 10000
 
-class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branches
-    state: State = None
 
-    # pylint: disable=too-many-arguments,too-many-positional-arguments
+class TaskSeries:  # pylint: disable=too-many-instance-attributes
+    """The metric children of one (name, hostname, queue_name) label set.
+
+    Resolving a child through labels() validates and hashes the label kwargs
+    on every call, which adds up when done for every counter on every event.
+    The children are resolved once here instead. All counters but task-sent
+    are created up front to make them visible at zero - task-sent is labeled
+    with the hostnames of clients (webservers, task creators) and would
+    explode the cardinality of the worker-side counters. The histograms are
+    only created on their first observation.
+
+    Children over their metric's series budget are folded into the overflow
+    series, and folded holds the names of the metrics where that happened,
+    including those of the histograms created later on.
+    """
+
+    __slots__ = (
+        "exporter",
+        "key",
+        "labels",
+        "counters",
+        "failures",
+        "folded",
+        "_runtime",
+        "_wait",
+    )
+
+    def __init__(self, exporter, name, hostname, queue_name):
+        self.exporter = exporter
+        self.key = (name, hostname, queue_name)
+        self.labels = {
+            "name": intern_label(name),
+            "hostname": intern_label(hostname),
+            "queue_name": intern_label(queue_name),
+            **exporter.static_label,
+        }
+        self.counters = {}
+        self.failures = {}
+        self.folded: Set[str] = set()
+        self._runtime = None
+        self._wait = None
+        self.create_counters()
+
+    def create_counters(self):
+        for counter_name in self.exporter.state_counters:
+            if counter_name == "task-failed":
+                self.failed("")
+            elif counter_name != "task-sent":
+                self.counter(counter_name)
+
+    def unfold(self):
+        """Resolve the children again, admitting the folded ones if their
+        metric has room by now."""
+        self.counters.clear()
+        self.failures.clear()
+        self.folded.clear()
+        self._runtime = None
+        self._wait = None
+        self.create_counters()
+
+    def child(self, metric, labels):
+        child, folded = self.exporter.series_child(metric, labels)
+        if folded:
+            self.folded.add(metric._name)
+            self.exporter.folded_task_series.add(self.key)
+        return child
+
+    def labels_of(self, metric):
+        """The labels of the metric's child, the overflow labels if folded."""
+        if metric._name in self.folded:
+            return overflow_labels(self.labels)
+        return self.labels
+
+    def counter(self, event_type):
+        child = self.counters.get(event_type)
+        if child is None:
+            counter = self.exporter.state_counters[event_type]
+            child = self.counters[event_type] = self.child(counter, self.labels)
+        return child
+
+    def failed(self, exception):
+        child = self.failures.get(exception)
+        if child is None:
+            counter = self.exporter.state_counters["task-failed"]
+            child = self.failures[exception] = self.child(
+                counter, {"exception": exception, **self.labels}
+            )
+        return child
+
+    def runtime(self):
+        if self._runtime is None:
+            self._runtime = self.child(self.exporter.celery_task_runtime, self.labels)
+        return self._runtime
+
+    def queue_wait_time(self):
+        if self._wait is None:
+            self._wait = self.child(
+                self.exporter.celery_task_queue_wait_time, self.labels
+            )
+        return self._wait
+
+
+class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branches,too-many-public-methods
+    # pylint: disable=too-many-arguments,too-many-positional-arguments,too-many-locals,too-many-statements
     def __init__(
         self,
         buckets=None,
@@ -55,10 +180,51 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
         default_queue_name="celery",
         static_label=None,
         queue_wait_buckets=None,
+        max_tasks_in_memory=10000,
+        task_ttl_seconds=0,
+        event_buffer_size=0,
+        event_buffer_overflow=OVERFLOW_BLOCK,
+        event_batch_size=500,
+        batch_events=False,
+        shards=1,
+        native_histograms=False,
+        native_histogram_schema=3,
+        native_histogram_zero_threshold=DEFAULT_ZERO_THRESHOLD,
+        max_series_per_metric=0,
+        series_limits=None,
+        top_task_names=0,
+        self_metrics=True,
+        queue_poll_interval=0,
+        queue_length_by_priority=False,
+        worker_topology_interval=0,
+        inspect_timeout=1.0,
+        worker_topology_from_events=False,
+        rabbitmq_management_url=None,
+        broker_pool_size=2,
+        broker_pool_max_idle=300.0,
+        broker_pool_max_age=3600.0,
     ):
         self.registry = CollectorRegistry(auto_describe=True)
+        # Bumped whenever the metrics are updated, so that /metrics renders
+        # the registry again rather than serving its cached response
+        self.generation = 0
+        self.task_series_cache = {}
+        # The cached TaskSeries with folded children, which are resolved again
+        # once removing series made room in their metrics
+        self.folded_task_series: Set[tuple] = set()
+        self.folded_series: "OrderedDict[tuple, None]" = OrderedDict()
+        # The TaskSeries of every hostname and task name, to purge a worker's
+        # metrics or demote a task name without scanning all series. The
+        # series themselves are indexed by their metric.
+        self.hostname_task_series: DefaultDict[str, Set[tuple]] = defaultdict(set)
+        self.name_task_series: DefaultDict[str, Set[tuple]] = defaultdict(set)
+        self.state = TaskTracker(
+            max_tasks=max_tasks_in_memory, task_ttl_seconds=task_ttl_seconds
+        )
         self.queue_cache = set(initial_queues or [])
-        self.worker_last_seen = {}
+        self.worker_last_seen = WorkerRegistry(
+            worker_timeout_seconds, purge_offline_worker_metrics_seconds
+        )
         self.worker_timeout_seconds = worker_timeout_seconds
         self.purge_offline_worker_metrics_after_seconds = (
             purge_offline_worker_metrics_seconds
@@ -140,20 +306,32 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
             ["hostname", *self.static_label_keys],
             registry=self.registry,
         )
-        self.celery_task_runtime = Histogram(
+        # Native histograms are only exposed to scrapers negotiating the
+        # protobuf format, everyone else keeps getting the classic buckets.
+        self.native_histograms = native_histograms
+        histogram_kwargs: Dict[str, Any] = {}
+        if native_histograms:
+            histogram_kwargs = {
+                "native_schema": native_histogram_schema,
+                "native_zero_threshold": native_histogram_zero_threshold,
+            }
+        histogram_class = ExponentialHistogram if native_histograms else Histogram
+        self.celery_task_runtime = histogram_class(
             f"{metric_prefix}task_runtime",
             "Histogram of task runtime measurements.",
             ["name", "hostname", "queue_name", *self.static_label_keys],
             registry=self.registry,
             buckets=buckets or Histogram.DEFAULT_BUCKETS,
+            **histogram_kwargs,
         )
-        self.celery_task_queue_wait_time = Histogram(
+        self.celery_task_queue_wait_time = histogram_class(
             f"{metric_prefix}task_queue_wait_time",
             "Histogram of the time tasks spend waiting in the queue before "
             "being executed, excluding deliberate ETA/countdown delay.",
             ["name", "hostname", "queue_name", *self.static_label_keys],
             registry=self.registry,
             buckets=queue_wait_buckets or DEFAULT_QUEUE_WAIT_BUCKETS,
+            **histogram_kwargs,
         )
         self.celery_queue_length = Gauge(
             f"{metric_prefix}queue_length",
@@ -161,6 +339,39 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
             ["queue_name", *self.static_label_keys],
             registry=self.registry,
         )
+        # The priority steps of a redis queue are summed in celery_queue_length
+        self.celery_queue_length_by_priority = None
+        if queue_length_by_priority:
+            self.celery_queue_length_by_priority = Gauge(
+                f"{metric_prefix}queue_length_by_priority",
+                "The number of messages in a redis broker queue, per priority step.",
+                ["queue_name", "priority", *self.static_label_keys],
+                registry=self.registry,
+            )
+        # Only the management API tells the unacknowledged messages and bytes
+        self.rabbitmq_management_url = rabbitmq_management_url
+        self.rabbitmq_management: Optional[ManagementClient] = None
+        if rabbitmq_management_url:
+            self.celery_queue_messages_ready = Gauge(
+                f"{metric_prefix}queue_messages_ready",
+                "The number of messages in a rabbitmq queue ready to be delivered.",
+                ["queue_name", *self.static_label_keys],
+                registry=self.registry,
+            )
+            self.celery_queue_messages_unacknowledged = Gauge(
+                f"{metric_prefix}queue_messages_unacknowledged",
+                "The number of messages of a rabbitmq queue delivered to a worker but "
+                "not acknowledged yet.",
+                ["queue_name", *self.static_label_keys],
+                registry=self.registry,
+            )
+            self.celery_queue_message_bytes = Gauge(
+                f"{metric_prefix}queue_message_bytes",
+                "The size of the bodies of the messages in a rabbitmq queue, ready and "
+                "unacknowledged, in bytes.",
+                ["queue_name", *self.static_label_keys],
+                registry=self.registry,
+            )
         self.celery_active_consumer_count = Gauge(
             f"{metric_prefix}active_consumer_count",
             "The number of active consumer in broker queue.",
@@ -179,16 +390,337 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
             ["queue_name", *self.static_label_keys],
             registry=self.registry,
         )
+        self.event_buffer_events = Gauge(
+            f"{metric_prefix}exporter_event_buffer_events",
+            "The number of received events waiting to be applied to the metrics.",
+            [*self.static_label_keys],
+            registry=self.registry,
+        )
+        self.events_dropped = Counter(
+            f"{metric_prefix}exporter_events_dropped",
+            "The number of received events discarded because the event buffer was full.",
+            [*self.static_label_keys],
+            registry=self.registry,
+        )
+        self.series_folded = Counter(
+            f"{metric_prefix}exporter_series_folded",
+            "The number of times a new series was folded into the __overflow__ series "
+            "because its metric reached its series budget, or its task name isn't among "
+            "the top task names.",
+            ["metric", *self.static_label_keys],
+            registry=self.registry,
+        )
+        self.series_dropped = Counter(
+            f"{metric_prefix}exporter_series_dropped",
+            "The number of series removed because their task name dropped out of the "
+            "top task names.",
+            ["metric", *self.static_label_keys],
+            registry=self.registry,
+        )
+
+        # Cardinality limits. Budgets are given per metric name without the prefix.
+        self.series_limiter = SeriesLimiter(
+            max_series_per_metric,
+            {
+                f"{metric_prefix}{name}": limit
+                for name, limit in (series_limits or {}).items()
+            },
+        )
+        self.heavy_hitters = HeavyHitters(top_task_names) if top_task_names else None
+        self.task_metrics = [
+            *self.state_counters.values(),
+            self.celery_task_runtime,
+            self.celery_task_queue_wait_time,
+        ]
+        # The metrics with series labeled with a worker's hostname
+        self.worker_metrics = [
+            self.celery_worker_up,
+            self.worker_tasks_active,
+            *self.task_metrics,
+        ]
+        for metric in self.worker_metrics:
+            index_by_labels(
+                metric,
+                ["hostname", "name"] if metric in self.task_metrics else ["hostname"],
+            )
+        # The counters every TaskSeries creates up front
+        self.eager_counters = [
+            counter
+            for counter_name, counter in self.state_counters.items()
+            if counter_name != "task-sent"
+        ]
+
+        self.handlers = {
+            "worker-heartbeat": self.track_worker_heartbeat,
+            "worker-online": lambda event: self.track_worker_status(event, True),
+            "worker-offline": lambda event: self.track_worker_status(event, False),
+        }
+        for key in self.state_counters:
+            self.handlers[key] = self.track_task_event
+
+        self.record_events: Optional[str] = None
+        self.event_buffer = None
+        self.event_batch_size = event_batch_size
+        self.batch_events = batch_events
+        self.batch: Optional[MetricBatch] = None
+        self.batch_factory: Callable[[], MetricBatch] = MetricBatch
+        self.series_factory: Callable[..., Any] = TaskSeries
+
+        # With more than one shard, task events are handled by that many
+        # consumer processes, each taking the tasks whose uuid hashes to it.
+        self.shards = shards
+        self.shard: Optional[int] = None
+        self.shard_depths: Dict[int, int] = {}
+        self.shard_dropped: Dict[int, int] = {}
+        self.shard_tasks: Dict[int, int] = {}
+        if shards > 1 and event_buffer_size <= 0:
+            raise ValueError("Sharding requires an event buffer")
+        if event_buffer_size > 0:
+            events_dropped = static_child(self.events_dropped, self.static_label)
+            self.event_buffer = EventBuffer(
+                event_buffer_size, event_buffer_overflow, on_drop=events_dropped.inc
+            )
+            static_child(self.event_buffer_events, self.static_label).set_function(
+                self.event_buffer.__len__
+            )
+
+        # The exporter's own metrics, to tell whether it keeps up
+        self.pipeline_metrics: Any = None
+        if self_metrics:
+            self.pipeline_metrics = PipelineMetrics(
+                metric_prefix, self.static_label, self.registry
+            )
+            static_child(
+                self.pipeline_metrics.tracked_tasks, self.static_label
+            ).set_function(lambda: len(self.state) + sum(self.shard_tasks.values()))
+            static_child(
+                self.pipeline_metrics.tracked_workers, self.static_label
+            ).set_function(lambda: len(self.state.workers))
+            self.handlers = self.instrument_handlers(self.handlers)
+
+        # The concurrency and queues of the workers, for the queue metrics
+        self.worker_topology = WorkerTopology(
+            worker_topology_interval, inspect_timeout, worker_topology_from_events
+        )
+
+        # Long-lived connections for the queue metrics and /health. The
+        # connections are opened on first use, app is only set in run().
+        self.broker_pool = BrokerPool(
+            lambda: self.app.connection(),  # type: ignore # pylint: disable=unnecessary-lambda
+            metric_prefix,
+            self.static_label,
+            self.registry,
+            size=broker_pool_size,
+            max_idle=broker_pool_max_idle,
+            max_age=broker_pool_max_age,
+        )
+
+        # With a poll interval, the queue metrics are collected in the
+        # background and scrapes serve the last values
+        self.queue_poller = None
+        if queue_poll_interval > 0:
+            self.queue_poller = QueuePoller(
+                self.track_queue_metrics,
+                queue_poll_interval,
+                metric_prefix,
+                self.static_label,
+                self.registry,
+            )
+
+        # The metric families of /metrics?group=, so that a scrape job can ask
+        # for a part of the metrics, at its own interval
+        queue_metrics = [
+            self.celery_queue_length,
+            self.celery_queue_length_by_priority,
+            self.celery_active_consumer_count,
+            self.celery_active_worker_count,
+            self.celery_active_process_count,
+        ]
+        if rabbitmq_management_url:
+            queue_metrics += [
+                self.celery_queue_messages_ready,
+                self.celery_queue_messages_unacknowledged,
+                self.celery_queue_message_bytes,
+            ]
+        self.metric_groups = {
+            "tasks": self.task_metrics,
+            "workers": [self.celery_worker_up, self.worker_tasks_active],
+            "queues": [metric for metric in queue_metrics if metric is not None],
+            "exporter": [
+                collector
+                for collector in self.registry._collector_to_names
+                if getattr(collector, "_name", "").startswith(
+                    f"{metric_prefix}exporter_"
+                )
+            ],
+        }
+
+        # Count the series per label value of every metric for /debug/cardinality
+        for metric in list(self.registry._collector_to_names):
+            if getattr(metric, "_labelnames", None):
+                count_label_values(metric)
+
+    def scrape(self, selection=None):
+        """Collect the metrics that aren't updated from events, only those
+        of the groups of metrics that are part of the selection if given."""
 
-    def scrape(self):
+        def selected(*groups):
+            return selection is None or any(
+                not selection.isdisjoint(self.metric_groups[group]) for group in groups
+            )
+
+        if self.heavy_hitters is not None and selected("tasks"):
+            with self.scrape_phase("rotate_task_names"):
+                self.rotate_task_names()
         if (
             self.worker_timeout_seconds > 0
             or self.purge_offline_worker_metrics_after_seconds > 0
+        ) and selected("workers", "tasks"):
+            with self.scrape_phase("track_timed_out_workers"):
+                self.track_timed_out_workers()
+        if self.queue_poller is None and selected("queues"):
+            with self.scrape_phase("track_queue_metrics"):
+                self.track_queue_metrics()
+
+    def cardinality_report(self, top=10):
+        """The series of every metric and the size of the exporter's own
+        structures, for /debug/cardinality."""
+        return {
+            "metrics": registry_cardinality(self.registry, top),
+            "worker_last_seen": {
+                "workers": len(self.worker_last_seen),
+                "deadlines": len(self.worker_last_seen.deadlines),
+            },
+            "queue_cache": len(self.queue_cache),
+            "state": {
+                "tasks": len(self.state) + sum(self.shard_tasks.values()),
+                "workers": len(self.state.workers),
+            },
+            "task_series_cache": len(self.task_series_cache),
+            "event_buffer": (
+                len(self.event_buffer) if self.event_buffer is not None else 0
+            ),
+        }
+
+    def scrape_phase(self, phase):
+        if self.pipeline_metrics is None:
+            return nullcontext()
+        return self.pipeline_metrics.scrape_phase(phase).time()
+
+    def track_changes(self, handlers):
+        """Wrap the event handlers to bump the generation once an event was
+        applied, for the handlers that the event receiver calls itself."""
+
+        def tracked(handler):
+            def apply(event):
+                try:
+                    handler(event)
+                finally:
+                    self.generation += 1
+
+            return apply
+
+        return {
+            event_type: tracked(handler) for event_type, handler in handlers.items()
+        }
+
+    def instrument_handlers(self, handlers):
+        """Wrap the event handlers to count the events, and observe how long
+        their handler took and how long ago they were sent."""
+        return {
+            event_type: self.instrument_handler(event_type, handler)
+            for event_type, handler in handlers.items()
+        }
+
+    def instrument_handler(self, event_type, handler):
+        received = self.pipeline_metrics.received(event_type)
+        duration = self.pipeline_metrics.duration(event_type)
+        lag = self.pipeline_metrics.lag()
+
+        def instrumented(event):
+            self.inc(received)
+            started = time.perf_counter()
+            try:
+                handler(event)
+            finally:
+                self.observe(duration, time.perf_counter() - started)
+            timestamp = event.get("timestamp")
+            if timestamp is not None:
+                sent = reverse_adjust_timestamp(timestamp, event.get("utcoffset"))
+                # clock skew between the cluster and the exporter can push this negative
+                self.observe(lag, max(0.0, time.time() - sent))
+
+        return instrumented
+
+    def series_child(self, metric, labels):
+        """The child of a task metric, folded into the overflow series when the
+        metric is over its series budget. Returns the child and whether it
+        was folded."""
+        if self.series_limiter.admits(metric, labels):
+            return metric.labels(**labels), False
+        folded = overflow_labels(labels)
+        if folded != labels:
+            self.count_folded(metric, labels)
+        return metric.labels(**folded), True
+
+    def count_folded(self, metric, labels):
+        """Count a label set folded into the overflow series of a metric once,
+        however many events it has."""
+        key = (metric._name, *(str(labels[name]) for name in metric._labelnames))
+        if key not in self.folded_series:
+            self.folded_series[key] = None
+            if len(self.folded_series) > MAX_FOLDED_SERIES:
+                self.folded_series.popitem(last=False)
+            self.series_folded.labels(metric=metric._name, **self.static_label).inc()
+
+    def fold_task_name(self, name, events=1):
+        """Count events of a task name, folding names outside of the top task
+        names into the overflow name."""
+        if self.heavy_hitters is None or name is None:
+            return name
+        if self.heavy_hitters.hit(name, events):
+            return name
+        return OVERFLOW_LABEL
+
+    def rotate_task_names(self):
+        demoted = self.heavy_hitters.rotate()  # type: ignore
+        for name in demoted:
+            logger.info("Task name='{}' demoted from the top task names", name)
+            for metric in self.task_metrics:
+                for label_seq in label_keys(metric, "name", name):
+                    metric.remove(*label_seq)
+                    self.series_dropped.labels(
+                        metric=metric._name, **self.static_label
+                    ).inc()
+            for key in self.name_task_series.pop(name, ()):
+                self.forget_task_series(key)
+            self.generation += 1
+        if demoted:
+            self.unfold_task_series()
+
+    def forget_task_series(self, key):
+        self.task_series_cache.pop(key, None)
+        for index, value in (
+            (self.name_task_series, key[0]),
+            (self.hostname_task_series, key[1]),
         ):
-            self.track_timed_out_workers()
-        self.track_queue_metrics()
+            keys = index.get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del index[value]
+
+    def unfold_task_series(self):
+        """Resolve the folded children of the cached TaskSeries again, once
+        series were removed."""
+        keys, self.folded_task_series = self.folded_task_series, set()
+        for key in keys:
+            series = self.task_series_cache.get(key)
+            if series is not None:
+                series.unfold()
 
     def forget_worker(self, hostname):
+        self.worker_topology.host_timed_out(hostname)
         if hostname in self.worker_last_seen:
             self.celery_worker_up.labels(hostname=hostname, **self.static_label).set(0)
             self.worker_tasks_active.labels(hostname=hostname, **self.static_label).set(
@@ -200,7 +732,8 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
             logger.debug(
                 "Updated gauge='{}' value='{}'", self.celery_worker_up._name, 0
             )
-            self.worker_last_seen[hostname]["forgotten"] = True
+            self.worker_last_seen[hostname].forgotten = True
+            self.generation += 1
 
             # If purging of metrics is enabled we should keep the last seen so that we can
             # use the timestamp to purge the metrics later
@@ -208,53 +741,39 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
                 del self.worker_last_seen[hostname]
 
     def purge_worker_metrics(self, hostname):
-        # Prometheus stores a copy of the metrics in memory, so we need to remove them
-        # The key of the metrics is a string sequence e.g ('celery(queue_name)', 'host-1(hostname)')
-        for label_seq in list(self.worker_tasks_active._metrics.keys()):
-            if hostname in label_seq:
-                self.worker_tasks_active.remove(*label_seq)
-
-        for label_seq in list(self.celery_worker_up._metrics.keys()):
-            if hostname in label_seq:
-                self.celery_worker_up.remove(*label_seq)
-
-        for counter in self.state_counters.values():
-            for label_seq in list(counter._metrics.keys()):
-                if hostname in label_seq:
-                    counter.remove(*label_seq)
-
-        for label_seq in list(self.celery_task_runtime._metrics.keys()):
-            if hostname in label_seq:
-                self.celery_task_runtime.remove(*label_seq)
-
-        for label_seq in list(self.celery_task_queue_wait_time._metrics.keys()):
-            if hostname in label_seq:
-                self.celery_task_queue_wait_time.remove(*label_seq)
+        # Prometheus stores a copy of the metrics in memory, so we need to remove them.
+        # Only the series labeled with the hostname are removed, not the ones
+        # where it happens to be the value of another label, like the task name.
+        for metric in self.worker_metrics:
+            for label_seq in label_keys(metric, "hostname", hostname):
+                metric.remove(*label_seq)
+
+        for key in self.hostname_task_series.pop(hostname, ()):
+            self.forget_task_series(key)
+        self.unfold_task_series()
+        self.generation += 1
 
         del self.worker_last_seen[hostname]
 
     def track_timed_out_workers(self):
         now = time.time()
-        # Make a copy of the last seen dict so we can delete from the dict with no issues
-        for hostname, worker_status in list(self.worker_last_seen.items()):
-            since = now - worker_status["ts"]
-            if since > self.worker_timeout_seconds and not worker_status["forgotten"]:
+        for action, worker in self.worker_last_seen.due(now):
+            since = now - worker.ts
+            if action == TIMEOUT:
                 logger.info(
-                    f"Have not seen {hostname} for {since:0.2f} seconds. "
+                    f"Have not seen {worker.hostname} for {since:0.2f} seconds. "
                     "Removing from metrics"
                 )
-                self.forget_worker(hostname)
-
-            if self.purge_offline_worker_metrics_after_seconds > 0:
-                if since > self.purge_offline_worker_metrics_after_seconds:
-                    logger.info(
-                        f"Have not seen {hostname} for {since:0.2f} seconds. "
-                        "Purging worker metrics"
-                    )
-                    self.purge_worker_metrics(hostname)
+                self.forget_worker(worker.hostname)
+            elif action == PURGE:
+                logger.info(
+                    f"Have not seen {worker.hostname} for {since:0.2f} seconds. "
+                    "Purging worker metrics"
+                )
+                self.purge_worker_metrics(worker.hostname)
 
     def track_queue_metrics(self):
-        with self.app.connection() as connection:  # type: ignore
+        with self.broker_pool.acquire() as connection:
             transport = connection.info()["transport"]
             acceptable_transports = [
                 "redis",
@@ -270,82 +789,189 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
                 )
                 return
 
-            concurrency_per_worker = {
-                worker: len(stats["pool"].get("processes", []))
-                for worker, stats in (self.app.control.inspect().stats() or {}).items()
-            }
+            concurrency_per_worker, queues_per_worker = self.worker_topology.get(
+                self.app
+            )
             processes_per_queue = defaultdict(int)
             workers_per_queue = defaultdict(int)
 
             # request workers to response active queues
             # we need to cache queue info in exporter in case all workers are offline
             # so that no worker response to exporter will make active_queues return None
-            queues = self.app.control.inspect().active_queues() or {}
-            for worker, info_list in queues.items():
-                for queue_info in info_list:
-                    name = queue_info["name"]
+            for worker, names in queues_per_worker.items():
+                for name in names:
                     self.queue_cache.add(name)
                     workers_per_queue[name] += 1
                     processes_per_queue[name] += concurrency_per_worker.get(worker, 0)
 
-            for queue in self.queue_cache:
-                if transport in ["amqp", "amqps", "memory"]:
+            # The gauges are only set once every value was collected, so that a
+            # failure half way leaves all of them at their previous values
+            # rather than mixing two collections.
+            values = []
+            queues = list(self.queue_cache)
+            # The lengths of all redis queues are asked for in one round trip
+            priority_lengths = {}
+            if transport in REDIS_TRANSPORTS:
+                priority_lengths = redis_queue_lengths(connection, queues)
+            # and those of all rabbitmq queues in a call per page of queues
+            queue_stats = None
+            if self.rabbitmq_management_url and transport in ["amqp", "amqps"]:
+                queue_stats = self.management_client(connection).queue_stats(
+                    connection.virtual_host
+                )
+            for queue in queues:
+                labels = {"queue_name": queue}
+                stats = None
+                if queue_stats is not None:
+                    stats = queue_stats.get(queue, MISSING_QUEUE)
+                    values.append(
+                        (self.celery_active_consumer_count, labels, stats.consumers)
+                    )
+                    for gauge, value in (
+                        (self.celery_queue_messages_ready, stats.messages_ready),
+                        (
+                            self.celery_queue_messages_unacknowledged,
+                            stats.messages_unacknowledged,
+                        ),
+                        (self.celery_queue_message_bytes, stats.message_bytes),
+                    ):
+                        values.append((gauge, labels, value))
+                elif transport in ["amqp", "amqps", "memory"]:
                     consumer_count = rabbitmq_queue_consumer_count(connection, queue)
-                    self.celery_active_consumer_count.labels(
-                        queue_name=queue, **self.static_label
-                    ).set(consumer_count)
-
-                self.celery_active_process_count.labels(
-                    queue_name=queue, **self.static_label
-                ).set(processes_per_queue[queue])
-                self.celery_active_worker_count.labels(
-                    queue_name=queue, **self.static_label
-                ).set(workers_per_queue[queue])
-                length = queue_length(transport, connection, queue)
-                if length is not None:
-                    self.celery_queue_length.labels(
-                        queue_name=queue, **self.static_label
-                    ).set(length)
+                    values.append(
+                        (self.celery_active_consumer_count, labels, consumer_count)
+                    )
 
-    def track_task_event(self, event):
-        self.state.event(event)
-        task = self.state.tasks.get(event["uuid"])
-        logger.debug("Received event='{}' for task='{}'", event["type"], task.name)
+                values.append(
+                    (
+                        self.celery_active_process_count,
+                        labels,
+                        processes_per_queue[queue],
+                    )
+                )
+                values.append(
+                    (self.celery_active_worker_count, labels, workers_per_queue[queue])
+                )
+                if queue in priority_lengths:
+                    length = sum(priority_lengths[queue].values())
+                    if self.celery_queue_length_by_priority is not None:
+                        for priority, count in priority_lengths[queue].items():
+                            values.append(
+                                (
+                                    self.celery_queue_length_by_priority,
+                                    {**labels, "priority": str(priority)},
+                                    count,
+                                )
+                            )
+                elif stats is not None:
+                    # like the message count of a passive queue_declare
+                    length = stats.messages_ready
+                else:
+                    length = queue_length(transport, connection, queue)
+                if length is not None:
+                    values.append((self.celery_queue_length, labels, length))
+
+            changed = False
+            for gauge, labels, value in values:
+                labels = {**labels, **self.static_label}
+                # a new series is a change even if it is zero
+                new = (
+                    tuple(str(labels[name]) for name in gauge._labelnames)
+                    not in gauge._metrics
+                )
+                child = gauge.labels(**labels)
+                if new or child._value.get() != value:
+                    child.set(value)
+                    changed = True
+            if changed:
+                self.generation += 1
+
+    def management_client(self, connection):
+        if self.rabbitmq_management is None:
+            self.rabbitmq_management = ManagementClient(
+                self.rabbitmq_management_url, connection.userid, connection.password
+            )
+        return self.rabbitmq_management
 
-        if event["type"] not in self.state_counters:
-            logger.warning("No counter matches task state='{}'", task.state)
+    def inc(self, child):
+        if self.batch is None:
+            child.inc()
+        else:
+            self.batch.inc(child)
 
+    def observe(self, child, amount):
+        if self.batch is None:
+            child.observe(amount)
+        else:
+            self.batch.observe(child, amount)
+
+    def task_series(self, name, hostname, queue_name) -> "TaskSeries":
+        key = (name, hostname, queue_name)
+        series = self.task_series_cache.get(key)
+        if series is not None:
+            return series
+        if all(self.series_limiter.full(counter) for counter in self.eager_counters):
+            # A new label set would only get overflow counters. Rather than
+            # resolving them on every event of a flood of new label values, it
+            # shares the TaskSeries of the overflow label set, along with its
+            # histograms. Label sets are admitted again once there's room.
+            self.fold_label_set(key)
+            key = (OVERFLOW_LABEL,) * 3
+            series = self.task_series_cache.get(key)
+            if series is not None:
+                return series
+        # Every other series has at least one child of its own, so that the
+        # cache is bounded by the budgets
+        series = self.task_series_cache[key] = self.series_factory(self, *key)
+        self.hostname_task_series[key[1]].add(key)
+        self.name_task_series[key[0]].add(key)
+        return series
+
+    def fold_label_set(self, key):
         labels = {
-            "name": task.name,
-            "hostname": get_hostname(task.hostname),
-            "queue_name": getattr(task, "queue", self.default_queue_name),
+            "name": key[0],
+            "hostname": key[1],
+            "queue_name": key[2],
+            "exception": "",
             **self.static_label,
         }
-        if event["type"] == "task-sent":
-            if self.generic_hostname_task_sent_metric:
-                labels["hostname"] = "generic"
-        elif self.generic_hostname_worker_task_metric:
-            labels["hostname"] = "generic"
+        for counter in self.eager_counters:
+            self.count_folded(counter, labels)
 
-        for counter_name, counter in self.state_counters.items():
-            _labels = labels.copy()
-
-            if counter_name == "task-failed":
-                if counter_name == event["type"]:
-                    _labels["exception"] = get_exception_class_name(task.exception)
-                else:
-                    _labels["exception"] = ""
+    def track_task_event(self, event):
+        task = self.state.task_event(event)
+        event_type = event["type"]
+        logger.debug("Received event='{}' for task='{}'", event_type, task.name)
 
-            if counter_name == event["type"]:
-                counter.labels(**_labels).inc()
-                logger.debug(
-                    "Incremented metric='{}' labels='{}'", counter._name, labels
-                )
-            elif counter_name != "task-sent":
-                # instantiate unaffected counters by zero in order to make them visible
-                # task-sent is sent by various hosts (webservers, task creators)
-                # this causes label cardinality, therefore we do not want to instantiate the counter
-                counter.labels(**_labels).inc(0)
+        if event_type == "task-sent":
+            if self.generic_hostname_task_sent_metric:
+                hostname = "generic"
+            else:
+                hostname = get_hostname(task.hostname)
+        elif self.generic_hostname_worker_task_metric:
+            hostname = "generic"
+        else:
+            hostname = get_hostname(task.hostname)
+        series = self.task_series(
+            self.fold_task_name(task.name),
+            hostname,
+            task.queue or self.default_queue_name,
+        )
+        if event_type == "task-failed":
+            child = series.failed(get_exception_class_name(task.exception))
+        elif event_type in self.state_counters:
+            child = series.counter(event_type)
+        else:
+            child = None
+            logger.warning("No counter matches task state='{}'", task.state)
+        if child is not None:
+            self.inc(child)
+            counter = self.state_counters[event_type]
+            logger.debug(
+                "Incremented metric='{}' labels='{}'",
+                counter._name,
+                series.labels_of(counter),
+            )
 
         # observe queue wait time, excluding deliberate delay: countdown and
         # retry backoff are delivered as an ETA
@@ -360,21 +986,21 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
                 baseline = max(baseline, eta_timestamp)
             # clock skew between producer and worker can push this negative
             queue_wait_time = max(0.0, task.started - baseline)
-            self.celery_task_queue_wait_time.labels(**labels).observe(queue_wait_time)
+            self.observe(series.queue_wait_time(), queue_wait_time)
             logger.debug(
                 "Observed metric='{}' labels='{}': {}s",
                 self.celery_task_queue_wait_time._name,
-                labels,
+                series.labels_of(self.celery_task_queue_wait_time),
                 queue_wait_time,
             )
 
         # observe task runtime
         if event["type"] == "task-succeeded":
-            self.celery_task_runtime.labels(**labels).observe(task.runtime)
+            self.observe(series.runtime(), task.runtime)
             logger.debug(
                 "Observed metric='{}' labels='{}': {}s",
                 self.celery_task_runtime._name,
-                labels,
+                series.labels_of(self.celery_task_runtime),
                 task.runtime,
             )
 
@@ -385,27 +1011,30 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
         logger.debug("Received event='{}' for hostname='{}'", event_name, hostname)
 
         if is_online:
+            self.worker_topology.worker_online(event["hostname"])
             self.celery_worker_up.labels(hostname=hostname, **self.static_label).set(
                 value
             )
-            self.worker_last_seen[hostname] = {
-                "ts": reverse_adjust_timestamp(
-                    event["timestamp"], event.get("utcoffset")
-                ),
-                "forgotten": False,
-            }
+            self.worker_last_seen.seen(
+                hostname,
+                reverse_adjust_timestamp(event["timestamp"], event.get("utcoffset")),
+            )
         else:
+            self.worker_topology.worker_offline(event["hostname"])
             self.forget_worker(hostname)
 
     def track_worker_heartbeat(self, event):
         hostname = get_hostname(event["hostname"])
         logger.debug("Received event='{}' for worker='{}'", event["type"], hostname)
 
-        self.worker_last_seen[hostname] = {
-            "ts": reverse_adjust_timestamp(event["timestamp"], event.get("utcoffset")),
-            "forgotten": False,
-        }
-        worker_state = self.state.event(event)[0][0]
+        # a worker whose worker-online event was missed, e.g. when it came up
+        # before the exporter
+        self.worker_topology.worker_seen(event["hostname"])
+        self.worker_last_seen.seen(
+            hostname,
+            reverse_adjust_timestamp(event["timestamp"], event.get("utcoffset")),
+        )
+        worker_state = self.state.worker_event(event)
         active = worker_state.active or 0
         up = 1 if worker_state.alive else 0
         self.celery_worker_up.labels(hostname=hostname, **self.static_label).set(up)
@@ -417,6 +1046,184 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
         )
         logger.debug("Updated gauge='{}' value='{}'", self.celery_worker_up._name, up)
 
+    def ingest_event(self, event):
+        # Runs on the consumer thread, anything slow belongs in apply_event()
+        if event["type"] not in self.handlers:
+            return
+        if (
+            self.shard is not None
+            and "uuid" in event
+            and shard_of(event["uuid"], self.shards) != self.shard
+        ):
+            return
+        self.event_buffer.put(event)  # type: ignore
+
+    def apply_event(self, event):
+        try:
+            self.handlers[event["type"]](event)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Failed to apply event='{}'", event["type"])
+
+    def apply_batch(self, events):
+        """Apply events, committing their counter increments and histogram
+        observations once per metric child rather than once per event."""
+        self.batch = self.batch_factory()
+        try:
+            for event in events:
+                self.apply_event(event)
+        finally:
+            batch, self.batch = self.batch, None
+            batch.commit()
+            self.generation += 1
+
+    def apply_drained(self, events):
+        """Apply events drained from the event buffer, in a batch with
+        batch_events, otherwise one by one like without a buffer."""
+        if self.batch_events:
+            self.apply_batch(events)
+            return
+        try:
+            for event in events:
+                self.apply_event(event)
+        finally:
+            self.generation += 1
+
+    def apply_events(self):
+        while True:
+            self.apply_drained(self.event_buffer.drain(self.event_batch_size))  # type: ignore
+
+    def become_shard(self, shard, shard_queue):
+        """Turn this exporter into the consumer of one shard of the task events.
+
+        A shard handles the task events of its share of the tasks, but rather
+        than updating metrics it sends the increments and observations of
+        every batch to the main process, which owns the metrics. The first
+        shard also forwards the worker events. Shards always batch events.
+        """
+        self.shard = shard
+        self.batch_events = True
+        self.task_series_cache = {}
+        # the main process picks the top task names from the events of all shards
+        self.heavy_hitters = None
+        self.series_factory = ShardTaskSeries
+        self.batch_factory = lambda: ShardBatch(
+            shard, shard_queue, self.event_buffer, self.state
+        )
+        self.handlers = {key: self.track_task_event for key in self.state_counters}
+        if self.pipeline_metrics is not None:
+            # worker events are instrumented when the main process applies them
+            self.pipeline_metrics = ShardPipelineMetrics()
+            self.handlers = self.instrument_handlers(self.handlers)
+        if shard == 0:
+            for key in ("worker-heartbeat", "worker-online", "worker-offline"):
+                self.handlers[key] = self.forward_event
+
+    def forward_event(self, event):
+        self.batch.forward(event)  # type: ignore
+
+    def run_shard(self, shard, shard_queue):
+        self.become_shard(shard, shard_queue)
+        Thread(target=self.apply_events, name="apply-events", daemon=True).start()
+        with self.app.connection() as connection:  # type: ignore
+            self.capture_events(connection, {"*": self.ingest_event})
+
+    def start_shards(self):
+        # Forked before the exporter starts any threads or connections
+        context = multiprocessing.get_context("fork")
+        shard_queue = context.Queue()
+        processes = []
+        for shard in range(self.shards):
+            process = context.Process(
+                target=self.run_shard,
+                args=(shard, shard_queue),
+                name=f"celery-exporter-shard-{shard}",
+                daemon=True,
+            )
+            process.start()
+            processes.append(process)
+        logger.info("Started {} event consumer shards", self.shards)
+        static_child(self.event_buffer_events, self.static_label).set_function(
+            lambda: sum(self.shard_depths.values())
+        )
+        return shard_queue, processes
+
+    def apply_shard_batch(self, message):
+        shard, increments, observations, events, depth, dropped, tasks = message
+        self.batch = MetricBatch()
+        try:
+            for token, amount in increments.items():
+                token = self.fold_token(token, amount)
+                self.batch.increments[resolve_token(self, token)] += amount
+            for token, amounts in observations.items():
+                token = self.fold_token(token, 0)
+                self.batch.observations[resolve_token(self, token)].extend(amounts)
+            for event in events:
+                self.apply_event(event)
+        finally:
+            batch, self.batch = self.batch, None
+            batch.commit()
+            self.generation += 1
+
+        self.shard_depths[shard] = depth
+        self.shard_tasks[shard] = tasks
+        if dropped > self.shard_dropped.get(shard, 0):
+            static_child(self.events_dropped, self.static_label).inc(
+                dropped - self.shard_dropped.get(shard, 0)
+            )
+            self.shard_dropped[shard] = dropped
+
+    def fold_token(self, token, events):
+        if token[0] is None:
+            return token
+        (name, *key), method, argument = token
+        return ((self.fold_task_name(name, events), *key), method, argument)
+
+    def consume_shards(self, shard_queue, processes):
+        while True:
+            for process in processes:
+                if not process.is_alive():
+                    raise RuntimeError(
+                        f"Shard process '{process.name}' exited with "
+                        f"exit code {process.exitcode}"
+                    )
+            try:
+                message = shard_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            self.apply_shard_batch(message)
+
+    def capture_events(self, connection, handlers):
+        # every shard receives all events, the first one records them
+        if self.record_events is None or self.shard not in (None, 0):
+            self.receive_events(connection, handlers)
+            return
+        logger.info("Recording events to '{}'", self.record_events)
+        recorder = EventRecorder(self.record_events)
+        try:
+            self.receive_events(connection, recorder.wrap(handlers))
+        finally:
+            recorder.close()
+
+    def receive_events(self, connection, handlers):
+        while True:
+            try:
+                recv = self.app.events.Receiver(connection, handlers=handlers)  # type: ignore
+                recv.capture(limit=None, timeout=None, wakeup=True)  # type: ignore
+
+            except (KeyboardInterrupt, SystemExit) as ex:
+                raise ex
+
+            except Exception as e:  # pylint: disable=broad-except
+                logger.exception(
+                    "celery-exporter exception '{}', retrying in {} seconds.",
+                    str(e),
+                    self.retry_interval,
+                )
+                if self.retry_interval == 0:
+                    raise e
+
+            time.sleep(self.retry_interval)
+
     def run(self, click_params):
         logger.remove()
         logger.add(sys.stdout, level=click_params["log_level"])
@@ -452,18 +1259,17 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
         if ssl_options is not None:
             self.app.conf["broker_use_ssl"] = ssl_options
 
-        self.state = self.app.events.State()  # type: ignore
         self.retry_interval = click_params["retry_interval"]
+        self.record_events = click_params.get("record_events")
         if self.retry_interval:
             logger.debug("Using retry_interval of {} seconds", self.retry_interval)
 
-        handlers = {
-            "worker-heartbeat": self.track_worker_heartbeat,
-            "worker-online": lambda event: self.track_worker_status(event, True),
-            "worker-offline": lambda event: self.track_worker_status(event, False),
-        }
-        for key in self.state_counters:
-            handlers[key] = self.track_task_event
+        if self.shards > 1:
+            shard_queue, processes = self.start_shards()
+        handlers = self.track_changes(self.handlers)
+        if self.event_buffer is not None and self.shards <= 1:
+            Thread(target=self.apply_events, name="apply-events", daemon=True).start()
+            handlers = {"*": self.ingest_event}
 
         with self.app.connection() as connection:  # type: ignore
             start_http_server(
@@ -472,25 +1278,21 @@ class Exporter:  # pylint: disable=too-many-instance-attributes,too-many-branche
                 click_params["host"],
                 click_params["port"],
                 self.scrape,
+                protobuf=self.native_histograms,
+                debug_endpoints=click_params.get("debug_endpoints", False),
+                debug_token=click_params.get("debug_token"),
+                cardinality=self.cardinality_report,
+                broker_pool=self.broker_pool,
+                metrics_cache_max_age=click_params.get("metrics_cache_max_age", 0),
+                registry_version=lambda: self.generation,
+                metric_groups=self.metric_groups,
             )
-            while True:
-                try:
-                    recv = self.app.events.Receiver(connection, handlers=handlers)  # type: ignore
-                    recv.capture(limit=None, timeout=None, wakeup=True)  # type: ignore
-
-                except (KeyboardInterrupt, SystemExit) as ex:
-                    raise ex
-
-                except Exception as e:  # pylint: disable=broad-except
-                    logger.exception(
-                        "celery-exporter exception '{}', retrying in {} seconds.",
-                        str(e),
-                        self.retry_interval,
-                    )
-                    if self.retry_interval == 0:
-                        raise e
-
-                time.sleep(self.retry_interval)
+            if self.queue_poller is not None:
+                self.queue_poller.start()
+            if self.shards > 1:
+                self.consume_shards(shard_queue, processes)
+            else:
+                self.capture_events(connection, handlers)
 
 
 exception_pattern = re.compile(r"^(\w+)\(")
@@ -503,6 +1305,29 @@ def reverse_adjust_timestamp(
     return ts + ((offset or 0) - here()) * 3600
 
 
+def overflow_labels(labels):
+    """The labels of the overflow series that a child with the labels is
+    folded into."""
+    return {
+        **labels,
+        **{
+            label: OVERFLOW_LABEL
+            for label in ("name", "hostname", "queue_name", "exception")
+            if label in labels
+        },
+    }
+
+
+def static_child(metric, static_label):
+    """The child of a metric that is only labeled with the static labels."""
+    return metric.labels(**static_label) if static_label else metric
+
+
+def intern_label(value):
+    """Intern label values, which are repeated across many series and events."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 def get_exception_class_name(exception_name: str):
     m = exception_pattern.match(exception_name)
     if m:
@@ -544,8 +1369,26 @@ def transform_option_value(value: str):
         return value
 
 
+def redis_queue_lengths(connection, queues) -> Dict[str, Dict[int, int]]:
+    """The length of every priority step of the queues, in one pipeline.
+
+    kombu keeps the messages of a queue in a list per priority step, named
+    after the queue and the step, e.g. "celery\x06\x163" for priority 3, and
+    prefixes all keys with its global_keyprefix transport option. The
+    channel's client applies the prefix, and names the lists like kombu does.
+    """
+    channel = connection.default_channel
+    steps = list(channel.priority_steps)
+    with channel.client.pipeline(transaction=False) as pipe:
+        for queue in queues:
+            for step in steps:
+                pipe.llen(channel._q_for_pri(queue, step))
+        replies = iter(pipe.execute())
+    return {queue: {step: next(replies) for step in steps} for queue in queues}
+
+
 def redis_queue_length(connection, queue: str) -> int:
-    return connection.default_channel.client.llen(queue)
+    return sum(redis_queue_lengths(connection, [queue])[queue].values())
 
 
 def rabbitmq_queue_length(connection, queue: str) -> int:
@@ -555,7 +1398,7 @@ def rabbitmq_queue_length(connection, queue: str) -> int:
 
 
 def queue_length(transport, connection, queue: str) -> Optional[int]:
-    if transport in ["redis", "rediss", "sentinel"]:
+    if transport in REDIS_TRANSPORTS:
         return redis_queue_length(connection, queue)
 
     if transport in ["amqp", "amqps", "memory"]:
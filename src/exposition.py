@@ -0,0 +1,59 @@
+from typing import Iterable, Iterator
+
+from prometheus_client.openmetrics.exposition import CONTENT_TYPE_LATEST
+
+from .protobuf import PROTOBUF_CONTENT_TYPE, protobuf_families
+
+OPENMETRICS_MEDIA_TYPE = CONTENT_TYPE_LATEST.split(";", maxsplit=1)[0]
+OPENMETRICS_EOF = b"# EOF\n"
+# Families are written out in chunks of at least this size, rather than a
+# write per family
+CHUNK_SIZE = 64 * 1024
+
+
+class FamilyRegistry:  # pylint: disable=too-few-public-methods
+    """A single metric family, to encode with the encoders of the text
+    formats, which take a registry."""
+
+    def __init__(self, family):
+        self.family = family
+
+    def collect(self):
+        yield self.family
+
+
+def encode_families(registry, encoder, content_type) -> Iterator[bytes]:
+    """The exposition of a registry a metric family at a time, so that only
+    the family being encoded is held in memory rather than all of them.
+
+    OpenMetrics ends with a single # EOF line, which the encoder adds to the
+    exposition of every family.
+    """
+    if content_type == PROTOBUF_CONTENT_TYPE:
+        yield from protobuf_families(registry)
+        return
+    openmetrics = content_type.startswith(OPENMETRICS_MEDIA_TYPE)
+    for family in registry.collect():
+        output = encoder(FamilyRegistry(family))
+        if openmetrics:
+            output = output[: -len(OPENMETRICS_EOF)]
+        yield output
+    if openmetrics:
+        yield OPENMETRICS_EOF
+
+
+def chunked(outputs: Iterable[bytes], size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Join small outputs into chunks of at least size bytes.
+    >>> list(chunked([b"a", b"b", b"cde", b"f"], size=2))
+    [b'ab', b'cde', b'f']
+    """
+    buffer = []
+    buffered = 0
+    for output in outputs:
+        buffer.append(output)
+        buffered += len(output)
+        if buffered >= size:
+            yield b"".join(buffer)
+            buffer, buffered = [], 0
+    if buffer:
+        yield b"".join(buffer)
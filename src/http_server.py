@@ -1,11 +1,28 @@
-from threading import Lock, Thread
+import hmac
+import math
+from threading import Event, Lock, Thread
+from typing import Dict, FrozenSet, Optional
 
 import kombu.exceptions
-from flask import Blueprint, Flask, current_app, request
+from flask import Blueprint, Flask, current_app, jsonify, request
 from loguru import logger
 from prometheus_client.exposition import choose_encoder
 from waitress import serve
 
+from .exposition import chunked, encode_families
+from .introspection import registry_cardinality
+from .profiling import (
+    AllocationTracker,
+    Busy,
+    SamplingProfiler,
+    collapsed_stacks,
+    pstats_dump,
+    thread_stacks,
+)
+from .protobuf import PROTOBUF_CONTENT_TYPE, accepts_protobuf, generate_protobuf
+from .response_cache import ResponseCache, choose_encoding, compress_chunks
+from .selection import SelectedRegistry, UnknownGroup, select_collectors
+
 blueprint = Blueprint("celery_exporter", __name__)
 
 
@@ -36,6 +53,62 @@ class ScrapeStatus:
             return self._error
 
 
+class Collection:  # pylint: disable=too-few-public-methods
+    """A collection of the metrics in flight, and its outcome once done."""
+
+    def __init__(self):
+        self.done = Event()
+        self.error = None
+
+
+class SingleFlight:  # pylint: disable=too-few-public-methods
+    """Runs the metrics puller for concurrent scrapes once.
+
+    Waitress serves every request on a thread of its own, so Prometheus
+    replicas, federation and the odd curl arriving together would each
+    collect the metrics, with a round trip to the broker each. A scrape
+    that arrives while a collection is in flight waits for that collection
+    instead, and gets its result: the error it raised, or the metrics it
+    updated. The scrape status is recorded once per collection.
+
+    Scrapes of a selection of the metrics only join a collection of the same
+    selection.
+    """
+
+    def __init__(self, metrics_puller, scrape_status):
+        self.metrics_puller = metrics_puller
+        self.scrape_status = scrape_status
+        self._lock = Lock()
+        self._in_flight: Dict[Optional[FrozenSet], Collection] = {}
+
+    def __call__(self, selection=None):
+        with self._lock:
+            collection = self._in_flight.get(selection)
+            leader = collection is None
+            if leader:
+                collection = self._in_flight[selection] = Collection()
+        if leader:
+            try:
+                if selection is None:
+                    self.metrics_puller()
+                else:
+                    self.metrics_puller(selection)
+            except Exception as ex:  # pylint: disable=broad-except
+                collection.error = ex
+                self.scrape_status.record_failure(ex)
+                logger.exception("Failed to scrape metrics")
+            else:
+                self.scrape_status.record_success()
+            finally:
+                with self._lock:
+                    del self._in_flight[selection]
+                collection.done.set()
+        else:
+            collection.done.wait()
+        if collection.error is not None:
+            raise collection.error
+
+
 @blueprint.route("/")
 def index():
     return """
@@ -56,17 +129,42 @@ def index():
 
 @blueprint.route("/metrics")
 def metrics():
+    registry = current_app.config["registry"]
+    try:
+        selection = select_collectors(
+            registry,
+            request.args.getlist("name[]"),
+            request.args.getlist("group"),
+            current_app.config["metric_groups"],
+        )
+    except UnknownGroup as ex:
+        return (str(ex), 400)
     try:
-        current_app.config["metrics_puller"]()
+        current_app.config["scrape"](selection)
     except Exception as ex:  # pylint: disable=broad-except
-        current_app.config["scrape_status"].record_failure(ex)
-        logger.exception("Failed to scrape metrics")
         return (f"Failed to scrape metrics: {ex}", 500)
 
-    current_app.config["scrape_status"].record_success()
-    encoder, content_type = choose_encoder(request.headers.get("accept"))
-    output = encoder(current_app.config["registry"])
-    return output, 200, {"Content-Type": content_type}
+    accept = request.headers.get("accept")
+    if current_app.config["protobuf"] and accepts_protobuf(accept):
+        encoder, content_type = generate_protobuf, PROTOBUF_CONTENT_TYPE
+    else:
+        encoder, content_type = choose_encoder(accept)
+    if selection is not None:
+        registry = SelectedRegistry(registry, selection)
+    response_cache = current_app.config["response_cache"]
+    encoding = choose_encoding(request.headers.get("accept-encoding"))
+    headers = {"Content-Type": content_type, "Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    if response_cache.max_age <= 0:
+        # Without a cache there is no need for the whole exposition at once,
+        # the families are written out as they are encoded instead
+        body = chunked(encode_families(registry, encoder, content_type))
+        if encoding is not None:
+            body = compress_chunks(body, encoding)
+        return body, 200, headers
+    response = response_cache.get((content_type, selection), lambda: encoder(registry))
+    return response.encoded(encoding), 200, headers
 
 
 @blueprint.route("/health")
@@ -75,11 +173,18 @@ def health():
     uri = conn.as_uri()
 
     try:
-        # ensure_connection() returns immediately while kombu holds a socket
-        # for the connection, even when that socket is dead. Probing on a
-        # fresh connection forces an actual round-trip to the broker.
-        with conn.clone() as probe:
-            probe.ensure_connection(max_retries=3)
+        broker_pool = current_app.config["broker_pool"]
+        if broker_pool is not None:
+            # A pooled connection is pinged, or replaced by a new one if the
+            # ping fails, so this is a round-trip to the broker as well.
+            with broker_pool.acquire(check=True):
+                pass
+        else:
+            # ensure_connection() returns immediately while kombu holds a
+            # socket for the connection, even when that socket is dead.
+            # Probing on a fresh connection forces an actual round-trip.
+            with conn.clone() as probe:
+                probe.ensure_connection(max_retries=3)
     except kombu.exceptions.OperationalError:
         logger.error("Failed to connect to broker='{}'", uri)
         return (f"Failed to connect to broker: '{uri}'", 500)
@@ -93,28 +198,182 @@ def health():
     # unhealthy until the next time Prometheus comes around.
     if current_app.config["scrape_status"].error is not None:
         try:
-            current_app.config["metrics_puller"]()
+            current_app.config["scrape"]()
         except Exception as ex:  # pylint: disable=broad-except
-            current_app.config["scrape_status"].record_failure(ex)
             logger.error("Connected to broker='{}' but unable to scrape: {}", uri, ex)
             return (f"Connected to the broker {uri}, but unable to scrape: {ex}", 500)
-        current_app.config["scrape_status"].record_success()
 
     return f"Connected to the broker {uri}"
 
 
-def create_app(registry, celery_connection, metrics_puller):
+def debug_access_denied():
+    """The response to a debug route if it isn't enabled or the request lacks
+    the debug token, None otherwise."""
+    if not current_app.config["debug_endpoints"]:
+        return ("Not Found", 404)
+    token = current_app.config["debug_token"]
+    if token:
+        authorization = request.headers.get("Authorization", "")
+        if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+            return ("Unauthorized", 401, {"WWW-Authenticate": "Bearer"})
+    return None
+
+
+def text(body):
+    return body, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+
+@blueprint.route("/debug/threads")
+def debug_threads():
+    return debug_access_denied() or text(thread_stacks())
+
+
+@blueprint.route("/debug/profile")
+def debug_profile():
+    """Sample the stacks of all threads for ?seconds=, every ?interval=
+    seconds, returned as collapsed stacks or with ?format=pstats as a
+    cProfile dump."""
+    denied = debug_access_denied()
+    if denied:
+        return denied
+    output = request.args.get("format", "collapsed")
+    if output not in ("collapsed", "pstats"):
+        return (f"Unknown format '{output}', expected collapsed or pstats", 400)
+    seconds = request.args.get("seconds", 10.0, type=float)
+    interval = request.args.get("interval", 0.01, type=float)
+    if not (math.isfinite(seconds) and math.isfinite(interval)):
+        return ("seconds and interval must be finite numbers", 400)
+    try:
+        samples = current_app.config["profiler"].sample(seconds, interval)
+    except Busy as ex:
+        return (str(ex), 409)
+    if output == "pstats":
+        return (
+            pstats_dump(samples, interval),
+            200,
+            {
+                "Content-Type": "application/octet-stream",
+                "Content-Disposition": "attachment; filename=celery-exporter.pstats",
+            },
+        )
+    return text(collapsed_stacks(samples))
+
+
+@blueprint.route("/debug/tracemalloc/start", methods=["POST"])
+def debug_tracemalloc_start():
+    denied = debug_access_denied()
+    if denied:
+        return denied
+    current_app.config["allocations"].start(request.args.get("frames", 1, type=int))
+    return text("Tracing allocations\n")
+
+
+@blueprint.route("/debug/tracemalloc/stop", methods=["POST"])
+def debug_tracemalloc_stop():
+    denied = debug_access_denied()
+    if denied:
+        return denied
+    current_app.config["allocations"].stop()
+    return text("Stopped tracing allocations\n")
+
+
+@blueprint.route("/debug/tracemalloc")
+def debug_tracemalloc():
+    """The top allocations since tracing started, and the top differences
+    with the previous request's snapshot."""
+    denied = debug_access_denied()
+    if denied:
+        return denied
+    key_type = request.args.get("key", "lineno")
+    if key_type not in ("lineno", "filename", "traceback"):
+        return (
+            f"Unknown key '{key_type}', expected lineno, filename or traceback",
+            400,
+        )
+    try:
+        report = current_app.config["allocations"].report(
+            request.args.get("limit", 25, type=int), key_type
+        )
+    except RuntimeError as ex:
+        return (str(ex), 409)
+    return text(report)
+
+
+@blueprint.route("/debug/cardinality")
+def debug_cardinality():
+    """The series, estimated bytes and ?top= label values with the most
+    series of every metric, from counts kept as series come and go."""
+    denied = debug_access_denied()
+    if denied:
+        return denied
+    return jsonify(
+        current_app.config["cardinality"](request.args.get("top", 10, type=int))
+    )
+
+
+def create_app(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    registry,
+    celery_connection,
+    metrics_puller,
+    protobuf=False,
+    debug_endpoints=False,
+    debug_token=None,
+    cardinality=None,
+    broker_pool=None,
+    metrics_cache_max_age=0,
+    registry_version=None,
+    metric_groups=None,
+):
     app = Flask(__name__)
     app.config["registry"] = registry
+    app.config["protobuf"] = protobuf
     app.config["celery_connection"] = celery_connection
-    app.config["metrics_puller"] = metrics_puller
+    app.config["broker_pool"] = broker_pool
+    app.config["metric_groups"] = metric_groups or {}
+    app.config["response_cache"] = ResponseCache(
+        metrics_cache_max_age, registry_version
+    )
     app.config["scrape_status"] = ScrapeStatus()
+    app.config["scrape"] = SingleFlight(metrics_puller, app.config["scrape_status"])
+    app.config["debug_endpoints"] = debug_endpoints
+    app.config["debug_token"] = debug_token
+    app.config["profiler"] = SamplingProfiler()
+    app.config["allocations"] = AllocationTracker()
+    app.config["cardinality"] = cardinality or (
+        lambda top: {"metrics": registry_cardinality(registry, top)}
+    )
     app.register_blueprint(blueprint)
     return app
 
 
-def start_http_server(registry, celery_connection, host, port, metrics_puller):
-    app = create_app(registry, celery_connection, metrics_puller)
+def start_http_server(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    registry,
+    celery_connection,
+    host,
+    port,
+    metrics_puller,
+    protobuf=False,
+    debug_endpoints=False,
+    debug_token=None,
+    cardinality=None,
+    broker_pool=None,
+    metrics_cache_max_age=0,
+    registry_version=None,
+    metric_groups=None,
+):
+    app = create_app(
+        registry,
+        celery_connection,
+        metrics_puller,
+        protobuf,
+        debug_endpoints,
+        debug_token,
+        cardinality,
+        broker_pool,
+        metrics_cache_max_age,
+        registry_version,
+        metric_groups,
+    )
     Thread(
         target=serve,
         args=(app,),
@@ -0,0 +1,105 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Handlers take microseconds, unless something is wrong
+HANDLER_DURATION_BUCKETS = (
+    0.00001,
+    0.000025,
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.1,
+)
+# From keeping up to minutes behind the cluster
+EVENT_LAG_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class PipelineMetrics:
+    """The exporter's own metrics of its event pipeline and scrapes.
+
+    The children labeled with an event type are resolved once per handler
+    when the handlers are instrumented, so that counting an event costs no
+    more than updating a task counter.
+    """
+
+    def __init__(self, metric_prefix, static_label, registry):
+        self.static_label = static_label
+        static_label_keys = static_label.keys()
+        self.events_received = Counter(
+            f"{metric_prefix}exporter_events_received",
+            "The number of events received from the broker and handled, per event "
+            "type. Events discarded because the event buffer was full aren't counted.",
+            ["type", *static_label_keys],
+            registry=registry,
+        )
+        self.handler_duration = Histogram(
+            f"{metric_prefix}exporter_handler_duration_seconds",
+            "Histogram of the time it took to apply an event to the metrics, per event "
+            "type.",
+            ["type", *static_label_keys],
+            registry=registry,
+            buckets=HANDLER_DURATION_BUCKETS,
+        )
+        self.event_lag = Histogram(
+            f"{metric_prefix}exporter_event_lag_seconds",
+            "Histogram of the time between an event being sent and it being applied to "
+            "the metrics, including the time it waited in the event buffer.",
+            [*static_label_keys],
+            registry=registry,
+            buckets=EVENT_LAG_BUCKETS,
+        )
+        self.tracked_tasks = Gauge(
+            f"{metric_prefix}exporter_tracked_tasks",
+            "The number of tasks whose state is kept in memory, see "
+            "--max-tasks-in-memory.",
+            [*static_label_keys],
+            registry=registry,
+        )
+        self.tracked_workers = Gauge(
+            f"{metric_prefix}exporter_tracked_workers",
+            "The number of workers whose state is kept in memory.",
+            [*static_label_keys],
+            registry=registry,
+        )
+        self.scrape_duration = Histogram(
+            f"{metric_prefix}exporter_scrape_duration_seconds",
+            "Histogram of the time spent collecting metrics on a scrape, per phase.",
+            ["phase", *static_label_keys],
+            registry=registry,
+        )
+
+    def _child(self, metric, **labels):
+        labels.update(self.static_label)
+        return metric.labels(**labels) if labels else metric
+
+    def received(self, event_type):
+        return self._child(self.events_received, type=event_type)
+
+    def duration(self, event_type):
+        return self._child(self.handler_duration, type=event_type)
+
+    def lag(self):
+        return self._child(self.event_lag)
+
+    def scrape_phase(self, phase):
+        return self._child(self.scrape_duration, phase=phase)
+
+
+class ShardPipelineMetrics:
+    """Stands in for PipelineMetrics in a shard process, handing out tokens
+    like ShardTaskSeries does. The tokens have no TaskSeries key, which is
+    how resolve_token() tells them apart."""
+
+    def received(self, event_type):
+        return (None, "received", event_type)
+
+    def duration(self, event_type):
+        return (None, "duration", event_type)
+
+    def lag(self):
+        return (None, "lag", None)
@@ -0,0 +1,111 @@
+# pylint: disable=protected-access
+import heapq
+import sys
+from types import FunctionType, ModuleType
+from typing import Any, Dict, List
+
+from .series_index import CountedChildren, count_label_values
+
+
+def _references(obj):
+    if isinstance(obj, dict):
+        yield from obj.keys()
+        yield from obj.values()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        yield from obj
+    if hasattr(obj, "__dict__"):
+        yield obj.__dict__
+    for cls in type(obj).__mro__:
+        for slot in getattr(cls, "__slots__", ()):
+            if hasattr(obj, slot):
+                yield getattr(obj, slot)
+
+
+def _reachable(obj, exclude=frozenset(), limit=10000):
+    """The objects reachable from obj, except strings and the like, which are
+    shared between the series of a metric. At most limit objects are
+    visited, a series is made of a few dozen."""
+    found: Dict[int, Any] = {}
+    stack = [obj]
+    while stack and len(found) < limit:
+        current = stack.pop()
+        if (
+            id(current) in found
+            or id(current) in exclude
+            or isinstance(current, (str, bytes, type, ModuleType, FunctionType))
+        ):
+            continue
+        found[id(current)] = current
+        stack.extend(_references(current))
+    return found
+
+
+def series_bytes(metric, child) -> int:
+    """An estimate of the memory one child of a metric takes: everything
+    reachable from it that isn't shared with its parent metric."""
+    if child is metric:
+        return sum(sys.getsizeof(obj) for obj in _reachable(metric).values())
+    # the parent's children aren't shared with the child
+    shared = _reachable(metric, {id(metric._metrics)})
+    return sum(sys.getsizeof(obj) for obj in _reachable(child, shared.keys()).values())
+
+
+def metric_cardinality(metric, top=10) -> Dict[str, Any]:
+    """The series count, estimated bytes and the label values with the most
+    series of a metric, from its children dict and the counts kept by
+    CountedChildren - without walking the children."""
+    labelnames = list(metric._labelnames)
+    report: Dict[str, Any] = {
+        "name": metric._name,
+        "type": metric._type,
+        "labels": labelnames,
+    }
+    if not labelnames:
+        children, sample = 1, metric
+        top_values: Dict[str, List] = {}
+    else:
+        # counted again if clear() replaced the children
+        count_label_values(metric)
+        with metric._lock:
+            children = len(metric._metrics)
+            sample = next(iter(metric._metrics.values()), None)
+            counts = {}
+            if isinstance(metric._metrics, CountedChildren):
+                counts = {
+                    labelnames[position]: dict(values)
+                    for position, values in metric._metrics.label_counts.items()
+                }
+        top_values = {
+            label: [
+                [value, count]
+                for value, count in heapq.nlargest(
+                    top, values.items(), key=lambda item: item[1]
+                )
+            ]
+            for label, values in counts.items()
+        }
+    samples_per_child = len(sample._child_samples()) if sample is not None else 0
+    bytes_per_child = series_bytes(metric, sample) if sample is not None else 0
+    report.update(
+        {
+            "children": children,
+            "series": children * samples_per_child,
+            "estimated_bytes": children * bytes_per_child,
+            "top_label_values": top_values,
+        }
+    )
+    return report
+
+
+def registry_cardinality(registry, top=10) -> List[Dict[str, Any]]:
+    """The cardinality of every metric of a registry, most series first."""
+    with registry._lock:
+        collectors = list(registry._collector_to_names)
+    return sorted(
+        (
+            metric_cardinality(collector, top)
+            for collector in collectors
+            if hasattr(collector, "_labelnames")
+        ),
+        key=lambda report: -report["series"],
+    )
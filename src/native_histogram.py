@@ -0,0 +1,171 @@
+# pylint: disable=protected-access
+import math
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Tuple
+
+from prometheus_client import REGISTRY, Histogram
+
+# The schemas Prometheus accepts, from 2 to 256 buckets per power of two
+MIN_SCHEMA = -4
+MAX_SCHEMA = 8
+
+# Same as the Go client's DefNativeHistogramZeroThreshold, 2^-128
+DEFAULT_ZERO_THRESHOLD = 2.938735877055719e-39
+
+# The bucket bounds within one power of two per positive schema, as fractions
+# in [0.5, 1) to be compared with the mantissa of math.frexp()
+_FRACTION_BOUNDS = {
+    schema: [2 ** (j / 2**schema - 1) for j in range(2**schema)]
+    for schema in range(1, MAX_SCHEMA + 1)
+}
+
+
+def bucket_index(value: float, schema: int) -> int:
+    """The index of the exponential bucket a positive value falls into.
+
+    Bucket i covers (base^(i-1), base^i] with base = 2^(2^-schema).
+    >>> bucket_index(1.0, 0)
+    0
+    >>> bucket_index(1.5, 0)
+    1
+    >>> bucket_index(1.5, 1)
+    2
+    >>> bucket_index(100, -2)
+    2
+    """
+    fraction, exponent = math.frexp(value)
+    if schema > 0:
+        bounds = _FRACTION_BOUNDS[schema]
+        return bisect_left(bounds, fraction) + (exponent - 1) * len(bounds)
+    index = exponent - 1 if fraction == 0.5 else exponent
+    offset = (1 << -schema) - 1
+    return (index + offset) >> -schema
+
+
+def spans_and_deltas(
+    buckets: Dict[int, int],
+) -> Tuple[List[Tuple[int, int]], List[int]]:
+    """Encode sparse bucket counts as Prometheus does: spans of consecutive
+    buckets, each offset from the end of the previous span, and every count
+    as the delta to the count of the bucket before it.
+    >>> spans_and_deltas({-1: 2, 0: 3, 4: 1})
+    ([(-1, 2), (3, 1)], [2, 1, -2])
+    """
+    spans: List[Tuple[int, int]] = []
+    deltas: List[int] = []
+    previous_index = None
+    previous_count = 0
+    for index in sorted(buckets):
+        if previous_index is not None and index == previous_index + 1:
+            offset, length = spans[-1]
+            spans[-1] = (offset, length + 1)
+        else:
+            gap = index if previous_index is None else index - previous_index - 1
+            spans.append((gap, 1))
+        deltas.append(buckets[index] - previous_count)
+        previous_index = index
+        previous_count = buckets[index]
+    return spans, deltas
+
+
+class NativeBuckets:  # pylint: disable=too-many-instance-attributes
+    """The sparse exponential buckets of one histogram child."""
+
+    __slots__ = (
+        "schema",
+        "zero_threshold",
+        "zero_count",
+        "count",
+        "sum",
+        "positive",
+        "negative",
+        "_lock",
+    )
+
+    def __init__(self, schema, zero_threshold):
+        self.schema = schema
+        self.zero_threshold = zero_threshold
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.positive: Dict[int, int] = {}
+        self.negative: Dict[int, int] = {}
+        self._lock = Lock()
+
+    def observe_many(self, amounts):
+        with self._lock:
+            for amount in amounts:
+                if amount > self.zero_threshold:
+                    index = bucket_index(amount, self.schema)
+                    self.positive[index] = self.positive.get(index, 0) + 1
+                elif amount < -self.zero_threshold:
+                    index = bucket_index(-amount, self.schema)
+                    self.negative[index] = self.negative.get(index, 0) + 1
+                else:
+                    self.zero_count += 1
+            self.count += len(amounts)
+            self.sum += sum(amounts)
+
+    def snapshot(self):
+        with self._lock:
+            return (
+                self.count,
+                self.sum,
+                self.zero_count,
+                dict(self.positive),
+                dict(self.negative),
+            )
+
+
+class ExponentialHistogram(Histogram):
+    """A Histogram that also keeps native histogram buckets.
+
+    The classic buckets are exposed as usual by the text formats. The native
+    buckets are only exposed by the protobuf format, see protobuf.py, which
+    is what Prometheus negotiates when native histograms are enabled on it.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        name,
+        documentation,
+        labelnames=(),
+        namespace="",
+        subsystem="",
+        unit="",
+        registry=REGISTRY,
+        _labelvalues=None,
+        buckets=Histogram.DEFAULT_BUCKETS,
+        native_schema=3,
+        native_zero_threshold=DEFAULT_ZERO_THRESHOLD,
+    ):
+        if not MIN_SCHEMA <= native_schema <= MAX_SCHEMA:
+            raise ValueError(
+                f"Native histogram schema must be between {MIN_SCHEMA} and {MAX_SCHEMA}"
+            )
+        if native_zero_threshold < 0:
+            raise ValueError("Native histogram zero threshold must not be negative")
+        self._native_schema = native_schema
+        self._native_zero_threshold = native_zero_threshold
+        super().__init__(
+            name,
+            documentation,
+            labelnames=labelnames,
+            namespace=namespace,
+            subsystem=subsystem,
+            unit=unit,
+            registry=registry,
+            _labelvalues=_labelvalues,
+            buckets=buckets,
+        )
+        self._kwargs["native_schema"] = native_schema
+        self._kwargs["native_zero_threshold"] = native_zero_threshold
+
+    def _metric_init(self):
+        super()._metric_init()
+        self._native = NativeBuckets(self._native_schema, self._native_zero_threshold)
+
+    def observe(self, amount, exemplar=None):
+        super().observe(amount, exemplar)
+        self._native.observe_many((amount,))
@@ -0,0 +1,73 @@
+from collections import deque
+from threading import Condition, Lock
+from typing import Callable, List, Optional
+
+OVERFLOW_BLOCK = "block"
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_DROP_NEWEST = "drop-newest"
+OVERFLOW_POLICIES = (OVERFLOW_BLOCK, OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST)
+
+
+class EventBuffer:  # pylint: disable=too-many-instance-attributes
+    """A bounded FIFO between the event consumer and the metric updates.
+
+    The consumer thread only decodes events and puts them here, so that it
+    gets back to the broker right away; an apply thread drains the buffer in
+    batches. When the apply thread falls behind and the buffer is full, the
+    overflow policy decides whether the consumer waits for room (block),
+    or an event is discarded - either the oldest one in the buffer
+    (drop-oldest) or the one being put (drop-newest).
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+        overflow: str = OVERFLOW_BLOCK,
+        on_drop: Optional[Callable[[], None]] = None,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy '{overflow}', "
+                f"expected one of {OVERFLOW_POLICIES}"
+            )
+        self.capacity = capacity
+        self.overflow = overflow
+        self.on_drop = on_drop
+        self.dropped = 0
+        self._events: deque = deque()
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+
+    def __len__(self):
+        return len(self._events)
+
+    def put(self, event):
+        with self._lock:
+            if len(self._events) >= self.capacity:
+                if self.overflow == OVERFLOW_BLOCK:
+                    while len(self._events) >= self.capacity:
+                        self._not_full.wait()
+                else:
+                    self._drop()
+                    if self.overflow == OVERFLOW_DROP_NEWEST:
+                        return
+                    self._events.popleft()
+            self._events.append(event)
+            self._not_empty.notify()
+
+    def drain(self, max_events: int, timeout: Optional[float] = None) -> List[dict]:
+        """Take up to max_events, waiting up to timeout for the first one."""
+        with self._lock:
+            if not self._events:
+                self._not_empty.wait(timeout)
+            events = self._events
+            batch = [events.popleft() for _ in range(min(max_events, len(events)))]
+            if batch:
+                self._not_full.notify_all()
+            return batch
+
+    def _drop(self):
+        self.dropped += 1
+        if self.on_drop is not None:
+            self.on_drop()
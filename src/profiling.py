@@ -0,0 +1,171 @@
+# pylint: disable=protected-access
+import marshal
+import math
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from collections import Counter, defaultdict
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+# Bounds of the sampling profiler, so that a request can't make it a burden
+MAX_PROFILE_SECONDS = 60.0
+MIN_SAMPLE_INTERVAL = 0.001
+
+# A frame as pstats names functions: file, first line and function name
+FrameKey = Tuple[str, int, str]
+
+
+class Busy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _thread_names():
+    return {thread.ident: thread.name for thread in threading.enumerate()}
+
+
+def _stack(frame) -> List[FrameKey]:
+    """The stack of a frame, outermost frame first."""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class SamplingProfiler:  # pylint: disable=too-few-public-methods
+    """Samples the stacks of all other threads at an interval.
+
+    The samples are taken from sys._current_frames() by the thread asking
+    for the profile, so the profiled threads don't run any profiling code
+    and event consumption carries on. The overhead is that of walking the
+    stacks once per interval, which is bounded by MIN_SAMPLE_INTERVAL, and
+    only one profile runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+
+    def sample(self, seconds, interval=0.01, clock=time.monotonic, sleep=time.sleep):
+        """Sample for the given seconds, returning the number of samples of
+        every (thread name, stack)."""
+        if not (math.isfinite(seconds) and math.isfinite(interval)):
+            raise ValueError("seconds and interval must be finite")
+        seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+        interval = max(interval, MIN_SAMPLE_INTERVAL)
+        # pylint: disable=consider-using-with
+        if not self._lock.acquire(blocking=False):
+            raise Busy("A profile is already being taken")
+        try:
+            samples: Counter = Counter()
+            me = threading.get_ident()
+            deadline = clock() + seconds
+            while True:
+                names = _thread_names()
+                for ident, frame in sys._current_frames().items():
+                    if ident != me:
+                        name = names.get(ident, str(ident))
+                        samples[(name, tuple(_stack(frame)))] += 1
+                if clock() >= deadline:
+                    return samples
+                sleep(interval)
+        finally:
+            self._lock.release()
+
+
+def collapsed_stacks(samples) -> str:
+    """The samples as collapsed stacks, the input format of flamegraph.pl and
+    speedscope: the frames of a stack joined by semicolons, then the count.
+    >>> stack = (("app.py", 1, "run"), ("app.py", 5, "work"))
+    >>> print(collapsed_stacks({("main", stack): 3}), end="")
+    main;run (app.py:1);work (app.py:5) 3
+    """
+    lines = []
+    for (thread, stack), count in sorted(samples.items(), key=lambda item: -item[1]):
+        frames = [thread] + [f"{name} ({path}:{line})" for path, line, name in stack]
+        lines.append(f"{';'.join(frames)} {count}")
+    return "\n".join(lines) + "\n" if lines else ""
+
+
+def pstats_dump(samples, interval) -> bytes:
+    """The samples in the format of cProfile's dump_stats(), to be loaded with
+    pstats.Stats or snakeviz. Times are estimated as the number of samples
+    times the interval, and call counts are sample counts."""
+    stats: Dict[FrameKey, list] = {}
+    callers: Dict[FrameKey, Dict[FrameKey, int]] = defaultdict(Counter)
+    for (_, stack), count in samples.items():
+        for position, key in enumerate(stack):
+            entry = stats.setdefault(key, [0, 0, 0.0, 0.0])
+            if key not in stack[:position]:
+                # recursion counts once towards the cumulative time
+                entry[0] += count
+                entry[1] += count
+                entry[3] += count * interval
+            if position == len(stack) - 1:
+                entry[2] += count * interval
+            if position > 0:
+                callers[key][stack[position - 1]] += count
+    return marshal.dumps(
+        {
+            key: (cc, nc, tt, ct, dict(callers[key]))
+            for key, (cc, nc, tt, ct) in stats.items()
+        }
+    )
+
+
+def thread_stacks() -> str:
+    """The current stack of every thread, like faulthandler prints them."""
+    names = _thread_names()
+    dumps = []
+    for ident, frame in sys._current_frames().items():
+        stack = "".join(traceback.format_stack(frame))
+        dumps.append(f'Thread {ident} "{names.get(ident, "?")}":\n{stack}')
+    return "\n".join(dumps)
+
+
+class AllocationTracker:
+    """Snapshots of tracemalloc, each compared with the previous one.
+
+    Tracing slows down every allocation, so it only runs between start() and
+    stop(), which also drops the snapshots.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    def start(self, frames=1):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+            self._previous = None
+
+    def stop(self):
+        with self._lock:
+            tracemalloc.stop()
+            self._previous = None
+
+    def report(self, limit=25, key_type="lineno") -> str:
+        """The top allocations, and the top differences with the previous
+        report's snapshot if there was one."""
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                raise RuntimeError("tracemalloc isn't tracing, start it first")
+            snapshot = tracemalloc.take_snapshot().filter_traces(
+                (tracemalloc.Filter(False, tracemalloc.__file__),)
+            )
+            previous, self._previous = self._previous, snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"Traced memory: {current} bytes, peak {peak} bytes", ""]
+        lines.append(f"Top {limit} allocations by {key_type}:")
+        lines += [str(stat) for stat in snapshot.statistics(key_type)[:limit]]
+        if previous is not None:
+            lines += ["", f"Top {limit} differences with the previous snapshot:"]
+            lines += [
+                str(stat) for stat in snapshot.compare_to(previous, key_type)[:limit]
+            ]
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,226 @@
+# pylint: disable=protected-access
+import math
+import struct
+from typing import Dict, Iterator, List, Tuple
+
+from .native_histogram import ExponentialHistogram, spans_and_deltas
+
+# The delimited protobuf exposition format, which is the only one native
+# histograms can be scraped with. The messages are those of
+# io.prometheus.client's metrics.proto, encoded by hand as only a handful of
+# them are needed.
+PROTOBUF_MEDIA_TYPE = "application/vnd.google.protobuf"
+PROTOBUF_CONTENT_TYPE = (
+    f"{PROTOBUF_MEDIA_TYPE}; proto=io.prometheus.client.MetricFamily; "
+    "encoding=delimited"
+)
+
+# MetricType
+COUNTER = 0
+GAUGE = 1
+UNTYPED = 3
+HISTOGRAM = 4
+
+
+def accepts_protobuf(accept_header) -> bool:
+    """Whether the scraper prefers the protobuf format over the text formats.
+    >>> accepts_protobuf("application/vnd.google.protobuf;"
+    ...     "proto=io.prometheus.client.MetricFamily;encoding=delimited;q=0.5,"
+    ...     "text/plain;version=0.0.4;q=0.4")
+    True
+    >>> accepts_protobuf("text/plain;version=0.0.4")
+    False
+    """
+    protobuf_quality = None
+    other_quality = 0.0
+    for accepted in (accept_header or "").split(","):
+        media_type, *tokens = [token.strip() for token in accepted.split(";")]
+        params = dict(token.split("=", 1) for token in tokens if "=" in token)
+        try:
+            quality = float(params.get("q", 1))
+        except ValueError:
+            continue
+        if (
+            media_type == PROTOBUF_MEDIA_TYPE
+            and params.get("proto") == "io.prometheus.client.MetricFamily"
+            and params.get("encoding") == "delimited"
+        ):
+            protobuf_quality = max(protobuf_quality or 0.0, quality)
+        elif media_type:
+            other_quality = max(other_quality, quality)
+    return protobuf_quality is not None and protobuf_quality >= other_quality
+
+
+def _varint(value: int) -> bytes:
+    value &= (1 << 64) - 1
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def _tag(field: int, wire_type: int) -> bytes:
+    return _varint(field << 3 | wire_type)
+
+
+def _uint(field: int, value: int) -> bytes:
+    return _tag(field, 0) + _varint(value)
+
+
+def _sint(field: int, value: int) -> bytes:
+    return _tag(field, 0) + _varint((value << 1) ^ (value >> 63))
+
+
+def _double(field: int, value: float) -> bytes:
+    return _tag(field, 1) + struct.pack("<d", value)
+
+
+def _bytes(field: int, data: bytes) -> bytes:
+    return _tag(field, 2) + _varint(len(data)) + data
+
+
+def _string(field: int, value: str) -> bytes:
+    return _bytes(field, value.encode())
+
+
+def _metric(labels: Dict[str, str], field: int, body: bytes) -> bytes:
+    label_pairs = b"".join(
+        _bytes(1, _string(1, name) + _string(2, value))
+        for name, value in labels.items()
+    )
+    return label_pairs + _bytes(field, body)
+
+
+def _family(name: str, documentation: str, metric_type: int, metrics) -> bytes:
+    body = (
+        _string(1, name)
+        + _string(2, documentation)
+        + _uint(3, metric_type)
+        + b"".join(_bytes(4, metric) for metric in metrics)
+    )
+    return _varint(len(body)) + body
+
+
+def _spans(field: int, spans: List[Tuple[int, int]]) -> bytes:
+    return b"".join(
+        _bytes(field, _sint(1, offset) + _uint(2, length)) for offset, length in spans
+    )
+
+
+def _native_fields(native) -> bytes:
+    count, total, zero_count, positive, negative = native.snapshot()
+    fields = [
+        _uint(1, count),
+        _double(2, total),
+        _sint(5, native.schema),
+        _double(6, native.zero_threshold),
+        _uint(7, zero_count),
+    ]
+    negative_spans, negative_deltas = spans_and_deltas(negative)
+    positive_spans, positive_deltas = spans_and_deltas(positive)
+    if not negative_spans and not positive_spans:
+        # an empty span marks the histogram as native before any observation
+        positive_spans = [(0, 0)]
+    fields.append(_spans(9, negative_spans))
+    fields.extend(_sint(10, delta) for delta in negative_deltas)
+    fields.append(_spans(12, positive_spans))
+    fields.extend(_sint(13, delta) for delta in positive_deltas)
+    return b"".join(fields)
+
+
+def _histogram_metrics(metric, collector):
+    series: Dict[tuple, dict] = {}
+    for sample in metric.samples:
+        labels = {name: value for name, value in sample.labels.items() if name != "le"}
+        entry = series.setdefault(
+            tuple(labels.items()),
+            {"labels": labels, "buckets": [], "count": 0, "sum": 0.0},
+        )
+        suffix = sample.name[len(metric.name) :]
+        if suffix == "_bucket":
+            bound = float(sample.labels["le"])
+            # the +Inf bucket is implied by the count
+            if bound != math.inf:
+                entry["buckets"].append((bound, sample.value))
+        elif suffix == "_count":
+            entry["count"] = sample.value
+        elif suffix == "_sum":
+            entry["sum"] = sample.value
+
+    for entry in series.values():
+        native = None
+        if collector is not None:
+            if collector._labelnames:
+                key = tuple(entry["labels"].get(name) for name in collector._labelnames)
+                child = collector._metrics.get(key)
+            else:
+                child = collector
+            native = getattr(child, "_native", None)
+        classic_buckets = b"".join(
+            _bytes(3, _uint(1, int(count)) + _double(2, bound))
+            for bound, count in entry["buckets"]
+        )
+        if native is None:
+            body = (
+                _uint(1, int(entry["count"]))
+                + _double(2, entry["sum"])
+                + classic_buckets
+            )
+        else:
+            body = _native_fields(native) + classic_buckets
+        yield _metric(entry["labels"], 7, body)
+
+
+def protobuf_families(registry) -> Iterator[bytes]:
+    """Encode the metrics of a registry in the delimited protobuf format, a
+    metric family at a time.
+
+    Histograms are exposed with their classic buckets, and ExponentialHistograms
+    with their native buckets as well, so that Prometheus can ingest either.
+    """
+    native_collectors = {
+        collector._name: collector
+        for collector in list(registry._collector_to_names)
+        if isinstance(collector, ExponentialHistogram)
+    }
+    for metric in registry.collect():
+        if metric.type == "counter":
+            samples = [s for s in metric.samples if s.name.endswith("_total")]
+            yield _family(
+                f"{metric.name}_total",
+                metric.documentation,
+                COUNTER,
+                (_metric(s.labels, 3, _double(1, s.value)) for s in samples),
+            )
+        elif metric.type == "gauge":
+            yield _family(
+                metric.name,
+                metric.documentation,
+                GAUGE,
+                (_metric(s.labels, 2, _double(1, s.value)) for s in metric.samples),
+            )
+        elif metric.type == "histogram":
+            yield _family(
+                metric.name,
+                metric.documentation,
+                HISTOGRAM,
+                _histogram_metrics(metric, native_collectors.get(metric.name)),
+            )
+        else:
+            by_name: Dict[str, list] = {}
+            for sample in metric.samples:
+                by_name.setdefault(sample.name, []).append(sample)
+            for name, samples in by_name.items():
+                yield _family(
+                    name,
+                    metric.documentation,
+                    UNTYPED,
+                    (_metric(s.labels, 5, _double(1, s.value)) for s in samples),
+                )
+
+
+def generate_protobuf(registry) -> bytes:
+    """Encode the metrics of a registry in the delimited protobuf format."""
+    return b"".join(protobuf_families(registry))
@@ -0,0 +1,95 @@
+import time
+from threading import Event, Thread
+from typing import Callable, Optional
+
+from loguru import logger
+from prometheus_client import Counter, Gauge
+
+
+class QueuePoller:  # pylint: disable=too-many-instance-attributes
+    """Collects the queue metrics from the broker at its own interval.
+
+    Collecting them takes inspect() broadcasts to the workers and a call to
+    the broker per queue, which is too slow to do on every scrape: /metrics
+    would be as slow as the broker and the workers' replies, and every
+    Prometheus replica scraping the exporter would repeat the calls. With a
+    poller, scrapes serve the values of the last successful poll. A failed
+    poll leaves them as they were, which the age gauge tells about.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        poll: Callable[[], None],
+        interval: float,
+        metric_prefix,
+        static_label,
+        registry,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.poll = poll
+        self.interval = interval
+        self.clock = clock
+        self.stopped = Event()
+        self.last_success: Optional[float] = None
+        self.started = clock()
+        self._thread: Optional[Thread] = None
+        static_label_keys = static_label.keys()
+
+        self.age = Gauge(
+            f"{metric_prefix}exporter_queue_metrics_age_seconds",
+            "The time since the queue metrics were last collected successfully, or "
+            "since the exporter started if they never were.",
+            [*static_label_keys],
+            registry=registry,
+        )
+        self.duration = Gauge(
+            f"{metric_prefix}exporter_queue_poll_duration_seconds",
+            "The time the last collection of the queue metrics took.",
+            [*static_label_keys],
+            registry=registry,
+        )
+        self.failures = Counter(
+            f"{metric_prefix}exporter_queue_poll_failures",
+            "The number of times collecting the queue metrics failed, leaving the "
+            "previous values in place.",
+            [*static_label_keys],
+            registry=registry,
+        )
+        if static_label:
+            self.age = self.age.labels(**static_label)
+            self.duration = self.duration.labels(**static_label)
+            self.failures = self.failures.labels(**static_label)
+        self.age.set_function(self.seconds_since_success)
+
+    def seconds_since_success(self) -> float:
+        since = self.last_success if self.last_success is not None else self.started
+        return self.clock() - since
+
+    def poll_once(self):
+        started = self.clock()
+        try:
+            self.poll()
+        except Exception:  # pylint: disable=broad-except
+            self.failures.inc()
+            logger.exception("Failed to collect the queue metrics")
+        else:
+            self.last_success = self.clock()
+        finally:
+            self.duration.set(self.clock() - started)
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = self.clock()
+            self.poll_once()
+            # the interval is kept from start to start, however long polls take
+            self.stopped.wait(max(0.0, started + self.interval - self.clock()))
+
+    def start(self):
+        self.started = self.clock()
+        self._thread = Thread(target=self.run, name="queue-poller", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self._thread is not None:
+            self._thread.join()
@@ -0,0 +1,93 @@
+import base64
+import json
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import quote, urlencode, urlsplit, urlunsplit
+from urllib.request import Request, urlopen
+
+# The management API serves at most 500 items per page
+PAGE_SIZE = 500
+COLUMNS = (
+    "name",
+    "consumers",
+    "messages_ready",
+    "messages_unacknowledged",
+    "message_bytes",
+)
+
+
+class QueueStats(NamedTuple):
+    consumers: int
+    messages_ready: int
+    messages_unacknowledged: int
+    message_bytes: int
+
+
+class ManagementClient:
+    """The queue statistics of a RabbitMQ vhost from the management HTTP API.
+
+    Checking a queue over AMQP takes a passive queue_declare per queue, and
+    a missing queue closes the channel. The management API lists all queues
+    of a vhost a page at a time instead, and only the columns the exporter
+    needs are requested, which keeps the response small with many queues.
+    Credentials are taken from the url, or given separately, e.g. those of
+    the broker url.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        url: str,
+        username: Optional[str] = None,
+        password: Optional[str] = None,
+        timeout: float = 5.0,
+        page_size: int = PAGE_SIZE,
+    ):
+        parts = urlsplit(url)
+        username = parts.username or username
+        password = parts.password or password
+        netloc = parts.hostname or ""
+        if parts.port:
+            netloc = f"{netloc}:{parts.port}"
+        self.base_url = urlunsplit(
+            (parts.scheme, netloc, parts.path.rstrip("/"), "", "")
+        )
+        self.headers = {"Accept": "application/json"}
+        if username is not None:
+            credentials = f"{username}:{password or ''}".encode()
+            self.headers["Authorization"] = (
+                f"Basic {base64.b64encode(credentials).decode()}"
+            )
+        self.timeout = timeout
+        self.page_size = page_size
+
+    def get(self, path, params):
+        request = Request(
+            f"{self.base_url}{path}?{urlencode(params)}", headers=self.headers
+        )
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def queue_stats(self, vhost="/") -> Dict[str, QueueStats]:
+        """The statistics of every queue of the vhost, by queue name."""
+        stats = {}
+        page, page_count = 1, 1
+        while page <= page_count:
+            body = self.get(
+                f"/api/queues/{quote(vhost, safe='')}",
+                {
+                    "page": page,
+                    "page_size": self.page_size,
+                    "columns": ",".join(COLUMNS),
+                },
+            )
+            for item in body["items"]:
+                # the message counts are missing until the statistics of a
+                # new queue were collected
+                stats[item["name"]] = QueueStats(
+                    item.get("consumers") or 0,
+                    item.get("messages_ready") or 0,
+                    item.get("messages_unacknowledged") or 0,
+                    item.get("message_bytes") or 0,
+                )
+            page_count = body.get("page_count", 1)
+            page += 1
+        return stats
@@ -0,0 +1,123 @@
+import gzip
+import json
+import time
+import zlib
+from typing import IO, Iterable, Iterator
+
+from loguru import logger
+
+
+def open_capture(path, mode):
+    """Captures ending in .gz are gzip compressed, everything else is plain."""
+    if str(path).endswith(".gz"):
+        return gzip.open(path, f"{mode}t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")  # pylint: disable=consider-using-with
+
+
+class EventRecorder:
+    """Appends the events delivered by the Receiver to a capture, one JSON
+    object per line.
+
+    The capture is flushed at most every flush_interval seconds, so that an
+    exporter stopped with SIGTERM loses no more than the last few events.
+    """
+
+    def __init__(self, path, flush_interval=1.0, clock=time.monotonic):
+        self.path = path
+        self.file: IO[str] = open_capture(path, "a")
+        self.events = 0
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.flushed_at = clock()
+
+    def record(self, event):
+        self.file.write(json.dumps(event, default=str))
+        self.file.write("\n")
+        self.events += 1
+        now = self.clock()
+        if now - self.flushed_at >= self.flush_interval:
+            self.file.flush()
+            self.flushed_at = now
+
+    def close(self):
+        self.file.close()
+        logger.info("Recorded {} events to '{}'", self.events, self.path)
+
+    def wrap(self, handlers):
+        """Handlers that record every event before dispatching it."""
+
+        def record_and_dispatch(event):
+            self.record(event)
+            handler = handlers.get(event["type"]) or handlers.get("*")
+            if handler is not None:
+                handler(event)
+
+        return {"*": record_and_dispatch}
+
+
+def record_events(path, events: Iterable[dict]):
+    recorder = EventRecorder(path)
+    try:
+        for event in events:
+            recorder.record(event)
+    finally:
+        recorder.close()
+
+
+def read_events(path) -> Iterator[dict]:
+    with open_capture(path, "r") as capture:
+        try:
+            for line in capture:
+                if not line.endswith("\n"):
+                    # the last event of a capture that was cut short
+                    break
+                yield json.loads(line)
+        except (EOFError, zlib.error):
+            # a compressed capture that was cut short
+            logger.warning("Capture '{}' ends unexpectedly", path)
+
+
+def replay(  # pylint: disable=too-many-locals
+    exporter, events: Iterable[dict], speed=0.0, clock=time.monotonic, sleep=time.sleep
+):
+    """Feed events through the handlers that Exporter.run() hands to the
+    Receiver, without a broker.
+
+    With a speed of 0 the events are replayed as fast as possible, otherwise
+    they are paced by the time they were received at, sped up by the given
+    factor. Buffered events are applied in between, like the apply thread of
+    Exporter.run() does. Returns the number of events.
+    """
+    if exporter.shards > 1:
+        raise ValueError("Replaying into a sharded exporter isn't supported")
+    buffer = exporter.event_buffer
+    handlers = exporter.handlers
+    batch_size = 0
+    if buffer is not None:
+        handlers = {"*": exporter.ingest_event}
+        # apply before a blocking buffer fills up, as nothing else drains it
+        batch_size = min(exporter.event_batch_size, buffer.capacity)
+
+    def apply_buffered(threshold):
+        while len(buffer) >= threshold:
+            exporter.apply_drained(buffer.drain(exporter.event_batch_size, timeout=0))
+
+    count = 0
+    started = first_received = None
+    for event in events:
+        if speed > 0:
+            received = event.get("local_received", event.get("timestamp", 0.0))
+            if started is None:
+                started, first_received = clock(), received
+            delay = (received - first_received) / speed - (clock() - started)
+            if delay > 0:
+                sleep(delay)
+        handler = handlers.get(event["type"]) or handlers.get("*")
+        if handler is not None:
+            handler(event)
+        count += 1
+        if buffer is not None:
+            apply_buffered(batch_size)
+    if buffer is not None:
+        apply_buffered(1)
+    return count
@@ -0,0 +1,147 @@
+import gzip
+import time
+import zlib
+from collections import OrderedDict
+from collections.abc import Hashable
+from threading import Lock
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional
+
+try:
+    import zstandard  # type: ignore
+except ImportError:
+    zstandard = None  # type: ignore
+
+# Like the Go client, which trades some size for compressing several times
+# faster than at the highest level
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+# Responses are cached per format and selection of metrics, which scrapes
+# choose, so the least recently used are dropped past this many
+MAX_RESPONSES = 64
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+    raise ValueError(f"Unsupported content encoding: {encoding}")
+
+
+def compress_chunks(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a streamed body as it is written."""
+    compressor: Any
+    if encoding == "gzip":
+        # wbits of 16 + 15 write the gzip header and trailer
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+    elif encoding == "zstd":
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    else:
+        raise ValueError(f"Unsupported content encoding: {encoding}")
+    for chunk in chunks:
+        if compressed := compressor.compress(chunk):
+            yield compressed
+    yield compressor.flush()
+
+
+def choose_encoding(accept_encoding) -> Optional[str]:
+    """The content encoding to compress a response with, None to send it as is.
+    zstd is preferred to gzip when the zstandard package is installed.
+    >>> choose_encoding("gzip, deflate")
+    'gzip'
+    >>> choose_encoding("gzip;q=0, identity") is None
+    True
+    >>> choose_encoding(None) is None
+    True
+    """
+    accepted = set()
+    for coding in (accept_encoding or "").split(","):
+        name, *params = [token.strip() for token in coding.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.lower())
+    if zstandard is not None and "zstd" in accepted:
+        return "zstd"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+class CachedResponse:  # pylint: disable=too-few-public-methods
+    """A rendered response, and its compressed bodies once asked for."""
+
+    def __init__(self, body: bytes, version, rendered_at: float):
+        self.body = body
+        self.version = version
+        self.rendered_at = rendered_at
+        self._encoded: Dict[str, bytes] = {}
+        self._lock = Lock()
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        with self._lock:
+            if encoding not in self._encoded:
+                self._encoded[encoding] = compress(self.body, encoding)
+            return self._encoded[encoding]
+
+
+class ResponseCache:  # pylint: disable=too-few-public-methods
+    """The last /metrics response of every format and selection of metrics.
+
+    Rendering the registry in the text format takes longer than anything
+    else a scrape does once there are many series, and every Prometheus
+    replica scrapes the same metrics. A response is rendered again once
+    version() changes, i.e. the metrics were updated, or it is older than
+    max_age, which bounds how stale the metrics computed at collection time,
+    like the age of the queue metrics, can be. The compressed bodies are
+    kept with the response, and responses are dropped once they expire or
+    once there are more than max_responses. A max_age of 0 disables the cache.
+    """
+
+    def __init__(
+        self,
+        max_age: float = 0,
+        version: Optional[Callable] = None,
+        clock: Callable[[], float] = time.monotonic,
+        max_responses: int = MAX_RESPONSES,
+    ):
+        self.max_age = max_age
+        self.version = version or (lambda: None)
+        self.clock = clock
+        self.max_responses = max_responses
+        self._responses: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, render: Callable[[], bytes]) -> CachedResponse:
+        # read before rendering, so that changes made while rendering are
+        # picked up by the next request
+        version = self.version()
+        now = self.clock()
+        with self._lock:
+            for expired in [
+                other
+                for other, response in self._responses.items()
+                if now - response.rendered_at >= self.max_age
+            ]:
+                del self._responses[expired]
+            cached = self._responses.get(key)
+            if cached is not None:
+                self._responses.move_to_end(key)
+        if cached is not None and cached.version == version:
+            return cached
+        response = CachedResponse(render(), version, now)
+        if self.max_age > 0:
+            with self._lock:
+                self._responses[key] = response
+                self._responses.move_to_end(key)
+                if len(self._responses) > self.max_responses:
+                    self._responses.popitem(last=False)
+        return response
@@ -0,0 +1,55 @@
+from typing import Dict, FrozenSet, Iterable, List, Optional
+
+
+class UnknownGroup(ValueError):
+    pass
+
+
+class SelectedRegistry:  # pylint: disable=too-few-public-methods
+    """The collectors of a registry that a scrape selected, which are the only
+    ones collected and encoded."""
+
+    def __init__(self, registry, selection: FrozenSet):
+        # pylint: disable=protected-access
+        with registry._lock:
+            self._collector_to_names = {
+                collector: names
+                for collector, names in registry._collector_to_names.items()
+                if collector in selection
+            }
+
+    def collect(self):
+        for collector in self._collector_to_names:
+            yield from collector.collect()
+
+
+def select_collectors(
+    registry,
+    names: Iterable[str],
+    groups: Iterable[str],
+    metric_groups: Dict[str, List],
+) -> Optional[FrozenSet]:
+    """The collectors of the metric families with the given names, or in the
+    given groups, None if neither was given. Names are those of the families,
+    or of their samples, e.g. celery_task_sent_total.
+    """
+    names, groups = set(names), list(groups)
+    if not names and not groups:
+        return None
+    selection = set()
+    for group in groups:
+        if group not in metric_groups:
+            raise UnknownGroup(
+                f"Unknown metric group '{group}', expected one of "
+                f"{', '.join(sorted(metric_groups))}"
+            )
+        selection.update(metric_groups[group])
+    if names:
+        # pylint: disable=protected-access
+        with registry._lock:
+            selection.update(
+                collector
+                for collector, collector_names in registry._collector_to_names.items()
+                if not names.isdisjoint(collector_names)
+            )
+    return frozenset(selection)
@@ -0,0 +1,150 @@
+from collections import Counter, defaultdict
+from typing import DefaultDict, Dict, Set
+
+_MISSING = object()
+
+
+class CountedChildren(dict):
+    """Replaces the children dict of a labeled metric, counting the series of
+    every label value as children are added and removed.
+
+    prometheus_client adds children in labels() and removes them in remove()
+    and remove_by_labels() through this dict, so the counts see every series
+    however it was created. Every other way of changing a dict goes through
+    __setitem__ and __delitem__ too. The counts cost a few increments per new
+    series, so that the series per label value can be reported without
+    walking the children.
+
+    This relies on how prometheus_client keeps the children, which is why
+    pyproject.toml pins the versions it was checked against. clear() replaces
+    the dict rather than emptying it, so the children are wrapped again
+    wherever the counts or the index are read.
+    """
+
+    __slots__ = ("label_counts",)
+
+    def __init__(self, children=()):
+        super().__init__()
+        # series per label value, per position of the label
+        self.label_counts: DefaultDict[int, Counter] = defaultdict(Counter)
+        for key, child in dict(children).items():
+            self[key] = child
+
+    def __setitem__(self, key, child):
+        if key not in self:
+            for position, value in enumerate(key):
+                self.label_counts[position][value] += 1
+        super().__setitem__(key, child)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        for position, value in enumerate(key):
+            counts = self.label_counts[position]
+            counts[value] -= 1
+            if counts[value] <= 0:
+                del counts[value]
+
+    def pop(self, key, default=_MISSING):
+        if key not in self:
+            if default is _MISSING:
+                raise KeyError(key)
+            return default
+        child = self[key]
+        del self[key]
+        return child
+
+    def popitem(self):
+        if not self:
+            raise KeyError("popitem(): dictionary is empty")
+        key = next(reversed(self.keys()))
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, child in dict(*args, **kwargs).items():
+            self[key] = child
+
+    def clear(self):
+        for key in list(self):
+            del self[key]
+
+
+class IndexedChildren(CountedChildren):
+    """CountedChildren that also keep track of the label sets of every value
+    of some labels, like a worker's hostname, to remove their series without
+    scanning all of them."""
+
+    __slots__ = ("by_value",)
+
+    def __init__(self, positions, children=()):
+        self.by_value: Dict[int, DefaultDict[str, Set[tuple]]] = {
+            position: defaultdict(set) for position in positions
+        }
+        super().__init__(children)
+
+    def __setitem__(self, key, child):
+        super().__setitem__(key, child)
+        for position, keys in self.by_value.items():
+            keys[key[position]].add(key)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        for position, by_value in self.by_value.items():
+            keys = by_value.get(key[position])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del by_value[key[position]]
+
+    def keys_with(self, position, value):
+        return list(self.by_value[position].get(value, ()))
+
+
+def _children(metric):
+    # pylint: disable=protected-access
+    children = metric._metrics
+    if not isinstance(children, dict):
+        raise TypeError(
+            f"Expected the children of {metric._name} in a dict, got "
+            f"{type(children).__name__}: unsupported prometheus_client version"
+        )
+    return children
+
+
+def count_label_values(metric):
+    """Count the series per label value of a labeled metric, unless its
+    children are already counted."""
+    # pylint: disable=protected-access
+    with metric._lock:
+        children = _children(metric)
+        if not isinstance(children, CountedChildren):
+            metric._metrics = CountedChildren(children)
+
+
+def _index(metric, positions):
+    # pylint: disable=protected-access
+    with metric._lock:
+        metric._metrics = IndexedChildren(positions, _children(metric))
+
+
+def index_by_labels(metric, labels=("hostname",)):
+    """Index the children of a metric by the values of some of its labels."""
+    # pylint: disable=protected-access
+    _index(metric, [metric._labelnames.index(label) for label in labels])
+
+
+def label_keys(metric, label, value):
+    """The label sets of a metric indexed with index_by_labels() that have the
+    value of the label, indexing the metric again if clear() replaced its
+    children."""
+    # pylint: disable=protected-access
+    position = metric._labelnames.index(label)
+    by_value = getattr(metric._metrics, "by_value", {})
+    if position not in by_value:
+        _index(metric, {*by_value, position})
+    with metric._lock:
+        return metric._metrics.keys_with(position, value)
@@ -0,0 +1,92 @@
+import zlib
+
+from .batch import MetricBatch
+
+
+def shard_of(uuid: str, shards: int) -> int:
+    """The shard that handles the events of a task.
+
+    hash() is salted per process, so a checksum is used to have every
+    process agree on the shard.
+    """
+    return zlib.crc32(uuid.encode()) % shards
+
+
+class ShardTaskSeries:
+    """Stands in for TaskSeries in a shard process.
+
+    Rather than metric children, this hands out tokens naming them: the
+    TaskSeries key, the TaskSeries method that resolves the child and its
+    argument. The main process resolves the tokens against its own
+    TaskSeries, so that the zero series, purges and the registry all stay in
+    one place.
+    """
+
+    __slots__ = ("key", "labels")
+
+    # folding into the overflow series happens in the main process
+    folded: frozenset = frozenset()
+
+    def __init__(self, exporter, name, hostname, queue_name):
+        self.key = (name, hostname, queue_name)
+        self.labels = {
+            "name": name,
+            "hostname": hostname,
+            "queue_name": queue_name,
+            **exporter.static_label,
+        }
+
+    def labels_of(self, metric):  # pylint: disable=unused-argument
+        return self.labels
+
+    def counter(self, event_type):
+        return (self.key, "counter", event_type)
+
+    def failed(self, exception):
+        return (self.key, "failed", exception)
+
+    def runtime(self):
+        return (self.key, "runtime", None)
+
+    def queue_wait_time(self):
+        return (self.key, "queue_wait_time", None)
+
+
+def resolve_token(exporter, token):
+    key, method, argument = token
+    if key is None:
+        # a child of the exporter's own metrics, see ShardPipelineMetrics
+        resolve = getattr(exporter.pipeline_metrics, method)
+    else:
+        resolve = getattr(exporter.task_series(*key), method)
+    return resolve() if argument is None else resolve(argument)
+
+
+class ShardBatch(MetricBatch):
+    """A MetricBatch that ships its increments and observations, along with
+    the worker events of the batch, to the main process instead of applying
+    them."""
+
+    def __init__(self, shard, queue, event_buffer, state):
+        super().__init__()
+        self.shard = shard
+        self.queue = queue
+        self.event_buffer = event_buffer
+        self.state = state
+        self.events = []
+
+    def forward(self, event):
+        self.events.append(event)
+
+    def commit(self):
+        self.queue.put(
+            (
+                self.shard,
+                dict(self.increments),
+                dict(self.observations),
+                self.events,
+                len(self.event_buffer),
+                self.event_buffer.dropped,
+                len(self.state),
+            )
+        )
@@ -0,0 +1,119 @@
+import random
+
+import pytest
+from prometheus_client import CollectorRegistry, Histogram
+
+from .batch import MetricBatch, observe_many
+from .exporter import Exporter
+
+# The exporter's own metrics that depend on timing rather than on the events
+TIMING_METRICS = {
+    "celery_exporter_handler_duration_seconds",
+    "celery_exporter_event_lag_seconds",
+    "celery_exporter_scrape_duration_seconds",
+}
+
+
+def metric_samples(registry):
+    return {
+        (sample.name, tuple(sorted(sample.labels.items()))): sample.value
+        for metric in registry.collect()
+        if metric.name not in TIMING_METRICS
+        for sample in metric.samples
+        if not sample.name.endswith("_created")
+    }
+
+
+def test_observe_many_matches_observe():
+    rng = random.Random(0)
+    buckets = [0.1, 0.5, 1.0, 5.0]
+    # include amounts right on the bucket bounds, which belong to that bucket
+    amounts = [rng.uniform(-1, 10) for _ in range(1000)] + buckets
+
+    one_by_one = CollectorRegistry()
+    histogram = Histogram("h", "h", buckets=buckets, registry=one_by_one)
+    for amount in amounts:
+        histogram.observe(amount)
+
+    batched = CollectorRegistry()
+    observe_many(Histogram("h", "h", buckets=buckets, registry=batched), amounts)
+
+    assert metric_samples(batched) == pytest.approx(metric_samples(one_by_one))
+
+
+def test_metric_batch_commits_once_per_child():
+    registry = CollectorRegistry()
+    histogram = Histogram("h", "h", ["name"], buckets=[1.0], registry=registry)
+    child = histogram.labels(name="a")
+    batch = MetricBatch()
+    batch.observe(child, 0.5)
+    batch.observe(child, 2.0)
+    assert registry.get_sample_value("h_count", {"name": "a"}) == 0
+
+    batch.commit()
+    assert registry.get_sample_value("h_count", {"name": "a"}) == 2
+    assert registry.get_sample_value("h_bucket", {"name": "a", "le": "1.0"}) == 1
+    assert registry.get_sample_value("h_sum", {"name": "a"}) == 2.5
+
+
+def make_events(tasks):
+    events = []
+    for i in range(tasks):
+        uuid = f"task-{i}"
+        worker = f"celery@worker-{i % 3}"
+        base = {"uuid": uuid, "clock": i, "utcoffset": 0}
+        events += [
+            dict(
+                base,
+                type="task-sent",
+                hostname="client@web",
+                timestamp=100.0 + i,
+                name=f"app.task_{i % 4}",
+                queue="celery",
+            ),
+            dict(
+                base,
+                type="task-received",
+                hostname=worker,
+                timestamp=101.0 + i,
+                name=f"app.task_{i % 4}",
+            ),
+            dict(base, type="task-started", hostname=worker, timestamp=101.0 + i * 1.5),
+        ]
+        if i % 5:
+            events.append(
+                dict(
+                    base,
+                    type="task-succeeded",
+                    hostname=worker,
+                    timestamp=110.0 + i,
+                    runtime=i / 10,
+                )
+            )
+        else:
+            events.append(
+                dict(
+                    base,
+                    type="task-failed",
+                    hostname=worker,
+                    timestamp=110.0 + i,
+                    exception="KeyError('x')",
+                )
+            )
+    return events
+
+
+def test_apply_batch_matches_applying_events_one_by_one():
+    events = make_events(50)
+
+    one_by_one = Exporter()
+    for event in events:
+        one_by_one.apply_event(dict(event))
+
+    batched = Exporter()
+    batched.apply_batch([dict(event) for event in events[:77]])
+    batched.apply_batch([dict(event) for event in events[77:]])
+
+    assert metric_samples(batched.registry) == pytest.approx(
+        metric_samples(one_by_one.registry)
+    )
@@ -0,0 +1,177 @@
+import kombu.exceptions
+import pytest
+import redis.exceptions
+from prometheus_client import CollectorRegistry
+
+from .broker_pool import CHECK_IDLE_SECONDS, MIN_BACKOFF_SECONDS, BrokerPool
+from .http_server import create_app
+
+
+class FakeBroker:
+    def __init__(self, connection_class):
+        self.connection_class = connection_class
+        self.up = True
+        self.connections = []
+        self.pings = 0
+
+    def connect(self):
+        connection = self.connection_class(broker=self)
+        self.connections.append(connection)
+        return connection
+
+    def ping(self):
+        self.pings += 1
+        if not self.up:
+            raise redis.exceptions.ConnectionError("Connection reset by peer")
+
+
+@pytest.fixture
+def fake_broker(fake_connection):
+    return FakeBroker(fake_connection)
+
+
+def make_pool(broker, clock, registry=None, **kwargs):
+    return BrokerPool(
+        broker.connect,
+        "celery_",
+        {},
+        registry or CollectorRegistry(),
+        clock=clock,
+        **kwargs
+    )
+
+
+def test_reuses_connections(fake_broker, clock):
+    registry = CollectorRegistry()
+    pool = make_pool(fake_broker, clock, registry)
+
+    for _ in range(3):
+        with pool.acquire() as connection:
+            with pool.acquire() as other:
+                assert other is not connection
+                assert (
+                    registry.get_sample_value(
+                        "celery_exporter_broker_connections", {"state": "in_use"}
+                    )
+                    == 2
+                )
+
+    assert len(fake_broker.connections) == 2
+    assert fake_broker.pings == 0
+    assert (
+        registry.get_sample_value(
+            "celery_exporter_broker_connections", {"state": "idle"}
+        )
+        == 2
+    )
+    assert (
+        registry.get_sample_value(
+            "celery_exporter_broker_connects_total", {"result": "success"}
+        )
+        == 2
+    )
+
+
+def test_pings_connections_that_were_idle_for_a_while(fake_broker, clock):
+    pool = make_pool(fake_broker, clock)
+    with pool.acquire():
+        pass
+
+    clock.now += CHECK_IDLE_SECONDS
+    with pool.acquire():
+        pass
+    assert fake_broker.pings == 1
+    with pool.acquire(check=True):
+        pass
+    assert fake_broker.pings == 2
+    assert len(fake_broker.connections) == 1
+
+
+def test_recycles_idle_old_and_broken_connections(fake_broker, clock):
+    registry = CollectorRegistry()
+    pool = make_pool(fake_broker, clock, registry, max_idle=60, max_age=600)
+
+    def recycled(reason):
+        return registry.get_sample_value(
+            "celery_exporter_broker_connections_recycled_total", {"reason": reason}
+        )
+
+    with pool.acquire():
+        pass
+    clock.now += 60
+    with pool.acquire():
+        pass
+    assert recycled("idle") == 1
+
+    for _ in range(12):
+        clock.now += 50
+        with pool.acquire():
+            pass
+    assert recycled("max_age") == 1
+
+    with pytest.raises(ConnectionError):
+        with pool.acquire():
+            raise ConnectionError("Error while reading from redis:6379")
+    assert recycled("error") == 1
+    assert len(fake_broker.connections) == 3
+    assert all(connection.released for connection in fake_broker.connections)
+
+
+def test_replaces_connections_that_fail_a_ping(fake_broker, clock):
+    pool = make_pool(fake_broker, clock)
+    with pool.acquire():
+        pass
+
+    fake_broker.up = False
+    with pytest.raises(kombu.exceptions.OperationalError):
+        with pool.acquire(check=True):
+            pass
+    assert fake_broker.connections[0].released
+
+    fake_broker.up = True
+    clock.now += MIN_BACKOFF_SECONDS
+    with pool.acquire(check=True) as connection:
+        assert connection is fake_broker.connections[-1]
+
+
+def test_backs_off_while_the_broker_is_down(fake_broker, clock):
+    fake_broker.up = False
+    pool = make_pool(fake_broker, clock)
+
+    def attempts():
+        before = len(fake_broker.connections)
+        with pytest.raises(kombu.exceptions.OperationalError):
+            with pool.acquire():
+                pass
+        return len(fake_broker.connections) - before
+
+    assert attempts() == 1
+    assert attempts() == 0
+    clock.now += MIN_BACKOFF_SECONDS
+    assert attempts() == 1
+    clock.now += MIN_BACKOFF_SECONDS
+    # the backoff doubled
+    assert attempts() == 0
+    clock.now += MIN_BACKOFF_SECONDS
+
+    fake_broker.up = True
+    with pool.acquire():
+        pass
+    assert pool._retry_at is None  # pylint: disable=protected-access
+
+
+def test_health_uses_the_pool(fake_broker, clock):
+    pool = make_pool(fake_broker, clock)
+    client = create_app(
+        CollectorRegistry(), fake_broker.connect(), lambda: None, broker_pool=pool
+    ).test_client()
+    fake_broker.connections.clear()
+
+    assert client.get("/health").status_code == 200
+    assert client.get("/health").status_code == 200
+    # the connection opened by the first probe is pinged by the second
+    assert len(fake_broker.connections) == 1
+    assert fake_broker.pings == 1
+
+    fake_broker.up = False
+    assert client.get("/health").status_code == 500
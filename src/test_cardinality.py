@@ -0,0 +1,201 @@
+import threading
+
+from prometheus_client import CollectorRegistry, Counter
+
+from .cardinality import HeavyHitters, SeriesLimiter
+from .exporter import Exporter
+from .test_batch import make_events
+
+
+def task_received(uuid, name, hostname="celery@worker"):
+    return {
+        "type": "task-received",
+        "uuid": uuid,
+        "hostname": hostname,
+        "timestamp": 1.0,
+        "name": name,
+        "clock": 1,
+    }
+
+
+def received_samples(exporter):
+    return {
+        sample.labels["name"]: sample.value
+        for metric in exporter.registry.collect()
+        if metric.name == "celery_task_received"
+        for sample in metric.samples
+        if sample.name.endswith("_total")
+    }
+
+
+def test_limiter_admits_existing_series_over_budget():
+    counter = Counter("c", "c", ["name"], registry=CollectorRegistry())
+    limiter = SeriesLimiter(limits={"c": 3})
+    counter.labels(name="a")
+    assert limiter.admits(counter, {"name": "b"})
+    counter.labels(name="b")
+
+    assert not limiter.admits(counter, {"name": "c"})
+    assert limiter.admits(counter, {"name": "a"})
+    counter.remove("b")
+    assert limiter.admits(counter, {"name": "c"})
+
+
+def test_series_over_budget_are_folded_into_overflow():
+    exporter = Exporter(series_limits={"task_received": 3})
+    for i in range(5):
+        exporter.apply_event(task_received(f"task-{i}", f"app.task_{i}"))
+    exporter.apply_event(task_received("task-5", "app.task_0"))
+
+    # the overflow series takes the last slot of the budget
+    assert received_samples(exporter) == {
+        "app.task_0": 2.0,
+        "app.task_1": 1.0,
+        "__overflow__": 3.0,
+    }
+    # a folded label set is counted once, however many events it has
+    for i in range(10):
+        exporter.apply_event(task_received(f"again-{i}", "app.task_4"))
+    assert (
+        exporter.registry.get_sample_value(
+            "celery_exporter_series_folded_total",
+            {"metric": "celery_task_received"},
+        )
+        == 3
+    )
+    series = exporter.task_series("app.task_4", "worker", "celery")
+    assert (
+        series.labels_of(exporter.state_counters["task-received"])["name"]
+        == "__overflow__"
+    )
+    assert (
+        series.labels_of(exporter.state_counters["task-started"])["name"]
+        == "app.task_4"
+    )
+    # other metrics keep their own budget
+    assert (
+        exporter.registry.get_sample_value(
+            "celery_task_started_total",
+            {"name": "app.task_4", "hostname": "worker", "queue_name": "celery"},
+        )
+        == 0
+    )
+
+
+def test_heavy_hitters_keeps_the_most_frequent_names():
+    hitters = HeavyHitters(2, capacity=3)
+    for name in "aabbbcdddd":
+        hitters.hit(name)
+    assert hitters.hot == {"a", "b"}
+    assert not hitters.hit("d", 0)
+
+    assert hitters.rotate() == {"a"}
+    assert hitters.hot == {"b", "d"}
+
+
+def test_series_of_a_flood_of_new_label_sets_share_the_overflow_task_series():
+    exporter = Exporter(max_series_per_metric=3)
+    for i in range(20):
+        exporter.apply_event(task_received(f"task-{i}", f"app.task_{i}"))
+
+    assert received_samples(exporter) == {
+        "app.task_0": 1.0,
+        "app.task_1": 1.0,
+        "__overflow__": 18.0,
+    }
+    # the cache only holds the admitted label sets and the overflow one
+    assert len(exporter.task_series_cache) == 3
+    assert (
+        exporter.registry.get_sample_value(
+            "celery_exporter_series_folded_total",
+            {"metric": "celery_task_received"},
+        )
+        == 18
+    )
+
+    # label sets are admitted again once there's room
+    exporter.worker_last_seen.seen("worker", 1.0)
+    exporter.purge_worker_metrics("worker")
+    exporter.apply_event(task_received("task-20", "app.task_20"))
+    assert received_samples(exporter) == {"app.task_20": 1.0, "__overflow__": 18.0}
+
+
+def test_histograms_folded_after_the_series_was_cached_are_admitted_again():
+    exporter = Exporter(series_limits={"task_runtime": 3})
+    for name in ("other", "another"):
+        exporter.celery_task_runtime.labels(
+            name=name, hostname="gone", queue_name="celery"
+        ).observe(1)
+    exporter.worker_last_seen.seen("gone", 1.0)
+    series = exporter.task_series("app.task", "worker", "celery")
+    series.runtime().observe(1)
+
+    assert series.labels_of(exporter.celery_task_runtime)["name"] == "__overflow__"
+    assert series.labels_of(exporter.state_counters["task-received"]) == series.labels
+    exporter.purge_worker_metrics("gone")
+    assert exporter.task_series("app.task", "worker", "celery") is series
+    assert series.labels_of(exporter.celery_task_runtime) == series.labels
+    series.runtime().observe(1)
+    assert (
+        exporter.registry.get_sample_value(
+            "celery_task_runtime_count",
+            {"name": "app.task", "hostname": "worker", "queue_name": "celery"},
+        )
+        == 1
+    )
+
+
+def test_heavy_hitters_decay_by_time_rather_than_by_rotation():
+    now = [0.0]
+    hitters = HeavyHitters(1, half_life=10, clock=lambda: now[0])
+    hitters.hit("a", 8)
+    for _ in range(10):
+        hitters.rotate()
+    assert hitters.counts == {"a": 8}
+
+    now[0] += 20
+    hitters.rotate()
+    assert hitters.counts == {"a": 2}
+
+
+def test_heavy_hitters_rotate_while_names_are_hit():
+    hitters = HeavyHitters(5, capacity=10)
+    stop = threading.Event()
+
+    def hit():
+        i = 0
+        while not stop.is_set():
+            hitters.hit(f"task-{i % 50}")
+            i += 1
+
+    thread = threading.Thread(target=hit)
+    thread.start()
+    try:
+        for _ in range(2000):
+            hitters.rotate()
+    finally:
+        stop.set()
+        thread.join()
+
+
+def test_exporter_demotes_cold_task_names():
+    exporter = Exporter(top_task_names=1)
+    for event in make_events(8):
+        exporter.apply_event(event)
+    exporter.rotate_task_names()
+    assert set(received_samples(exporter)) == {"app.task_0", "__overflow__"}
+
+    # app.task_2 takes over
+    for i in range(50):
+        exporter.apply_event(task_received(f"hot-{i}", "app.task_2"))
+    exporter.rotate_task_names()
+    assert set(received_samples(exporter)) == {"__overflow__"}
+    assert (
+        exporter.registry.get_sample_value(
+            "celery_exporter_series_dropped_total",
+            {"metric": "celery_task_received"},
+        )
+        == 3
+    )
+    exporter.apply_event(task_received("hot-50", "app.task_2"))
+    assert set(received_samples(exporter)) == {"__overflow__", "app.task_2"}
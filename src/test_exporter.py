@@ -1,4 +1,17 @@
-from .exporter import transform_option_value
+import threading
+
+import fakeredis
+import pytest
+import redis
+from celery import Celery
+from kombu import Connection
+
+from .exporter import (
+    Exporter,
+    redis_queue_length,
+    redis_queue_lengths,
+    transform_option_value,
+)
 
 
 def test_transform_option_value():
@@ -14,3 +27,83 @@ def test_transform_option_value():
 
     for case in test_cases:
         assert transform_option_value(case["input"]) == case["expected"]
+
+
+@pytest.fixture(name="redis_url")
+def fake_redis_server():
+    server = fakeredis.TcpFakeServer(("127.0.0.1", 0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    yield f"redis://{host}:{port}/0"
+    server.shutdown()
+    server.server_close()
+
+
+def fill_queues(redis_url, prefix=""):
+    client = redis.Redis.from_url(redis_url)
+    client.flushall()
+    client.rpush(f"{prefix}celery", *range(3))
+    client.rpush(f"{prefix}celery\x06\x163", *range(2))
+    client.rpush(f"{prefix}celery\x06\x169", 1)
+    client.rpush(f"{prefix}other", 1)
+    # the lists of another prefix aren't counted
+    client.rpush("elsewhere:celery", *range(10))
+
+
+@pytest.mark.parametrize("prefix", ["", "prefix:"])
+def test_redis_queue_lengths_include_priorities_and_the_key_prefix(redis_url, prefix):
+    fill_queues(redis_url, prefix)
+    with Connection(
+        redis_url, transport_options={"global_keyprefix": prefix}
+    ) as connection:
+        lengths = redis_queue_lengths(connection, ["celery", "other", "missing"])
+        assert lengths == {
+            "celery": {0: 3, 3: 2, 6: 0, 9: 1},
+            "other": {0: 1, 3: 0, 6: 0, 9: 0},
+            "missing": {0: 0, 3: 0, 6: 0, 9: 0},
+        }
+        assert redis_queue_length(connection, "celery") == 6
+
+
+def test_redis_queue_lengths_are_queried_in_one_round_trip(redis_url, mocker):
+    fill_queues(redis_url)
+    with Connection(redis_url) as connection:
+        client = connection.default_channel.client
+        client.ping()
+        sent = mocker.spy(redis.connection.Connection, "send_packed_command")
+        redis_queue_lengths(connection, [f"queue-{i}" for i in range(100)])
+    assert sent.call_count == 1
+
+
+def test_exports_the_length_per_priority(redis_url, fake_inspect):
+    fill_queues(redis_url)
+    exporter = Exporter(initial_queues=["celery"], queue_length_by_priority=True)
+    exporter.app = Celery(broker=redis_url)
+    fake_inspect(exporter.app)
+    exporter.track_queue_metrics()
+
+    def sample(name, **labels):
+        return exporter.registry.get_sample_value(
+            name, labels={"queue_name": "celery", **labels}
+        )
+
+    assert sample("celery_queue_length") == 6
+    assert sample("celery_queue_length_by_priority", priority="0") == 3
+    assert sample("celery_queue_length_by_priority", priority="3") == 2
+    assert sample("celery_queue_length_by_priority", priority="9") == 1
+
+
+def test_new_queue_series_bump_the_generation(redis_url, fake_inspect):
+    fill_queues(redis_url)
+    exporter = Exporter(initial_queues=["celery"])
+    exporter.app = Celery(broker=redis_url)
+    fake_inspect(exporter.app)
+    exporter.track_queue_metrics()
+    generation = exporter.generation
+
+    exporter.track_queue_metrics()
+    assert exporter.generation == generation
+    # an empty queue is a new series with the value of a missing one
+    exporter.queue_cache.add("empty")
+    exporter.track_queue_metrics()
+    assert exporter.generation > generation
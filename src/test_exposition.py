@@ -0,0 +1,62 @@
+import gzip
+
+import pytest
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram
+from prometheus_client.exposition import choose_encoder
+
+from .exposition import encode_families
+from .http_server import create_app
+from .native_histogram import ExponentialHistogram
+from .protobuf import PROTOBUF_CONTENT_TYPE, generate_protobuf
+from .response_cache import compress_chunks
+
+
+@pytest.fixture(name="registry")
+def metrics_registry():
+    registry = CollectorRegistry(auto_describe=True)
+    tasks = Counter("celery_tasks", "Tasks", ["name"], registry=registry)
+    for i in range(3):
+        tasks.labels(name=f"task-{i}").inc(i)
+    Gauge("celery_queue_length", "Queue length", registry=registry).set(4)
+    Histogram("celery_runtime", "Runtime", registry=registry).observe(0.3)
+    ExponentialHistogram("celery_wait", "Wait", registry=registry).observe(0.3)
+    return registry
+
+
+@pytest.mark.parametrize(
+    "accept",
+    [
+        "text/plain;version=0.0.4",
+        "text/plain;version=1.0.0",
+        "application/openmetrics-text;version=1.0.0",
+    ],
+)
+def test_encodes_the_families_like_the_whole_registry(registry, accept):
+    encoder, content_type = choose_encoder(accept)
+    families = list(encode_families(registry, encoder, content_type))
+
+    assert b"".join(families) == encoder(registry)
+    assert len(families) >= 4
+
+
+def test_encodes_the_protobuf_families_like_the_whole_registry(registry):
+    families = list(encode_families(registry, None, PROTOBUF_CONTENT_TYPE))
+    assert b"".join(families) == generate_protobuf(registry)
+
+
+def test_compresses_the_chunks_as_they_are_written():
+    chunks = [b"celery_tasks_total 1\n" * 100] * 5
+    assert gzip.decompress(b"".join(compress_chunks(chunks, "gzip"))) == b"".join(
+        chunks
+    )
+
+
+def test_streams_the_metrics_without_a_cache(registry):
+    encoder, _ = choose_encoder("text/plain;version=0.0.4")
+    client = create_app(registry, None, lambda: None).test_client()
+
+    res = client.get("/metrics")
+    assert res.is_streamed
+    assert res.data == encoder(registry)
+    res = client.get("/metrics", headers={"Accept-Encoding": "gzip"})
+    assert gzip.decompress(res.data) == encoder(registry)
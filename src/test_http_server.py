@@ -1,59 +1,38 @@
 # pylint: disable=unused-argument
+import gzip
+import threading
 import time
 
 import kombu.exceptions
 import pytest
 import requests
-from prometheus_client import CollectorRegistry
+from prometheus_client import CollectorRegistry, Counter
 
-from .http_server import create_app
+from .http_server import ScrapeStatus, SingleFlight, create_app
 
 
-class FakeConnection:
-    """Mimics a kombu connection that still holds on to a socket.
+@pytest.fixture
+def make_client(fake_connection):
+    def _make_client(metrics_puller, connection=None, **kwargs):
+        app = create_app(
+            CollectorRegistry(auto_describe=True),
+            connection or fake_connection(),
+            metrics_puller,
+            **kwargs,
+        )
+        return app.test_client()
 
-    ensure_connection() is a no-op for such a connection even when the
-    broker is gone - only connecting anew tells us anything.
-    """
+    return _make_client
 
-    def __init__(self, clone_error=None):
-        self.clone_error = clone_error
 
-    def as_uri(self):
-        return "redis://localhost:6379//"
-
-    def ensure_connection(self, **kwargs):
-        pass
-
-    def clone(self):
-        if self.clone_error:
-            raise self.clone_error
-        return self
-
-    def __enter__(self):
-        return self
-
-    def __exit__(self, *args):
-        pass
-
-
-def make_client(metrics_puller, connection=None):
-    app = create_app(
-        CollectorRegistry(auto_describe=True),
-        connection or FakeConnection(),
-        metrics_puller,
-    )
-    return app.test_client()
-
-
-def test_health_fails_when_the_broker_is_unreachable():
+def test_health_fails_when_the_broker_is_unreachable(make_client, fake_connection):
     error = kombu.exceptions.OperationalError("No route to host")
-    client = make_client(lambda: None, FakeConnection(clone_error=error))
+    client = make_client(lambda: None, fake_connection(clone_error=error))
 
     assert client.get("/health").status_code == 500
 
 
-def test_metrics_failure_makes_the_exporter_unhealthy():
+def test_metrics_failure_makes_the_exporter_unhealthy(make_client):
     def puller():
         raise ConnectionError("Error while reading from redis:6379")
 
@@ -63,7 +42,7 @@ def test_metrics_failure_makes_the_exporter_unhealthy():
     assert client.get("/health").status_code == 500
 
 
-def test_health_recovers_once_metrics_can_be_scraped_again():
+def test_health_recovers_once_metrics_can_be_scraped_again(make_client):
     scrapes = []
 
     def puller():
@@ -78,6 +57,135 @@ def test_health_recovers_once_metrics_can_be_scraped_again():
     assert client.get("/metrics").status_code == 200
 
 
+def test_concurrent_scrapes_share_one_collection(mocker):
+    started, release, scrapes = threading.Event(), threading.Event(), []
+
+    def puller():
+        scrapes.append(1)
+        started.set()
+        release.wait(5)
+        raise ConnectionError("Error while reading from redis:6379")
+
+    scrape_status = ScrapeStatus()
+    record_failure = mocker.spy(scrape_status, "record_failure")
+    scrape = SingleFlight(puller, scrape_status)
+    errors = []
+
+    def request():
+        try:
+            scrape()
+        except ConnectionError as ex:
+            errors.append(ex)
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # let the other scrapes join the collection in flight
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(scrapes) == 1
+    assert len(errors) == 4 and len(set(map(id, errors))) == 1
+    assert record_failure.call_count == 1
+
+    # the next scrape collects again
+    release.clear()
+    threading.Timer(0.05, release.set).start()
+    with pytest.raises(ConnectionError):
+        scrape()
+    assert len(scrapes) == 2
+
+
+def test_metrics_are_cached_and_compressed(fake_connection):
+    registry = CollectorRegistry(auto_describe=True)
+    counter = Counter("celery_tasks", "Tasks", registry=registry)
+    version = [0]
+    client = create_app(
+        registry,
+        fake_connection(),
+        lambda: None,
+        metrics_cache_max_age=60,
+        registry_version=lambda: version[0],
+    ).test_client()
+
+    res = client.get("/metrics", headers={"Accept-Encoding": "gzip"})
+    assert res.headers["Content-Encoding"] == "gzip"
+    assert b"celery_tasks_total 0.0" in gzip.decompress(res.data)
+    counter.inc()
+    assert b"celery_tasks_total 0.0" in client.get("/metrics").data
+    version[0] += 1
+    assert b"celery_tasks_total 1.0" in client.get("/metrics").data
+
+
+def test_debug_routes_are_opt_in(make_client):
+    client = make_client(lambda: None)
+
+    assert client.get("/debug/threads").status_code == 404
+    assert client.get("/debug/profile?seconds=0").status_code == 404
+    assert client.post("/debug/tracemalloc/start").status_code == 404
+
+
+def test_debug_routes_require_the_token(make_client):
+    client = make_client(lambda: None, debug_endpoints=True, debug_token="secret")
+
+    assert client.get("/debug/threads").status_code == 401
+    assert (
+        client.get(
+            "/debug/threads", headers={"Authorization": "Bearer wrong"}
+        ).status_code
+        == 401
+    )
+    res = client.get("/debug/threads", headers={"Authorization": "Bearer secret"})
+    assert res.status_code == 200
+    assert "MainThread" in res.text
+
+
+def test_debug_profile(make_client):
+    client = make_client(lambda: None, debug_endpoints=True)
+
+    res = client.get("/debug/profile?seconds=0.05&interval=0.01")
+    assert res.status_code == 200
+    assert "MainThread;" not in res.text
+    res = client.get("/debug/profile?seconds=0&format=pstats")
+    assert res.status_code == 200
+    assert res.headers["Content-Type"] == "application/octet-stream"
+    assert client.get("/debug/profile?format=svg").status_code == 400
+    assert client.get("/debug/profile?seconds=nan").status_code == 400
+    assert client.get("/debug/profile?interval=inf").status_code == 400
+
+
+def test_debug_tracemalloc(make_client):
+    client = make_client(lambda: None, debug_endpoints=True)
+
+    assert client.get("/debug/tracemalloc").status_code == 409
+    try:
+        assert client.post("/debug/tracemalloc/start").status_code == 200
+        first = client.get("/debug/tracemalloc?limit=5")
+        assert first.status_code == 200
+        assert "differences" not in first.text
+        second = client.get("/debug/tracemalloc?limit=5&key=filename")
+        assert "Top 5 differences with the previous snapshot" in second.text
+    finally:
+        assert client.post("/debug/tracemalloc/stop").status_code == 200
+    assert client.get("/debug/tracemalloc").status_code == 409
+
+
+def test_debug_cardinality(make_client):
+    client = make_client(lambda: None, debug_endpoints=True)
+    assert client.get("/debug/cardinality").json == {"metrics": []}
+
+    client = make_client(
+        lambda: None,
+        debug_endpoints=True,
+        cardinality=lambda top: {"metrics": [], "queue_cache": top},
+    )
+    assert client.get("/debug/cardinality?top=3").json["queue_cache"] == 3
+
+
 @pytest.mark.celery()
 def test_health(threaded_exporter):
     time.sleep(1)
@@ -0,0 +1,136 @@
+import time
+from collections import Counter
+
+import pytest
+from celery.utils.time import utcoffset  # type: ignore
+
+from .exporter import Exporter
+from .test_batch import make_events
+from .test_shards import run_shards
+
+
+def type_counts(events):
+    return Counter(event["type"] for event in events)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_counts_events_and_times_their_handlers(batched):
+    events = make_events(20)
+    exporter = Exporter()
+    if batched:
+        exporter.apply_batch([dict(event) for event in events])
+    else:
+        for event in events:
+            exporter.apply_event(dict(event))
+
+    for event_type, count in type_counts(events).items():
+        labels = {"type": event_type}
+        assert (
+            exporter.registry.get_sample_value(
+                "celery_exporter_events_received_total", labels=labels
+            )
+            == count
+        )
+        assert (
+            exporter.registry.get_sample_value(
+                "celery_exporter_handler_duration_seconds_count", labels=labels
+            )
+            == count
+        )
+    assert exporter.registry.get_sample_value(
+        "celery_exporter_event_lag_seconds_count"
+    ) == len(events)
+
+
+def test_event_lag_is_measured_from_the_sent_timestamp():
+    exporter = Exporter()
+    exporter.apply_event(
+        {
+            "type": "worker-heartbeat",
+            "hostname": "celery@worker",
+            "timestamp": time.time() - 3,
+            "utcoffset": utcoffset(),
+        }
+    )
+
+    def bucket(le):
+        return exporter.registry.get_sample_value(
+            "celery_exporter_event_lag_seconds_bucket", labels={"le": le}
+        )
+
+    assert bucket("2.5") == 0
+    assert bucket("5.0") == 1
+
+
+def test_exports_the_number_of_tracked_tasks_and_workers():
+    exporter = Exporter()
+    for event in make_events(10):
+        exporter.apply_event(dict(event))
+    exporter.apply_event(
+        {"type": "worker-heartbeat", "hostname": "celery@worker", "timestamp": 1.0}
+    )
+
+    assert exporter.registry.get_sample_value("celery_exporter_tracked_tasks") == len(
+        exporter.state
+    )
+    assert exporter.registry.get_sample_value("celery_exporter_tracked_workers") == 1
+
+
+def test_times_the_scrape_phases(monkeypatch):
+    exporter = Exporter(top_task_names=10)
+    monkeypatch.setattr(exporter, "track_queue_metrics", lambda: None)
+    exporter.scrape()
+    exporter.scrape()
+
+    for phase in (
+        "rotate_task_names",
+        "track_timed_out_workers",
+        "track_queue_metrics",
+    ):
+        assert (
+            exporter.registry.get_sample_value(
+                "celery_exporter_scrape_duration_seconds_count",
+                labels={"phase": phase},
+            )
+            == 2
+        )
+
+
+def test_shards_count_the_events_of_all_shards():
+    events = [
+        {"type": "worker-online", "hostname": "celery@worker-0", "timestamp": 1.0}
+    ] + make_events(30)
+
+    main = run_shards(events, 3)
+
+    for event_type, count in type_counts(events).items():
+        assert (
+            main.registry.get_sample_value(
+                "celery_exporter_handler_duration_seconds_count",
+                labels={"type": event_type},
+            )
+            == count
+        )
+    assert main.registry.get_sample_value("celery_exporter_tracked_tasks") == 30
+
+
+def test_self_metrics_can_be_turned_off(monkeypatch):
+    exporter = Exporter(self_metrics=False)
+    for event in make_events(5):
+        exporter.apply_event(dict(event))
+    monkeypatch.setattr(exporter, "track_queue_metrics", lambda: None)
+    exporter.scrape()
+
+    assert exporter.handlers["task-sent"].__func__ is Exporter.track_task_event
+    assert not [
+        metric
+        for metric in exporter.registry.collect()
+        if metric.name
+        in (
+            "celery_exporter_events_received",
+            "celery_exporter_handler_duration_seconds",
+            "celery_exporter_event_lag_seconds",
+            "celery_exporter_tracked_tasks",
+            "celery_exporter_scrape_duration_seconds",
+        )
+    ]
@@ -0,0 +1,88 @@
+# pylint: disable=protected-access
+import tracemalloc
+
+from prometheus_client import CollectorRegistry, Counter, Histogram
+
+from .exporter import Exporter
+from .introspection import metric_cardinality, registry_cardinality, series_bytes
+from .series_index import count_label_values
+from .test_batch import make_events
+
+
+def test_reports_series_and_top_label_values():
+    counter = Counter("tasks", "t", ["name", "hostname"], registry=CollectorRegistry())
+    count_label_values(counter)
+    for hostname in ("a", "b", "c"):
+        counter.labels("busy", hostname).inc()
+    counter.labels("quiet", "a").inc()
+
+    report = metric_cardinality(counter, top=1)
+
+    assert report["children"] == 4
+    # _total and _created
+    assert report["series"] == 8
+    assert report["estimated_bytes"] > 0
+    assert report["top_label_values"] == {
+        "name": [["busy", 3]],
+        "hostname": [["a", 2]],
+    }
+
+
+def test_estimates_the_bytes_of_a_series():
+    registry = CollectorRegistry()
+    histogram = Histogram("runtime", "r", ["name"], registry=registry)
+    histogram.labels("warm").observe(1)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for i in range(100):
+            histogram.labels(f"task-{i}").observe(1)
+        grown = sum(
+            stat.size_diff
+            for stat in tracemalloc.take_snapshot().compare_to(before, "filename")
+        )
+    finally:
+        tracemalloc.stop()
+
+    estimate = series_bytes(histogram, histogram.labels("warm"))
+    # within a factor of two of what the series actually allocated
+    assert grown / 100 / 2 < estimate < grown / 100 * 2
+
+
+def test_reports_every_metric_of_the_registry_most_series_first():
+    exporter = Exporter()
+    for event in make_events(10):
+        exporter.apply_event(dict(event))
+
+    reports = registry_cardinality(exporter.registry)
+    names = [report["name"] for report in reports]
+    assert names[0] == "celery_task_queue_wait_time"
+    assert "celery_worker_up" in names
+    assert [report["series"] for report in reports] == sorted(
+        (report["series"] for report in reports), reverse=True
+    )
+    received = next(
+        report for report in reports if report["name"] == "celery_task_received"
+    )
+    hostnames = received["top_label_values"]["hostname"]
+    assert sum(count for _, count in hostnames) == received["children"]
+    assert [count for _, count in hostnames] == sorted(
+        (count for _, count in hostnames), reverse=True
+    )
+
+
+def test_cardinality_report_covers_the_exporters_structures():
+    exporter = Exporter(initial_queues=["celery", "priority"])
+    for event in make_events(10):
+        exporter.apply_event(dict(event))
+    exporter.apply_event(
+        {"type": "worker-heartbeat", "hostname": "celery@worker", "timestamp": 1.0}
+    )
+
+    report = exporter.cardinality_report()
+
+    assert report["queue_cache"] == 2
+    assert report["worker_last_seen"]["workers"] == 1
+    assert report["state"] == {"tasks": len(exporter.state), "workers": 1}
+    assert report["task_series_cache"] == len(exporter.task_series_cache)
@@ -97,10 +97,10 @@ def test_worker_timeout_status(
         )
         == 1.0
     )
-    assert threaded_exporter.worker_last_seen[hostname] == {
-        "forgotten": False,
-        "ts": reverse_adjust_timestamp(ts, input_utcoffset),
-    }
+    assert threaded_exporter.worker_last_seen[hostname].forgotten is False
+    assert threaded_exporter.worker_last_seen[hostname].ts == reverse_adjust_timestamp(
+        ts, input_utcoffset
+    )
 
     time.sleep(sleep_seconds)
     threaded_exporter.scrape()
@@ -173,10 +173,10 @@ def test_purge_offline_worker_metrics(
         == 1.0
     )
 
-    assert threaded_exporter.worker_last_seen[hostname] == {
-        "forgotten": False,
-        "ts": reverse_adjust_timestamp(ts, input_utcoffset),
-    }
+    assert threaded_exporter.worker_last_seen[hostname].forgotten is False
+    assert threaded_exporter.worker_last_seen[hostname].ts == reverse_adjust_timestamp(
+        ts, input_utcoffset
+    )
 
     time.sleep(sleep_seconds)
     threaded_exporter.scrape()
@@ -502,3 +502,95 @@ def test_queue_wait_time_excludes_eta_when_events_from_other_timezone(event_expo
 
     assert get_queue_wait_sample(event_exporter, "count") == 1.0
     assert get_queue_wait_sample(event_exporter, "sum") == pytest.approx(3.0)
+
+
+def get_task_counter_sample(exporter, counter, **extra_labels):
+    return exporter.registry.get_sample_value(
+        f"celery_task_{counter}_total",
+        labels={
+            "name": QUEUE_WAIT_TASK_NAME,
+            "hostname": "wait-test-host",
+            "queue_name": "celery",
+            **extra_labels,
+        },
+    )
+
+
+def test_task_counters_are_initialized_at_zero(event_exporter):
+    event_exporter.track_task_event(make_task_sent_event(QUEUE_WAIT_BASE_TIME))
+    event_exporter.track_task_event(
+        make_task_event("task-started", QUEUE_WAIT_BASE_TIME + 1)
+    )
+    event_exporter.track_task_event(
+        make_task_event("task-started", QUEUE_WAIT_BASE_TIME + 2)
+    )
+
+    assert get_task_counter_sample(event_exporter, "sent") == 1.0
+    assert get_task_counter_sample(event_exporter, "started") == 2.0
+    assert get_task_counter_sample(event_exporter, "succeeded") == 0.0
+    assert get_task_counter_sample(event_exporter, "failed", exception="") == 0.0
+
+
+def test_task_failed_counter_is_labeled_with_the_exception(event_exporter):
+    event_exporter.track_task_event(make_task_sent_event(QUEUE_WAIT_BASE_TIME))
+    failed = make_task_event("task-failed", QUEUE_WAIT_BASE_TIME + 1)
+    failed["exception"] = "KeyError('missing')"
+    event_exporter.track_task_event(failed)
+
+    assert (
+        get_task_counter_sample(event_exporter, "failed", exception="KeyError") == 1.0
+    )
+
+
+def test_task_counters_reappear_after_their_worker_was_purged(event_exporter):
+    event_exporter.track_task_event(make_task_sent_event(QUEUE_WAIT_BASE_TIME))
+    event_exporter.track_worker_status(
+        {"hostname": "worker@wait-test-host", "timestamp": time.time()}, True
+    )
+    event_exporter.purge_worker_metrics("wait-test-host")
+    assert get_task_counter_sample(event_exporter, "sent") is None
+
+    event_exporter.track_task_event(
+        make_task_event("task-started", QUEUE_WAIT_BASE_TIME + 1)
+    )
+
+    assert get_task_counter_sample(event_exporter, "started") == 1.0
+
+
+def test_purge_only_removes_series_labeled_with_the_hostname(event_exporter):
+    # a queue named like the purged worker
+    sent = make_task_sent_event(QUEUE_WAIT_BASE_TIME)
+    sent.update(hostname="client@web", queue="other-host")
+    event_exporter.track_task_event(sent)
+    for hostname in ("worker@other-host", "worker@wait-test-host"):
+        event_exporter.track_worker_status(
+            {"hostname": hostname, "timestamp": time.time()}, True
+        )
+    event_exporter.track_task_event(
+        make_task_event("task-started", QUEUE_WAIT_BASE_TIME + 1)
+    )
+
+    event_exporter.purge_worker_metrics("other-host")
+
+    assert (
+        event_exporter.registry.get_sample_value(
+            "celery_worker_up", labels={"hostname": "other-host"}
+        )
+        is None
+    )
+    assert (
+        event_exporter.registry.get_sample_value(
+            "celery_worker_up", labels={"hostname": "wait-test-host"}
+        )
+        == 1.0
+    )
+    assert (
+        get_task_counter_sample(
+            event_exporter, "sent", hostname="web", queue_name="other-host"
+        )
+        == 1.0
+    )
+    assert (
+        get_task_counter_sample(event_exporter, "started", queue_name="other-host")
+        == 1.0
+    )
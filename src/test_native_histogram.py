@@ -0,0 +1,107 @@
+# pylint: disable=protected-access
+import math
+import random
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+from .batch import observe_many
+from .exporter import Exporter
+from .native_histogram import ExponentialHistogram, bucket_index
+
+
+@pytest.mark.parametrize("schema", [-4, -1, 0, 1, 3, 8])
+def test_bucket_index_matches_the_bucket_bounds(schema):
+    rng = random.Random(schema)
+    base = 2 ** (2**-schema)
+    values = [rng.lognormvariate(0, 5) for _ in range(1000)]
+    # powers of two are the upper bound of their bucket
+    values += [2.0**exponent for exponent in range(-10, 10)]
+    for value in values:
+        index = bucket_index(value, schema)
+        assert base ** (index - 1) < value * (1 + 1e-12)
+        assert value <= base**index * (1 + 1e-12)
+    for exponent in range(-10, 10):
+        expected = math.ceil(exponent * 2.0**schema)
+        assert bucket_index(2.0**exponent, schema) == expected
+
+
+def test_rejects_unsupported_schemas():
+    with pytest.raises(ValueError):
+        ExponentialHistogram("h", "h", registry=None, native_schema=9)
+
+
+def make_histogram():
+    return ExponentialHistogram(
+        "h",
+        "h",
+        ["name"],
+        buckets=[1.0],
+        registry=CollectorRegistry(),
+        native_schema=0,
+        native_zero_threshold=0.001,
+    ).labels(name="a")
+
+
+def test_observations_are_counted_in_exponential_buckets():
+    histogram = make_histogram()
+    for amount in [0, 0.0005, 0.75, 1, 3, 3.5, -2]:
+        histogram.observe(amount)
+
+    count, total, zero_count, positive, negative = histogram._native.snapshot()
+    assert count == 7
+    assert total == pytest.approx(6.2505)
+    assert zero_count == 2
+    assert positive == {0: 2, 2: 2}
+    assert negative == {1: 1}
+
+
+def test_observe_many_matches_observe():
+    rng = random.Random(0)
+    amounts = [rng.expovariate(1) for _ in range(1000)]
+    one_by_one = make_histogram()
+    for amount in amounts:
+        one_by_one.observe(amount)
+    batched = make_histogram()
+    observe_many(batched, amounts)
+
+    assert batched._native.snapshot()[2:] == one_by_one._native.snapshot()[2:]
+    assert batched._native.count == one_by_one._native.count == 1000
+
+
+def test_exporter_keeps_classic_buckets_with_native_histograms():
+    exporter = Exporter(
+        buckets=[1.0, 5.0], native_histograms=True, native_histogram_schema=2
+    )
+    exporter.apply_event(
+        {
+            "type": "task-received",
+            "uuid": "task-1",
+            "hostname": "celery@worker",
+            "timestamp": 1.0,
+            "name": "app.task",
+            "clock": 1,
+        }
+    )
+    exporter.apply_event(
+        {
+            "type": "task-succeeded",
+            "uuid": "task-1",
+            "hostname": "celery@worker",
+            "timestamp": 2.0,
+            "runtime": 2.5,
+            "clock": 2,
+        }
+    )
+
+    labels = {"name": "app.task", "hostname": "worker", "queue_name": "celery"}
+    assert (
+        exporter.registry.get_sample_value(
+            "celery_task_runtime_bucket", dict(labels, le="5.0")
+        )
+        == 1
+    )
+    native = exporter.celery_task_runtime.labels(**labels)._native
+    assert native.schema == 2
+    assert native.positive == {bucket_index(2.5, 2): 1}
+    assert not math.isnan(native.sum)
@@ -0,0 +1,98 @@
+import threading
+import time
+
+import pytest
+
+from .exporter import Exporter
+from .pipeline import (
+    OVERFLOW_BLOCK,
+    OVERFLOW_DROP_NEWEST,
+    OVERFLOW_DROP_OLDEST,
+    EventBuffer,
+)
+
+
+def fill(buffer, *events):
+    for event in events:
+        buffer.put(event)
+
+
+def test_drains_events_in_batches_in_order():
+    buffer = EventBuffer(10)
+    fill(buffer, 1, 2, 3, 4, 5)
+
+    assert buffer.drain(2) == [1, 2]
+    assert buffer.drain(10) == [3, 4, 5]
+    assert buffer.drain(10, timeout=0.01) == []
+
+
+@pytest.mark.parametrize(
+    "overflow,expected",
+    [
+        (OVERFLOW_DROP_OLDEST, [3, 4, 5]),
+        (OVERFLOW_DROP_NEWEST, [1, 2, 3]),
+    ],
+)
+def test_drops_events_when_full(overflow, expected):
+    buffer = EventBuffer(3, overflow)
+    fill(buffer, 1, 2, 3, 4, 5)
+
+    assert buffer.drain(10) == expected
+    assert buffer.dropped == 2
+
+
+def test_blocks_until_there_is_room():
+    buffer = EventBuffer(2, OVERFLOW_BLOCK)
+    fill(buffer, 1, 2)
+    producer = threading.Thread(target=buffer.put, args=(3,), daemon=True)
+    producer.start()
+    time.sleep(0.05)
+    assert producer.is_alive()
+
+    assert buffer.drain(1) == [1]
+    producer.join(timeout=1)
+    assert not producer.is_alive()
+    assert buffer.drain(10) == [2, 3]
+    assert buffer.dropped == 0
+
+
+def test_rejects_unknown_overflow_policy():
+    with pytest.raises(ValueError):
+        EventBuffer(1, "drop-everything")
+
+
+def test_exporter_exports_buffer_depth_and_drops():
+    exporter = Exporter(event_buffer_size=1, event_buffer_overflow=OVERFLOW_DROP_NEWEST)
+    online = {"type": "worker-online", "hostname": "celery@host", "timestamp": 1.0}
+    exporter.ingest_event(online)
+    exporter.ingest_event(online)
+    # events without a handler aren't buffered at all
+    exporter.ingest_event({"type": "worker-unknown", "hostname": "celery@host"})
+
+    assert (
+        exporter.registry.get_sample_value("celery_exporter_event_buffer_events") == 1
+    )
+    assert (
+        exporter.registry.get_sample_value("celery_exporter_events_dropped_total") == 1
+    )
+
+
+def test_exporter_applies_buffered_events():
+    exporter = Exporter(event_buffer_size=10000)
+    threading.Thread(target=exporter.apply_events, daemon=True).start()
+    exporter.ingest_event(
+        {"type": "worker-online", "hostname": "celery@host", "timestamp": time.time()}
+    )
+
+    deadline = time.monotonic() + 5
+    while (
+        exporter.registry.get_sample_value(
+            "celery_worker_up", labels={"hostname": "host"}
+        )
+        != 1.0
+    ):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert (
+        exporter.registry.get_sample_value("celery_exporter_event_buffer_events") == 0
+    )
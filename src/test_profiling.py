@@ -0,0 +1,80 @@
+import io
+import marshal
+import math
+import pstats
+import threading
+
+import pytest
+
+from .profiling import Busy, SamplingProfiler, collapsed_stacks, pstats_dump
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(100))
+
+
+def test_samples_the_stacks_of_other_threads():
+    stop = threading.Event()
+    thread = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    thread.start()
+    try:
+        samples = SamplingProfiler().sample(0.1, interval=0.005)
+    finally:
+        stop.set()
+        thread.join()
+
+    busy = {stack: count for (name, stack), count in samples.items() if name == "busy"}
+    assert sum(busy.values()) >= 2
+    assert all(any(frame[2] == "busy_loop" for frame in stack) for stack in busy)
+    # the sampling thread itself isn't sampled
+    assert threading.current_thread().name not in {name for name, _ in samples}
+    assert "busy;" in collapsed_stacks(samples)
+
+
+def test_rejects_durations_that_arent_finite():
+    profiler = SamplingProfiler()
+    for seconds, interval in ((math.nan, 0.01), (0.01, math.nan), (math.inf, 0.01)):
+        with pytest.raises(ValueError):
+            profiler.sample(seconds, interval)
+    # the lock was not taken
+    profiler.sample(0)
+
+
+def test_one_profile_at_a_time():
+    profiler = SamplingProfiler()
+    started = threading.Event()
+
+    def sleep(_):
+        started.set()
+        with pytest.raises(Busy):
+            profiler.sample(0)
+
+    profiler.sample(0.01, sleep=sleep)
+    assert started.is_set()
+
+
+def test_pstats_dump_loads_in_pstats(tmp_path):
+    run = ("app.py", 1, "run")
+    work = ("app.py", 5, "work")
+    recurse = ("app.py", 9, "recurse")
+    samples = {
+        ("main", (run, work)): 3,
+        ("main", (run,)): 1,
+        ("main", (run, recurse, recurse)): 2,
+    }
+    dump = pstats_dump(samples, 0.01)
+    stats = marshal.loads(dump)
+
+    assert stats[run][:4] == (6, 6, pytest.approx(0.01), pytest.approx(0.06))
+    assert stats[work][:4] == (3, 3, pytest.approx(0.03), pytest.approx(0.03))
+    assert stats[recurse][:4] == (2, 2, pytest.approx(0.02), pytest.approx(0.02))
+    assert stats[work][4] == {run: 3}
+    assert stats[recurse][4] == {run: 2, recurse: 2}
+
+    (tmp_path / "profile.pstats").write_bytes(dump)
+    output = io.StringIO()
+    pstats.Stats(str(tmp_path / "profile.pstats"), stream=output).sort_stats(
+        "cumulative"
+    ).print_stats()
+    assert "work" in output.getvalue()
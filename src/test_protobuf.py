@@ -0,0 +1,141 @@
+# pylint: disable=protected-access
+import struct
+
+from prometheus_client import CollectorRegistry, Counter, Gauge
+
+from .http_server import create_app
+from .native_histogram import ExponentialHistogram
+from .protobuf import PROTOBUF_CONTENT_TYPE, generate_protobuf
+
+PROTOBUF_ACCEPT = (
+    "application/vnd.google.protobuf;proto=io.prometheus.client.MetricFamily;"
+    "encoding=delimited;q=0.6,application/openmetrics-text;version=1.0.0;q=0.5"
+)
+
+
+def read_varint(data, position):
+    value = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return value, position
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def parse_message(data):
+    """Decode a protobuf message into {field: [raw values]}."""
+    fields = {}
+    position = 0
+    while position < len(data):
+        key, position = read_varint(data, position)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, position = read_varint(data, position)
+        elif wire_type == 1:
+            (value,) = struct.unpack("<d", data[position : position + 8])
+            position += 8
+        else:
+            length, position = read_varint(data, position)
+            value = data[position : position + length]
+            position += length
+        fields.setdefault(field, []).append(value)
+    return fields
+
+
+def parse_families(data):
+    families = {}
+    position = 0
+    while position < len(data):
+        length, position = read_varint(data, position)
+        family = parse_message(data[position : position + length])
+        position += length
+        families[family[1][0].decode()] = family
+    return families
+
+
+def labels_of(metric):
+    return {
+        pair[1][0].decode(): pair[2][0].decode()
+        for pair in map(parse_message, metric.get(1, []))
+    }
+
+
+def make_registry():
+    registry = CollectorRegistry()
+    Counter("jobs", "Jobs.", ["name"], registry=registry).labels(name="a").inc(3)
+    Gauge("workers", "Workers.", registry=registry).set(2)
+    histogram = ExponentialHistogram(
+        "runtime",
+        "Runtime.",
+        ["name"],
+        buckets=[1.0, 10.0],
+        registry=registry,
+        native_schema=0,
+        native_zero_threshold=0.001,
+    )
+    for amount in [0, 1.5, 1.7, 3, 20]:
+        histogram.labels(name="a").observe(amount)
+    return registry
+
+
+def test_encodes_counters_and_gauges():
+    families = parse_families(generate_protobuf(make_registry()))
+
+    counter = families["jobs_total"]
+    assert counter[3] == [0]
+    metric = parse_message(counter[4][0])
+    assert labels_of(metric) == {"name": "a"}
+    assert parse_message(metric[3][0])[1] == [3.0]
+
+    gauge = families["workers"]
+    assert gauge[3] == [1]
+    assert parse_message(parse_message(gauge[4][0])[2][0])[1] == [2.0]
+
+
+def test_encodes_classic_and_native_buckets():
+    families = parse_families(generate_protobuf(make_registry()))
+
+    histogram = families["runtime"]
+    assert histogram[3] == [4]
+    histogram = parse_message(parse_message(histogram[4][0])[7][0])
+    assert histogram[1] == [5]
+    assert histogram[2] == [26.2]
+    classic = [parse_message(bucket) for bucket in histogram[3]]
+    assert [(bucket[2][0], bucket[1][0]) for bucket in classic] == [(1.0, 1), (10.0, 4)]
+
+    assert unzigzag(histogram[5][0]) == 0
+    assert histogram[6] == [0.001]
+    assert histogram[7] == [1]
+    spans = [parse_message(span) for span in histogram[12]]
+    assert [(unzigzag(span[1][0]), span[2][0]) for span in spans] == [(1, 2), (2, 1)]
+    # buckets 1, 2 and 5 hold 2, 1 and 1 observations
+    assert [unzigzag(delta) for delta in histogram[13]] == [2, -1, 0]
+
+
+def test_metrics_negotiates_protobuf(fake_connection):
+    registry = make_registry()
+
+    def get(accept, protobuf):
+        app = create_app(registry, fake_connection(), lambda: None, protobuf)
+        return app.test_client().get("/metrics", headers={"Accept": accept})
+
+    response = get(PROTOBUF_ACCEPT, protobuf=True)
+    assert response.headers["Content-Type"] == PROTOBUF_CONTENT_TYPE
+    assert "runtime" in parse_families(response.data)
+
+    assert (
+        get(PROTOBUF_ACCEPT, protobuf=False)
+        .headers["Content-Type"]
+        .startswith("application/openmetrics-text")
+    )
+    assert (
+        get("text/plain", protobuf=True)
+        .headers["Content-Type"]
+        .startswith("text/plain")
+    )
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+from celery import Celery
+from prometheus_client import CollectorRegistry
+
+from . import exporter as exporter_module
+from .exporter import Exporter
+from .queue_poller import QueuePoller
+
+
+def make_poller(poll, clock, registry=None):
+    return QueuePoller(poll, 10, "celery_", {}, registry or CollectorRegistry(), clock)
+
+
+def test_reports_the_age_and_duration_of_the_last_poll(clock):
+    registry = CollectorRegistry()
+
+    def poll():
+        clock.now += 2
+
+    poller = make_poller(poll, clock, registry)
+    clock.now += 5
+    assert registry.get_sample_value("celery_exporter_queue_metrics_age_seconds") == 5
+
+    poller.poll_once()
+    clock.now += 1
+    assert registry.get_sample_value("celery_exporter_queue_metrics_age_seconds") == 1
+    assert registry.get_sample_value("celery_exporter_queue_poll_duration_seconds") == 2
+
+
+def test_failed_polls_are_counted_and_age_the_metrics(clock):
+    registry = CollectorRegistry()
+    fail = False
+
+    def poll():
+        if fail:
+            raise ConnectionError("broker went away")
+
+    poller = make_poller(poll, clock, registry)
+    poller.poll_once()
+    fail = True
+    clock.now += 10
+    poller.poll_once()
+    clock.now += 10
+    poller.poll_once()
+
+    assert registry.get_sample_value("celery_exporter_queue_metrics_age_seconds") == 20
+    assert registry.get_sample_value("celery_exporter_queue_poll_failures_total") == 2
+
+
+def test_polls_in_the_background_until_stopped():
+    polled = threading.Semaphore(0)
+    poller = QueuePoller(polled.release, 0.01, "celery_", {}, CollectorRegistry())
+    poller.start()
+    for _ in range(3):
+        assert polled.acquire(timeout=5)  # pylint: disable=consider-using-with
+    poller.stop()
+    assert not poller._thread.is_alive()  # pylint: disable=protected-access
+
+
+@pytest.fixture
+def polled_exporter(fake_inspect):
+    exporter = Exporter(queue_poll_interval=10)
+    exporter.app = Celery(broker="memory://localhost/")
+    fake_inspect(
+        exporter.app,
+        stats={"celery@worker": {"pool": {"processes": [1, 2]}}},
+        active_queues={"celery@worker": [{"name": "celery"}, {"name": "priority"}]},
+    )
+    return exporter
+
+
+def queue_length(exporter, queue):
+    return exporter.registry.get_sample_value(
+        "celery_queue_length", labels={"queue_name": queue}
+    )
+
+
+def test_scrapes_leave_the_queue_metrics_to_the_poller(polled_exporter, monkeypatch):
+    def fail():
+        raise AssertionError("The queue metrics were collected on a scrape")
+
+    monkeypatch.setattr(polled_exporter, "track_queue_metrics", fail)
+    polled_exporter.scrape()
+
+
+def test_a_failed_poll_keeps_the_previous_values(polled_exporter, monkeypatch):
+    lengths = {"celery": 3, "priority": 4}
+    monkeypatch.setattr(
+        exporter_module,
+        "queue_length",
+        lambda transport, connection, queue: lengths[queue],
+    )
+    polled_exporter.queue_poller.poll_once()
+    assert queue_length(polled_exporter, "celery") == 3
+    assert queue_length(polled_exporter, "priority") == 4
+
+    # one queue is collected before the other one fails
+    lengths = {"celery": 30}
+    polled_exporter.queue_poller.poll_once()
+    assert queue_length(polled_exporter, "celery") == 3
+    assert queue_length(polled_exporter, "priority") == 4
+    assert (
+        polled_exporter.registry.get_sample_value(
+            "celery_exporter_queue_poll_failures_total"
+        )
+        == 1
+    )
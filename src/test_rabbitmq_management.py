@@ -0,0 +1,119 @@
+import json
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from celery import Celery
+
+from .exporter import Exporter
+from .rabbitmq_management import COLUMNS, ManagementClient, QueueStats
+
+QUEUES = [
+    {
+        "name": f"queue-{i}",
+        "consumers": i % 3,
+        "messages_ready": i,
+        "messages_unacknowledged": 2 * i,
+        "message_bytes": 100 * i,
+        "memory": 5000,
+    }
+    for i in range(12)
+]
+
+
+class ManagementAPI(BaseHTTPRequestHandler):
+    queues = QUEUES
+    requests: list = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlsplit(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.requests.append((url.path, params, self.headers.get("Authorization")))
+        if url.path != "/api/queues/%2F":
+            self.send_error(404)
+            return
+        columns = params["columns"].split(",")
+        page, page_size = int(params["page"]), int(params["page_size"])
+        items = self.queues[(page - 1) * page_size : page * page_size]
+        body = json.dumps(
+            {
+                "items": [
+                    {column: item[column] for column in columns if column in item}
+                    for item in items
+                ],
+                "page": page,
+                "page_count": math.ceil(len(self.queues) / page_size),
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+@pytest.fixture(name="management_url")
+def fake_management_api():
+    ManagementAPI.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ManagementAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    yield f"http://{host}:{port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_lists_the_queues_a_page_at_a_time(management_url):
+    client = ManagementClient(management_url, "guest", "secret", page_size=5)
+    stats = client.queue_stats("/")
+
+    assert len(stats) == 12
+    assert stats["queue-4"] == QueueStats(1, 4, 8, 400)
+    pages = [params["page"] for _, params, _ in ManagementAPI.requests]
+    assert pages == ["1", "2", "3"]
+    _, params, authorization = ManagementAPI.requests[0]
+    assert params["columns"].split(",") == list(COLUMNS)
+    assert authorization == "Basic Z3Vlc3Q6c2VjcmV0"
+
+
+def test_credentials_of_the_url_take_precedence(management_url):
+    url = management_url.replace("http://", "http://admin:admin@")
+    ManagementClient(url, "guest", "secret").queue_stats("/")
+    assert ManagementAPI.requests[0][2] == "Basic YWRtaW46YWRtaW4="
+
+
+def test_counts_of_new_queues_default_to_zero(management_url, monkeypatch):
+    monkeypatch.setattr(ManagementAPI, "queues", [{"name": "new"}])
+    stats = ManagementClient(management_url).queue_stats("/")
+    assert stats == {"new": QueueStats(0, 0, 0, 0)}
+
+
+def test_exports_the_queue_stats_of_the_management_api(
+    management_url, monkeypatch, fake_connection, fake_inspect
+):
+    exporter = Exporter(
+        initial_queues=["queue-4", "missing"], rabbitmq_management_url=management_url
+    )
+    exporter.app = Celery(broker="amqp://")
+    monkeypatch.setattr(
+        exporter.app, "connection", lambda: fake_connection(transport="amqp")
+    )
+    fake_inspect(exporter.app)
+    exporter.track_queue_metrics()
+
+    def sample(name, queue="queue-4"):
+        return exporter.registry.get_sample_value(name, labels={"queue_name": queue})
+
+    assert sample("celery_queue_length") == 4
+    assert sample("celery_active_consumer_count") == 1
+    assert sample("celery_queue_messages_ready") == 4
+    assert sample("celery_queue_messages_unacknowledged") == 8
+    assert sample("celery_queue_message_bytes") == 400
+    assert sample("celery_queue_length", "missing") == 0
+    # a single page
+    assert len(ManagementAPI.requests) == 1
@@ -0,0 +1,99 @@
+import gzip
+
+import pytest
+
+from .exporter import Exporter
+from .recording import EventRecorder, read_events, record_events, replay
+from .test_batch import make_events, metric_samples
+
+
+@pytest.mark.parametrize("name", ["events.jsonl", "events.jsonl.gz"])
+def test_captures_round_trip(tmp_path, name):
+    events = make_events(20)
+    record_events(tmp_path / name, events[:40])
+    record_events(tmp_path / name, events[40:])
+
+    assert list(read_events(tmp_path / name)) == events
+
+
+def test_reads_captures_that_were_cut_short(tmp_path):
+    events = make_events(20)
+    record_events(tmp_path / "events.jsonl.gz", events)
+    data = (tmp_path / "events.jsonl.gz").read_bytes()
+    (tmp_path / "cut.jsonl.gz").write_bytes(data[: len(data) // 2])
+    lines = gzip.decompress(data).splitlines(keepends=True)
+    (tmp_path / "cut.jsonl").write_bytes(b"".join(lines[:10]) + lines[10][:5])
+
+    assert list(read_events(tmp_path / "cut.jsonl")) == events[:10]
+    replayed = list(read_events(tmp_path / "cut.jsonl.gz"))
+    assert replayed == events[: len(replayed)]
+
+
+def test_recorder_records_every_event_before_dispatching(tmp_path):
+    handled = []
+    recorder = EventRecorder(tmp_path / "events.jsonl")
+    handlers = recorder.wrap({"task-sent": handled.append})
+    events = make_events(2)
+    for event in events:
+        handlers["*"](event)
+    recorder.close()
+
+    assert handled == [event for event in events if event["type"] == "task-sent"]
+    assert list(read_events(tmp_path / "events.jsonl")) == events
+
+
+def test_recorder_flushes_periodically(tmp_path):
+    now = [0.0]
+    recorder = EventRecorder(tmp_path / "events.jsonl", clock=lambda: now[0])
+    events = make_events(2)
+    recorder.record(events[0])
+    assert not list(read_events(tmp_path / "events.jsonl"))
+    now[0] = 1.0
+    recorder.record(events[1])
+    assert list(read_events(tmp_path / "events.jsonl")) == events[:2]
+    recorder.close()
+
+
+@pytest.mark.parametrize(
+    "event_buffer_size,batch_events", [(0, False), (7, False), (7, True), (10000, True)]
+)
+def test_replay_matches_applying_the_events(event_buffer_size, batch_events):
+    events = make_events(50)
+    expected = Exporter()
+    for event in events:
+        expected.apply_event(dict(event))
+
+    exporter = Exporter(
+        event_buffer_size=event_buffer_size,
+        event_batch_size=30,
+        batch_events=batch_events,
+    )
+    assert replay(exporter, [dict(event) for event in events]) == len(events)
+
+    assert metric_samples(exporter.registry) == pytest.approx(
+        metric_samples(expected.registry)
+    )
+    if exporter.event_buffer is not None:
+        assert len(exporter.event_buffer) == 0
+
+
+def test_replay_paces_events_by_their_receive_time():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    events = [
+        {
+            "type": "worker-online",
+            "hostname": "celery@a",
+            "timestamp": received,
+            "local_received": received,
+        }
+        for received in (100.0, 101.0, 101.0, 105.0)
+    ]
+    replay(Exporter(), events, speed=2, clock=lambda: now[0], sleep=sleep)
+
+    assert sleeps == [0.5, 2.0]
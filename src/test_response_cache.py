@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+
+from . import response_cache
+from .exporter import Exporter
+from .response_cache import ResponseCache, choose_encoding
+
+
+def test_renders_again_once_the_version_changes_or_the_response_is_stale(clock):
+    version, renders = [0], []
+
+    def render():
+        renders.append(1)
+        return f"metrics {len(renders)}".encode()
+
+    cache = ResponseCache(5, lambda: version[0], clock)
+    assert cache.get("text", render).body == b"metrics 1"
+    assert cache.get("text", render).body == b"metrics 1"
+    # every format is cached on its own
+    assert cache.get("openmetrics", render).body == b"metrics 2"
+
+    version[0] += 1
+    assert cache.get("text", render).body == b"metrics 3"
+    clock.now += 5
+    assert cache.get("text", render).body == b"metrics 4"
+
+
+def test_drops_expired_responses(clock):
+    cache = ResponseCache(5, clock=clock)
+    for key in ("text", "openmetrics"):
+        cache.get(key, lambda: b"")
+    clock.now += 5
+    cache.get("text", lambda: b"")
+    assert list(cache._responses) == ["text"]  # pylint: disable=protected-access
+
+
+def test_drops_the_least_recently_used_responses(clock):
+    cache = ResponseCache(5, clock=clock, max_responses=2)
+    for key in ("text", "openmetrics", "text", "protobuf"):
+        cache.get(key, lambda: b"")
+    # pylint: disable=protected-access
+    assert list(cache._responses) == ["text", "protobuf"]
+
+
+def test_renders_every_time_without_a_max_age():
+    renders = []
+    cache = ResponseCache(0)
+    for _ in range(2):
+        cache.get("text", lambda: renders.append(1) or b"")
+    assert len(renders) == 2
+
+
+def test_compresses_a_response_once(mocker):
+    compress = mocker.spy(response_cache, "compress")
+    response = ResponseCache(5).get("text", lambda: b"celery_tasks_total 1\n" * 100)
+
+    for _ in range(2):
+        body = response.encoded("gzip")
+    assert gzip.decompress(body) == response.body
+    assert compress.call_count == 1
+    assert response.encoded(None) is response.body
+
+
+def test_prefers_zstd_when_available(monkeypatch):
+    if response_cache.zstandard is None:
+        pytest.skip("zstandard isn't installed")
+    assert choose_encoding("gzip, zstd") == "zstd"
+    monkeypatch.setattr(response_cache, "zstandard", None)
+    assert choose_encoding("gzip, zstd") == "gzip"
+    assert choose_encoding("zstd") is None
+
+
+def test_applying_events_bumps_the_generation():
+    exporter = Exporter()
+    generation = exporter.generation
+    exporter.apply_batch(
+        [{"type": "task-sent", "uuid": "1", "hostname": "celery@a", "timestamp": 1.0}]
+    )
+    assert exporter.generation > generation
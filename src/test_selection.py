@@ -0,0 +1,79 @@
+import pytest
+
+from .exporter import Exporter
+from .http_server import ScrapeStatus, SingleFlight, create_app
+from .selection import SelectedRegistry, UnknownGroup, select_collectors
+
+
+@pytest.fixture(name="exporter")
+def selection_exporter():
+    return Exporter(queue_length_by_priority=True)
+
+
+def family_names(registry):
+    return {family.name for family in registry.collect()}
+
+
+def test_selects_families_by_name_or_group(exporter):
+    registry, groups = exporter.registry, exporter.metric_groups
+    assert select_collectors(registry, [], [], groups) is None
+
+    selection = select_collectors(
+        registry, ["celery_task_sent_total", "celery_worker_up"], [], groups
+    )
+    assert family_names(SelectedRegistry(registry, selection)) == {
+        "celery_task_sent",
+        "celery_worker_up",
+    }
+
+    selection = select_collectors(registry, [], ["queues"], groups)
+    assert family_names(SelectedRegistry(registry, selection)) == {
+        "celery_queue_length",
+        "celery_queue_length_by_priority",
+        "celery_active_consumer_count",
+        "celery_active_worker_count",
+        "celery_active_process_count",
+    }
+
+    with pytest.raises(UnknownGroup):
+        select_collectors(registry, [], ["queue"], groups)
+
+
+def test_only_collects_the_selected_groups(exporter, mocker):
+    track_queue_metrics = mocker.patch.object(exporter, "track_queue_metrics")
+    track_timed_out_workers = mocker.patch.object(exporter, "track_timed_out_workers")
+    registry, groups = exporter.registry, exporter.metric_groups
+
+    exporter.scrape(select_collectors(registry, [], ["queues"], groups))
+    assert track_queue_metrics.call_count == 1
+    assert track_timed_out_workers.call_count == 0
+
+    exporter.scrape(select_collectors(registry, ["celery_task_sent"], [], groups))
+    assert track_queue_metrics.call_count == 1
+    assert track_timed_out_workers.call_count == 1
+
+    exporter.scrape()
+    assert track_queue_metrics.call_count == 2
+    assert track_timed_out_workers.call_count == 2
+
+
+def test_metrics_of_a_group(exporter, mocker):
+    mocker.patch.object(exporter, "track_queue_metrics")
+    client = create_app(
+        exporter.registry, None, exporter.scrape, metric_groups=exporter.metric_groups
+    ).test_client()
+
+    res = client.get("/metrics?group=queues&name[]=celery_worker_up")
+    assert res.status_code == 200
+    assert "# TYPE celery_queue_length gauge" in res.text
+    assert "# TYPE celery_worker_up gauge" in res.text
+    assert "celery_task_sent" not in res.text
+    assert client.get("/metrics?group=queue").status_code == 400
+
+
+def test_the_selection_is_passed_to_the_metrics_puller():
+    calls = []
+    scrape = SingleFlight(lambda *selection: calls.append(selection), ScrapeStatus())
+    scrape()
+    scrape(frozenset(["collector"]))
+    assert calls == [(), (frozenset(["collector"]),)]
@@ -0,0 +1,91 @@
+# pylint: disable=protected-access,no-member
+import pytest
+from prometheus_client import CollectorRegistry, Gauge
+
+from .series_index import count_label_values, index_by_labels, label_keys
+
+
+def test_indexes_series_however_they_are_created_and_removed():
+    gauge = Gauge("g", "g", ["queue_name", "hostname"], registry=CollectorRegistry())
+    gauge.labels(queue_name="celery", hostname="a").set(1)
+    index_by_labels(gauge)
+    gauge.labels(queue_name="a", hostname="b").set(1)
+    gauge.labels("other", "b").set(1)
+
+    assert label_keys(gauge, "hostname", "a") == [("celery", "a")]
+    assert sorted(label_keys(gauge, "hostname", "b")) == [("a", "b"), ("other", "b")]
+
+    gauge.remove("a", "b")
+    assert label_keys(gauge, "hostname", "b") == [("other", "b")]
+    gauge.remove("other", "b")
+    assert label_keys(gauge, "hostname", "b") == []
+
+
+def test_counts_series_per_label_value():
+    gauge = Gauge("g", "g", ["queue_name", "hostname"], registry=CollectorRegistry())
+    gauge.labels(queue_name="celery", hostname="a").set(1)
+    count_label_values(gauge)
+    gauge.labels("celery", "b").set(1)
+    gauge.labels("celery", "b").set(2)
+    gauge.labels("other", "b").set(1)
+
+    counts = gauge._metrics.label_counts
+    assert counts[0] == {"celery": 2, "other": 1}
+    assert counts[1] == {"a": 1, "b": 2}
+
+    gauge.remove("celery", "b")
+    assert counts[0] == {"celery": 1, "other": 1}
+    gauge.remove("celery", "a")
+    assert counts[1] == {"b": 1}
+    assert "celery" not in counts[0]
+
+
+def test_keeps_counting_through_every_way_of_removing_series():
+    gauge = Gauge("g", "g", ["queue_name", "hostname"], registry=CollectorRegistry())
+    index_by_labels(gauge)
+    for queue_name in ("celery", "other"):
+        for hostname in ("a", "b"):
+            gauge.labels(queue_name, hostname).set(1)
+
+    gauge.remove_by_labels({"hostname": "a"})
+    assert label_keys(gauge, "hostname", "a") == []
+    assert gauge._metrics.label_counts[0] == {"celery": 1, "other": 1}
+    gauge._metrics.pop(("celery", "b"))
+    gauge._metrics.popitem()
+    assert label_keys(gauge, "hostname", "b") == []
+    assert not gauge._metrics.label_counts[1]
+
+
+def test_indexes_the_series_again_once_cleared():
+    gauge = Gauge("g", "g", ["queue_name", "hostname"], registry=CollectorRegistry())
+    index_by_labels(gauge)
+    gauge.labels("celery", "a").set(1)
+    gauge.clear()
+    gauge.labels("other", "a").set(1)
+
+    assert label_keys(gauge, "hostname", "a") == [("other", "a")]
+    gauge.labels("celery", "a").set(1)
+    assert sorted(label_keys(gauge, "hostname", "a")) == [
+        ("celery", "a"),
+        ("other", "a"),
+    ]
+
+
+def test_only_replaces_children_kept_in_a_dict():
+    gauge = Gauge("g", "g", ["hostname"], registry=CollectorRegistry())
+    gauge._metrics = list(gauge._metrics)
+    with pytest.raises(TypeError):
+        index_by_labels(gauge)
+
+
+def test_indexes_several_labels():
+    gauge = Gauge("g", "g", ["name", "hostname"], registry=CollectorRegistry())
+    index_by_labels(gauge, ["hostname", "name"])
+    gauge.labels("task", "a").set(1)
+    gauge.labels("task", "b").set(1)
+
+    assert sorted(label_keys(gauge, "name", "task")) == [("task", "a"), ("task", "b")]
+    gauge.clear()
+    gauge.labels("task", "a").set(1)
+    assert label_keys(gauge, "hostname", "a") == [("task", "a")]
+    assert label_keys(gauge, "name", "task") == [("task", "a")]
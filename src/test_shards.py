@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from .exporter import Exporter
+from .shards import shard_of
+from .test_batch import make_events, metric_samples
+
+
+class ListQueue(list):
+    put = list.append
+
+
+def run_shards(events, shards):
+    """Consume the events in every shard, one after the other, returning
+    the main exporter that applied the batches of all of them."""
+    messages = ListQueue()
+    for shard in range(shards):
+        exporter = Exporter(shards=shards, event_buffer_size=10000)
+        exporter.become_shard(shard, messages)
+        for event in events:
+            exporter.ingest_event(dict(event))
+        while batch := exporter.event_buffer.drain(25, timeout=0):
+            exporter.apply_batch(batch)
+
+    main = Exporter(shards=shards, event_buffer_size=10000)
+    for message in messages:
+        main.apply_shard_batch(message)
+    return main
+
+
+def test_shard_of_is_stable_and_in_range():
+    uuids = [f"task-{i}" for i in range(1000)]
+    shards = [shard_of(uuid, 4) for uuid in uuids]
+
+    assert shards == [shard_of(uuid, 4) for uuid in uuids]
+    assert set(shards) == {0, 1, 2, 3}
+
+
+def test_sharding_requires_an_event_buffer():
+    with pytest.raises(ValueError):
+        Exporter(shards=2, event_buffer_size=0)
+
+
+def test_shards_add_up_to_a_single_exporter():
+    online = {
+        "type": "worker-online",
+        "hostname": "celery@worker-0",
+        "timestamp": time.time(),
+    }
+    events = [online] + make_events(60)
+
+    single = Exporter()
+    for event in events:
+        single.apply_event(dict(event))
+
+    main = run_shards(events, 3)
+
+    assert metric_samples(main.registry) == pytest.approx(
+        metric_samples(single.registry)
+    )
+    assert (
+        main.registry.get_sample_value(
+            "celery_worker_up", labels={"hostname": "worker-0"}
+        )
+        == 1.0
+    )
@@ -0,0 +1,206 @@
+import threading
+import time
+
+from .exporter import Exporter
+from .topology import DEFAULT_RECONCILE_SECONDS, MIN_REPLY_TIMEOUT, WorkerTopology
+
+WORKERS = {
+    "celery@a": {"processes": [1, 2], "queues": ["celery"]},
+    "celery@b": {"processes": [1], "queues": ["celery", "priority"]},
+}
+
+
+class FakeInspect:
+    # pylint: disable=too-many-arguments,too-many-positional-arguments
+    def __init__(self, app, timeout, limit, callback, destination):
+        self.app = app
+        self.timeout = timeout
+        self.limit = limit
+        self.callback = callback
+        self.destination = destination
+
+    def _replies(self, command, reply):
+        self.app.broadcasts.append(
+            (command, self.timeout, self.limit, self.destination)
+        )
+        with self.app.lock:
+            self.app.in_flight += 1
+            self.app.most_in_flight = max(self.app.most_in_flight, self.app.in_flight)
+        replies = {}
+        for worker, info in self.app.workers.items():
+            if self.destination is not None and worker not in self.destination:
+                continue
+            time.sleep(self.app.reply_seconds)
+            replies[worker] = reply(info)
+            self.callback({worker: replies[worker]})
+            if self.limit is not None and len(replies) >= self.limit:
+                break
+        time.sleep(0.01)
+        with self.app.lock:
+            self.app.in_flight -= 1
+        return replies
+
+    def stats(self):
+        return self._replies(
+            "stats", lambda info: {"pool": {"processes": info["processes"]}}
+        )
+
+    def active_queues(self):
+        return self._replies(
+            "active_queues", lambda info: [{"name": name} for name in info["queues"]]
+        )
+
+
+class FakeApp:  # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    def __init__(self, workers, reply_seconds=0.0):
+        self.workers = dict(workers)
+        self.reply_seconds = reply_seconds
+        self.broadcasts = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.most_in_flight = 0
+        self.control = self
+
+    def inspect(self, timeout, limit, callback, destination=None):
+        return FakeInspect(self, timeout, limit, callback, destination)
+
+
+def test_collects_the_concurrency_and_queues_of_the_workers():
+    app = FakeApp(WORKERS)
+    concurrency, queues = WorkerTopology().get(app)
+
+    assert concurrency == {"celery@a": 2, "celery@b": 1}
+    assert queues == {"celery@a": ["celery"], "celery@b": ["celery", "priority"]}
+    # both broadcasts are sent at once
+    assert app.most_in_flight == 2
+
+
+def test_is_cached_until_invalidated_or_stale():
+    clock = [0.0]
+    app = FakeApp(WORKERS)
+    topology = WorkerTopology(refresh_interval=60, clock=lambda: clock[0])
+
+    topology.get(app)
+    clock[0] += 30
+    topology.get(app)
+    assert len(app.broadcasts) == 2
+
+    topology.invalidate()
+    topology.get(app)
+    assert len(app.broadcasts) == 4
+
+    clock[0] += 60
+    topology.get(app)
+    assert len(app.broadcasts) == 6
+
+
+def test_waits_for_the_known_workers_and_adapts_the_timeout():
+    app = FakeApp(WORKERS, reply_seconds=0.01)
+    topology = WorkerTopology(timeout=2.0)
+
+    topology.get(app)
+    assert app.broadcasts[-1][1:] == (2.0, None, None)
+    assert MIN_REPLY_TIMEOUT <= topology.timeout < 2.0
+
+    topology.get(app)
+    assert app.broadcasts[-1][1:] == (topology.timeout, 2, None)
+
+
+def test_waits_the_full_timeout_after_a_worker_didnt_reply():
+    app = FakeApp(WORKERS)
+    topology = WorkerTopology(timeout=2.0)
+    topology.get(app)
+
+    del app.workers["celery@b"]
+    concurrency, _ = topology.get(app)
+    assert concurrency == {"celery@a": 2}
+
+    topology.get(app)
+    assert app.broadcasts[-1][1:] == (2.0, None, None)
+
+
+def test_worker_events_invalidate_the_topology():
+    exporter = Exporter()
+    exporter.worker_topology.get(FakeApp(WORKERS))
+
+    exporter.apply_event(
+        {"type": "worker-heartbeat", "hostname": "celery@new", "timestamp": 1.0}
+    )
+    assert exporter.worker_topology._full  # pylint: disable=protected-access
+    exporter.worker_topology.get(FakeApp(WORKERS))
+
+    exporter.apply_event(
+        {"type": "worker-heartbeat", "hostname": "celery@new", "timestamp": 2.0}
+    )
+    assert not exporter.worker_topology._full  # pylint: disable=protected-access
+
+    exporter.apply_event(
+        {"type": "worker-offline", "hostname": "celery@new", "timestamp": 3.0}
+    )
+    assert exporter.worker_topology._full  # pylint: disable=protected-access
+
+
+def test_follows_worker_events_without_broadcasting():
+    app = FakeApp(WORKERS)
+    topology = WorkerTopology(from_events=True)
+    topology.get(app)
+    assert len(app.broadcasts) == 2
+
+    topology.worker_offline("celery@b")
+    concurrency, queues = topology.get(app)
+    assert concurrency == {"celery@a": 2}
+    assert queues == {"celery@a": ["celery"]}
+    assert len(app.broadcasts) == 2
+
+    # only the worker coming online is inspected
+    app.workers["celery@c"] = {"processes": [1, 2, 3], "queues": ["priority"]}
+    topology.worker_online("celery@c")
+    concurrency, queues = topology.get(app)
+    assert concurrency == {"celery@a": 2, "celery@c": 3}
+    assert queues["celery@c"] == ["priority"]
+    assert [broadcast[2:] for broadcast in app.broadcasts[2:]] == [
+        (1, ["celery@c"]),
+        (1, ["celery@c"]),
+    ]
+
+
+def test_inspects_workers_first_seen_through_a_heartbeat_once():
+    app = FakeApp(WORKERS)
+    topology = WorkerTopology(from_events=True)
+    topology.get(app)
+
+    for _ in range(3):
+        topology.worker_seen("celery@a")
+        topology.worker_seen("celery@silent")
+        topology.get(app)
+    # celery@silent doesn't reply, and is left to the reconciliation
+    assert [broadcast[3] for broadcast in app.broadcasts[2:]] == [
+        ["celery@silent"],
+        ["celery@silent"],
+    ]
+
+
+def test_reconciles_with_a_full_broadcast():
+    clock = [0.0]
+    app = FakeApp(WORKERS)
+    topology = WorkerTopology(from_events=True, clock=lambda: clock[0])
+    topology.get(app)
+
+    app.workers["celery@c"] = {"processes": [1], "queues": ["celery"]}
+    clock[0] += 30
+    assert "celery@c" not in topology.get(app)[0]
+    clock[0] += DEFAULT_RECONCILE_SECONDS
+    assert "celery@c" in topology.get(app)[0]
+    assert app.broadcasts[-1][2:] == (None, None)
+
+
+def test_timed_out_workers_are_dropped_from_the_topology():
+    exporter = Exporter(worker_topology_from_events=True)
+    exporter.worker_topology.get(FakeApp(WORKERS))
+    exporter.apply_event(
+        {"type": "worker-heartbeat", "hostname": "celery@a", "timestamp": 1.0}
+    )
+
+    exporter.forget_worker("a")
+    concurrency, _ = exporter.worker_topology.get(FakeApp(WORKERS))
+    assert concurrency == {"celery@b": 1}
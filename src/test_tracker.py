@@ -0,0 +1,130 @@
+import time
+
+import pytest
+from celery.events.state import State  # type: ignore
+
+from .tracker import TaskTracker
+
+
+def make_event(event_type, uuid="task-1", **fields):
+    event = {
+        "type": event_type,
+        "uuid": uuid,
+        "hostname": "celery@worker-1",
+        "timestamp": 1_600_000_000.0,
+        "local_received": 1_600_000_000.0,
+        "clock": 1,
+    }
+    event.update(fields)
+    return event
+
+
+def test_tracks_the_fields_of_the_task_lifecycle():
+    tracker = TaskTracker()
+    tracker.task_event(
+        make_event(
+            "task-sent",
+            hostname="client@web-1",
+            name="app.add",
+            queue="math",
+            eta="2020-09-13T12:28:20+00:00",
+            timestamp=10.0,
+        )
+    )
+    tracker.task_event(make_event("task-received", name="app.add", timestamp=11.0))
+    tracker.task_event(make_event("task-started", timestamp=12.0))
+    task = tracker.task_event(
+        make_event("task-failed", exception="KeyError('a')", timestamp=13.0)
+    )
+
+    assert task.name == "app.add"
+    assert task.hostname == "celery@worker-1"
+    assert task.queue == "math"
+    assert task.eta == "2020-09-13T12:28:20+00:00"
+    assert (task.sent, task.started) == (10.0, 12.0)
+    assert task.exception == "KeyError('a')"
+    assert task.state == "FAILURE"
+
+
+@pytest.mark.parametrize(
+    "event_types",
+    [
+        pytest.param(["task-started", "task-received"], id="late-received"),
+        pytest.param(["task-succeeded", "task-sent"], id="late-sent"),
+        pytest.param(["task-retried", "task-sent", "task-started"], id="retry"),
+    ],
+)
+def test_merges_out_of_order_events_like_celery_state(event_types):
+    celery_state = State()
+    tracker = TaskTracker()
+
+    for i, event_type in enumerate(event_types):
+        event = make_event(
+            event_type,
+            hostname=f"celery@worker-{i}",
+            name=f"app.task_{i}",
+            queue=f"queue-{i}",
+            timestamp=float(i),
+        )
+        celery_state.event(dict(event))
+        task = tracker.task_event(dict(event))
+
+    expected = celery_state.tasks["task-1"]
+    assert (task.name, task.hostname, task.queue, task.state) == (
+        expected.name,
+        expected.hostname,
+        expected.queue,
+        expected.state,
+    )
+
+
+def test_evicts_the_least_recently_updated_task_over_capacity():
+    tracker = TaskTracker(max_tasks=2)
+    tracker.task_event(make_event("task-received", uuid="a"))
+    tracker.task_event(make_event("task-received", uuid="b"))
+    tracker.task_event(make_event("task-started", uuid="a"))
+    tracker.task_event(make_event("task-received", uuid="c"))
+
+    assert list(tracker.tasks) == ["a", "c"]
+
+
+def test_evicts_tasks_without_events_for_longer_than_the_ttl(clock):
+    tracker = TaskTracker(task_ttl_seconds=60, clock=clock)
+    tracker.task_event(make_event("task-received", uuid="a"))
+    clock.now += 30
+    tracker.task_event(make_event("task-received", uuid="b"))
+    clock.now += 31
+    tracker.task_event(make_event("task-received", uuid="c"))
+
+    assert list(tracker.tasks) == ["b", "c"]
+
+
+def test_worker_is_alive_until_its_heartbeat_expires():
+    tracker = TaskTracker()
+    worker = tracker.worker_event(
+        {
+            "type": "worker-heartbeat",
+            "hostname": "celery@worker-1",
+            "timestamp": time.time(),
+            "local_received": time.time(),
+            "freq": 2.0,
+            "active": 3,
+        }
+    )
+    assert worker.alive
+    assert worker.active == 3
+
+    worker = tracker.worker_event(
+        {
+            "type": "worker-heartbeat",
+            "hostname": "celery@worker-1",
+            "timestamp": time.time() - 5,
+            "local_received": time.time() - 5,
+        }
+    )
+    # an older heartbeat doesn't move the expiry back
+    assert worker.alive
+    assert worker.active == 3
+
+    worker.heartbeat = time.time() - 5
+    assert not worker.alive
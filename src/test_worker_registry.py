@@ -0,0 +1,73 @@
+from .worker_registry import PURGE, TIMEOUT, WorkerRegistry
+
+
+def run_due(registry, now):
+    """Act on due workers like the exporter does."""
+    actions = []
+    for action, worker in registry.due(now):
+        actions.append((action, worker.hostname))
+        if action == TIMEOUT:
+            worker.forgotten = True
+        else:
+            del registry[worker.hostname]
+    return actions
+
+
+def test_times_out_and_purges_workers_once_due():
+    registry = WorkerRegistry(timeout_seconds=10, purge_seconds=60)
+    registry.seen("a", 0)
+    registry.seen("b", 5)
+
+    assert not run_due(registry, 10)
+    assert run_due(registry, 12) == [(TIMEOUT, "a")]
+    assert run_due(registry, 16) == [(TIMEOUT, "b")]
+    assert not run_due(registry, 60)
+    assert run_due(registry, 70) == [(PURGE, "a"), (PURGE, "b")]
+    assert len(registry) == 0
+    assert not registry.deadlines
+
+
+def test_heartbeats_move_the_deadline_without_growing_the_heap():
+    registry = WorkerRegistry(timeout_seconds=10, purge_seconds=60)
+    for ts in range(0, 100, 2):
+        registry.seen("a", ts)
+        assert len(registry.deadlines) == 1
+        assert not run_due(registry, ts + 1)
+
+    assert run_due(registry, 109) == [(TIMEOUT, "a")]
+    # seen again after being forgotten
+    registry.seen("a", 110)
+    assert not registry["a"].forgotten
+    assert not run_due(registry, 119)
+    assert run_due(registry, 121) == [(TIMEOUT, "a")]
+    assert not run_due(registry, 169)
+    assert run_due(registry, 171) == [(PURGE, "a")]
+
+
+def test_without_timeout_workers_are_only_purged():
+    registry = WorkerRegistry(timeout_seconds=0, purge_seconds=60)
+    registry.seen("a", 0)
+
+    assert not run_due(registry, 30)
+    assert run_due(registry, 61) == [(PURGE, "a")]
+
+
+def test_purges_before_the_timeout_when_the_purge_delay_is_shorter():
+    registry = WorkerRegistry(timeout_seconds=300, purge_seconds=60)
+    registry.seen("a", 0)
+
+    assert not run_due(registry, 60)
+    assert run_due(registry, 61) == [(PURGE, "a")]
+    assert len(registry) == 0
+    assert not registry.deadlines
+
+
+def test_removed_workers_are_skipped():
+    registry = WorkerRegistry(timeout_seconds=10, purge_seconds=0)
+    registry.seen("a", 0)
+    del registry["a"]
+    registry.seen("a", 5)
+
+    assert not run_due(registry, 12)
+    assert run_due(registry, 16) == [(TIMEOUT, "a")]
+    assert not registry.deadlines
@@ -0,0 +1,195 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Set
+
+from celery.utils import nodesplit  # type: ignore
+
+# The reply wait is this many times the slowest reply of the last full refresh
+REPLY_TIMEOUT_FACTOR = 3
+MIN_REPLY_TIMEOUT = 0.1
+# How often the topology kept from events is reconciled with a broadcast, if
+# no interval is given
+DEFAULT_RECONCILE_SECONDS = 10 * 60
+
+
+class WorkerTopology:  # pylint: disable=too-many-instance-attributes
+    """The concurrency and the queues of every worker, from the stats and
+    active_queues inspect() broadcasts.
+
+    A broadcast waits for replies until its timeout, since it can't tell how
+    many workers will answer. The topology is refreshed at its own interval
+    rather than on every collection, with both broadcasts sent at once.
+    worker-online and worker-offline events invalidate it.
+
+    After a full refresh the workers that replied are known. The following
+    refreshes stop as soon as all of them replied, or after a few times the
+    slowest reply time seen. If a known worker doesn't reply in time, or the
+    topology was invalidated, the next refresh waits the full timeout again.
+
+    With from_events, worker events update the topology instead of
+    invalidating it: workers going offline or timing out are dropped, and
+    workers coming online, or first seen through a heartbeat, are inspected
+    on their own. Events carry neither the concurrency nor the queues of a
+    worker, so those still come from inspect(), but only for the workers that
+    changed. The refresh interval is then that of a full reconciliation, for
+    what events can't tell, like queues added to a running worker.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        refresh_interval: float = 0,
+        timeout: float = 1.0,
+        from_events: bool = False,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if from_events and refresh_interval <= 0:
+            refresh_interval = DEFAULT_RECONCILE_SECONDS
+        self.refresh_interval = refresh_interval
+        self.max_timeout = timeout
+        self.timeout = timeout
+        self.from_events = from_events
+        self.clock = clock
+        self.concurrency: Dict[str, int] = {}
+        self.queues: Dict[str, List[str]] = {}
+        self.refreshed_at: Optional[float] = None
+        self._full = True
+        # Changes from events, applied on the next get()
+        self._joined: Set[str] = set()
+        self._left: Set[str] = set()
+        self._left_hosts: Set[str] = set()
+        # Workers that didn't reply to being inspected on their own, left
+        # to the next full refresh
+        self._unreachable: Set[str] = set()
+        self._refresh_lock = Lock()
+        self._state_lock = Lock()
+
+    def invalidate(self):
+        with self._state_lock:
+            self._full = True
+
+    def worker_online(self, nodename):
+        with self._state_lock:
+            self._full = self._full or not self.from_events
+            self._left.discard(nodename)
+            self._joined.add(nodename)
+
+    def worker_seen(self, nodename):
+        """A heartbeat, which is how workers that came up before the
+        exporter, or whose worker-online event was missed, are found."""
+        if (
+            self.refreshed_at is not None
+            and nodename not in self.concurrency
+            and nodename not in self._unreachable
+        ):
+            self.worker_online(nodename)
+
+    def worker_offline(self, nodename):
+        if not self.from_events:
+            self.invalidate()
+            return
+        with self._state_lock:
+            self._joined.discard(nodename)
+            self._left.add(nodename)
+
+    def host_timed_out(self, hostname):
+        """The workers of a host stopped sending heartbeats."""
+        if self.from_events:
+            with self._state_lock:
+                self._left_hosts.add(hostname)
+
+    def get(self, app):
+        """The concurrency and the queue names of every worker, refreshed if
+        they are older than the refresh interval or were invalidated."""
+        with self._refresh_lock:
+            with self._state_lock:
+                full, self._full = self._full, False
+                joined, self._joined = self._joined, set()
+                left, self._left = self._left, set()
+                left_hosts, self._left_hosts = self._left_hosts, set()
+            if (
+                full
+                or self.refreshed_at is None
+                or self.clock() - self.refreshed_at >= self.refresh_interval
+            ):
+                # a reconciliation, or a refresh with new workers, waits for
+                # the workers that aren't known yet
+                self.refresh(app, full or self.from_events or bool(joined))
+                self._unreachable.update(joined - self.concurrency.keys())
+                return self.concurrency, self.queues
+
+            for nodename in list(self.concurrency.keys() | self.queues.keys()):
+                if nodename in left or nodesplit(nodename)[1] in left_hosts:
+                    self.concurrency.pop(nodename, None)
+                    self.queues.pop(nodename, None)
+            if joined:
+                self.inspect_workers(app, sorted(joined))
+            return self.concurrency, self.queues
+
+    def broadcast(self, app, command, timeout, limit, reply_times, destination=None):
+        # pylint: disable=too-many-arguments,too-many-positional-arguments
+        started = self.clock()
+
+        def on_reply(_reply):
+            reply_times.append(self.clock() - started)
+
+        kwargs = {"destination": destination} if destination else {}
+        inspect = app.control.inspect(
+            timeout=timeout, limit=limit, callback=on_reply, **kwargs
+        )
+        return getattr(inspect, command)() or {}
+
+    def collect(self, app, timeout, limit, destination=None):
+        """Send both broadcasts at once, returning their replies and the
+        times the replies took."""
+        reply_times: List[float] = []
+        with ThreadPoolExecutor(2, thread_name_prefix="inspect") as executor:
+            stats, active_queues = [
+                executor.submit(
+                    self.broadcast,
+                    app,
+                    command,
+                    timeout,
+                    limit,
+                    reply_times,
+                    destination,
+                )
+                for command in ("stats", "active_queues")
+            ]
+            stats, active_queues = stats.result(), active_queues.result()
+        concurrency = {
+            worker: len(worker_stats["pool"].get("processes", []))
+            for worker, worker_stats in stats.items()
+        }
+        queues = {
+            worker: [queue_info["name"] for queue_info in info_list]
+            for worker, info_list in active_queues.items()
+        }
+        return concurrency, queues, reply_times
+
+    def refresh(self, app, full=True):
+        timeout = self.max_timeout if full else self.timeout
+        limit = None if full else len(self.concurrency) or None
+        self.concurrency, self.queues, reply_times = self.collect(app, timeout, limit)
+        self.refreshed_at = self.clock()
+        self._unreachable.clear()
+
+        if limit is not None and min(len(self.concurrency), len(self.queues)) < limit:
+            # a known worker didn't reply in time, or went away
+            self.invalidate()
+        elif full and reply_times:
+            self.timeout = min(
+                self.max_timeout,
+                max(MIN_REPLY_TIMEOUT, max(reply_times) * REPLY_TIMEOUT_FACTOR),
+            )
+
+    def inspect_workers(self, app, nodenames):
+        """Inspect the given workers only, adding them to the topology."""
+        concurrency, queues, _ = self.collect(
+            app, self.max_timeout, len(nodenames), destination=nodenames
+        )
+        self.concurrency.update(concurrency)
+        self.queues.update(queues)
+        self._unreachable.update(
+            nodename for nodename in nodenames if nodename not in concurrency
+        )
@@ -0,0 +1,166 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from celery import states
+from celery.events.state import (  # type: ignore
+    HEARTBEAT_EXPIRE_WINDOW,
+    TASK_EVENT_TO_STATE,
+)
+
+# The only fields the exporter reads from a task. Everything else an event
+# carries (args, kwargs, result, traceback, ...) is dropped on the floor.
+TASK_FIELDS = ("name", "hostname", "queue", "eta", "runtime", "exception")
+
+# Mirrors celery.events.state.Task.merge_rules, restricted to TASK_FIELDS: an
+# out of order task-received only contributes the name and eta.
+MERGE_RULES = {states.RECEIVED: ("name", "eta")}
+
+
+class TaskRecord:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """The part of a task's state the exporter's metrics are computed from."""
+
+    __slots__ = (
+        "uuid",
+        "name",
+        "hostname",
+        "queue",
+        "state",
+        "sent",
+        "started",
+        "eta",
+        "runtime",
+        "exception",
+        "touched",
+    )
+
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.name = None
+        self.hostname = None
+        self.queue = None
+        self.state = states.PENDING
+        self.sent = None
+        self.started = None
+        self.eta = None
+        self.runtime = None
+        self.exception = None
+        self.touched = 0.0
+
+
+class WorkerRecord:  # pylint: disable=too-few-public-methods
+    """The part of a worker's state the heartbeat handler reads."""
+
+    __slots__ = ("hostname", "freq", "active", "heartbeat")
+
+    def __init__(self, hostname):
+        self.hostname = hostname
+        self.freq = 60
+        self.active = None
+        # local_received of the most recent heartbeat
+        self.heartbeat = None
+
+    @property
+    def alive(self):
+        if self.heartbeat is None:
+            return False
+        expires = self.heartbeat + float(self.freq) * HEARTBEAT_EXPIRE_WINDOW / 100
+        return time.time() < expires
+
+
+class TaskTracker:
+    """A bounded replacement for celery.events.state.State.
+
+    State keeps a full Task object for the last 10,000 tasks along with
+    per-worker heartbeat lists, task type indexes and an event heap - none of
+    which the exporter looks at. This keeps a slotted TaskRecord per in-flight
+    task instead, evicting the least recently updated one once max_tasks is
+    exceeded and, if task_ttl_seconds is set, any task that hasn't seen an
+    event for that long.
+
+    Events are merged the way State merges them, so that out of order events
+    produce the same labels.
+    """
+
+    def __init__(
+        self,
+        max_tasks: int = 10000,
+        task_ttl_seconds: float = 0,
+        max_workers: int = 5000,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_tasks = max_tasks
+        self.task_ttl_seconds = task_ttl_seconds
+        self.max_workers = max_workers
+        self.clock = clock
+        self.tasks: "OrderedDict[str, TaskRecord]" = OrderedDict()
+        self.workers: "OrderedDict[str, WorkerRecord]" = OrderedDict()
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def task_event(self, event) -> TaskRecord:
+        uuid = event["uuid"]
+        now = self.clock()
+        task = self.tasks.get(uuid)
+        if task is None:
+            task = self.tasks[uuid] = TaskRecord(uuid)
+        else:
+            self.tasks.move_to_end(uuid)
+        task.touched = now
+
+        subject = event["type"].partition("-")[2]
+        state = TASK_EVENT_TO_STATE.get(subject)
+        if state is None:
+            state = subject.upper()
+        elif subject == "sent":
+            task.sent = event["timestamp"]
+        elif subject == "started":
+            task.started = event["timestamp"]
+
+        # note that precedence is reversed, see celery.states.state.__lt__
+        fields: Tuple[str, ...] = TASK_FIELDS
+        if states.RETRY not in (state, task.state) and states.precedence(
+            state
+        ) > states.precedence(task.state):
+            # this event logically happened before the current state
+            fields = MERGE_RULES.get(state, TASK_FIELDS)
+        else:
+            task.state = state
+        for field in fields:
+            if field in event:
+                setattr(task, field, event[field])
+
+        self._evict(now)
+        return task
+
+    def worker_event(self, event) -> WorkerRecord:
+        hostname = event["hostname"]
+        worker = self.workers.get(hostname)
+        if worker is None:
+            worker = self.workers[hostname] = WorkerRecord(hostname)
+            if len(self.workers) > self.max_workers:
+                self.workers.popitem(last=False)
+        else:
+            self.workers.move_to_end(hostname)
+
+        if "freq" in event:
+            worker.freq = event["freq"]
+        if "active" in event:
+            worker.active = event["active"]
+        local_received: Optional[float] = event.get("local_received")
+        if local_received and event.get("timestamp"):
+            if worker.heartbeat is None or local_received > worker.heartbeat:
+                worker.heartbeat = local_received
+        return worker
+
+    def _evict(self, now):
+        tasks = self.tasks
+        while len(tasks) > self.max_tasks:
+            tasks.popitem(last=False)
+
+        if self.task_ttl_seconds > 0:
+            # tasks are ordered by their last event, so the stale ones are first
+            deadline = now - self.task_ttl_seconds
+            while tasks and next(iter(tasks.values())).touched < deadline:
+                tasks.popitem(last=False)
@@ -0,0 +1,111 @@
+import heapq
+import itertools
+from typing import Dict, Iterator, List, Tuple
+
+TIMEOUT = "timeout"
+PURGE = "purge"
+
+
+class LastSeen:  # pylint: disable=too-few-public-methods
+    """When a worker was last seen, whether its metrics were zeroed and the
+    deadline of its heap entry."""
+
+    __slots__ = ("hostname", "ts", "forgotten", "deadline")
+
+    def __init__(self, hostname, ts):
+        self.hostname = hostname
+        self.ts = ts
+        self.forgotten = False
+        self.deadline = None
+
+
+class WorkerRegistry:
+    """The workers the exporter has seen, with their timeout and purge
+    deadlines kept in a heap.
+
+    A heartbeat only moves the worker's last seen timestamp. Its heap entry
+    stays where it is, and once that entry comes up it is rescheduled at the
+    worker's actual next deadline. Only a worker coming back after being
+    forgotten, whose entry is at the later purge deadline, gets a new entry.
+    So the heap holds about one entry per worker, and finding the workers
+    that are due costs as much as the number of entries that came up rather
+    than the number of workers.
+    """
+
+    def __init__(self, timeout_seconds, purge_seconds):
+        self.timeout_seconds = timeout_seconds
+        self.purge_seconds = purge_seconds
+        self.workers: Dict[str, LastSeen] = {}
+        self.deadlines: List[Tuple[float, int, LastSeen]] = []
+        self._sequence = itertools.count()
+
+    def __contains__(self, hostname):
+        return hostname in self.workers
+
+    def __getitem__(self, hostname) -> LastSeen:
+        return self.workers[hostname]
+
+    def __delitem__(self, hostname):
+        # the heap entry is skipped once it comes up
+        del self.workers[hostname]
+
+    def __len__(self):
+        return len(self.workers)
+
+    def seen(self, hostname, ts) -> LastSeen:
+        worker = self.workers.get(hostname)
+        if worker is None:
+            worker = self.workers[hostname] = LastSeen(hostname, ts)
+        else:
+            worker.ts = ts
+            worker.forgotten = False
+        deadline = self._next_deadline(worker)
+        if worker.deadline is None or (
+            deadline is not None and deadline < worker.deadline
+        ):
+            self._schedule(worker)
+        return worker
+
+    def _next_deadline(self, worker):
+        """The earlier of the timeout and purge deadlines that still apply to
+        the worker, as the purge delay can be shorter than the timeout."""
+        deadlines = []
+        if not worker.forgotten and self.timeout_seconds > 0:
+            deadlines.append(worker.ts + self.timeout_seconds)
+        if self.purge_seconds > 0:
+            deadlines.append(worker.ts + self.purge_seconds)
+        return min(deadlines, default=None)
+
+    def _schedule(self, worker):
+        deadline = worker.deadline = self._next_deadline(worker)
+        if deadline is not None:
+            heapq.heappush(self.deadlines, (deadline, next(self._sequence), worker))
+
+    def due(self, now) -> Iterator[Tuple[str, LastSeen]]:
+        """Yield (TIMEOUT, worker) for the workers not seen for longer than the
+        timeout, and (PURGE, worker) for those not seen for longer than the
+        purge delay. The caller is expected to forget respectively purge them
+        before resuming the iteration."""
+        while self.deadlines and self.deadlines[0][0] < now:
+            deadline, _, worker = heapq.heappop(self.deadlines)
+            # skip the entries of removed workers and superseded entries
+            if (
+                self.workers.get(worker.hostname) is not worker
+                or worker.deadline != deadline
+            ):
+                continue
+            worker.deadline = None
+            if (
+                not worker.forgotten
+                and self.timeout_seconds > 0
+                and worker.ts + self.timeout_seconds < now
+            ):
+                yield TIMEOUT, worker
+            if (
+                self.workers.get(worker.hostname) is worker
+                and self.purge_seconds > 0
+                and worker.ts + self.purge_seconds < now
+            ):
+                yield PURGE, worker
+            if self.workers.get(worker.hostname) is worker and worker.deadline is None:
+                self._schedule(worker)